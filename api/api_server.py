@@ -1,18 +1,68 @@
+import argparse
+import asyncio
 import base64
+import cProfile
+import gzip
+import hashlib
+import hmac
+import io
 import json
+import math
+import os
+import secrets
+import signal
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from urllib.parse import urlparse
+from urllib.parse import parse_qs, unquote, urlparse
 
+import db
 from data_dsa import (
+    LATENCY_BUCKETS,
+    Histogram,
+    operation_last,
+    operation_seconds,
     store_lock,
-    transactions_list,
-    transactions_by_id,
+    all_transactions,
+    query_transactions,
+    transaction_fragments,
+    page_transactions,
+    iter_transactions,
+    parse_epoch_ms,
+    parse_search,
+    transaction_count,
+    store_version,
+    transaction_stats,
+    materialize_dashboard,
+    ROLLUP_DIMENSIONS,
+    use_store_backend,
     load_from_xml,
+    load_from_xml_streaming,
     load_from_json,
-    snapshot_to_json,
+    load_from_binary,
+    checkpoint_store,
+    add_transaction,
+    replace_transaction,
+    remove_transaction,
+    WALFailed,
+    open_mutation_log,
+    close_mutation_log,
+    replay_log,
+    ingest_xml_incremental,
+    open_dedup_index,
+    load_ingest_state,
+    save_ingest_state,
     normalize_transaction,
     dict_lookup_by_id,
-    benchmark_search,
+    reload_async,
+    reload_status,
+    watch_source,
+    configure_profiling,
+    write_profile,
+    profile_captures,
 )
 
 # --------------------
@@ -20,14 +70,60 @@ from data_dsa import (
 # --------------------
 XML_FILE = "modified_sms_v2 (1).xml"
 JSON_SNAPSHOT = "transactions_snapshot.json"
+BINARY_SNAPSHOT = "transactions_snapshot.bin"
+SNAPSHOT_FORMAT = "binary"  # binary (mmap'd, _raw decoded on first read) | json
+INGEST_STATE_FILE = "ingest_state.json"
+DEDUP_FILE = "dedup.idx"  # message keys ingested so far, across backups; None disables dedup
+DEDUP_BLOOM_CAPACITY = 0  # keys the Bloom filter in front of it is sized for; 0 = no Bloom filter
+WAL_FILE = "transactions.wal"
+WAL_FSYNC = "always"  # always | interval | never
+STORE_BACKEND = "dict"  # dict | compact (columnar, ~40% of the dict store's memory) | sqlite
+DB_FILE = "transactions.db"
 HOST, PORT = "127.0.0.1", 8000
+SERVER_MODES = ("serial", "threaded", "asyncio", "prefork")
+WORKER_THREADS = 16  # bounded request pool (threaded/asyncio, and per prefork process)
+PREFORK_PROCESSES = os.cpu_count() or 1
+KEEPALIVE_TIMEOUT = 15  # seconds an idle persistent connection is kept open
+READ_ONLY = False  # set in prefork mode: each process holds its own copy of the store
+PAGE_LIMIT_DEFAULT = 100
+PAGE_LIMIT_MAX = 1000
+STREAM_CHUNK_BYTES = 64 * 1024
+RESPONSE_CACHE_BYTES = 64 * 1024 * 1024
+GZIP_MIN_BYTES = 1024  # smaller bodies are sent as-is
+GZIP_LEVEL = 6
+DASHBOARD_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "data", "processed", "dashboard.json")
+DASHBOARD_INTERVAL_SEC = 60  # 0 disables the dashboard writer
+# Opt-in profiling, read from the environment so every prefork process picks
+# it up; POST /admin/profile changes it at runtime. Captures go to
+# data_dsa.PROFILE_DIR (--profile-dir).
+PROFILE_EVERY = int(os.environ.get("MOMO_PROFILE_EVERY") or 0)  # cProfile 1 in N requests; 0 = off
+TRACE_LOADS = os.environ.get("MOMO_TRACE_LOADS", "0") not in ("", "0")  # tracemalloc around loads and ingests
 
-# Users and roles
+# Users and roles. Passwords are kept as salted PBKDF2-SHA256 hashes (see
+# hash_password); the demo accounts are group4/member, alice/user123 and
+# bob/user123. USERS_FILE replaces them once a user has been changed through
+# /admin/users.
 USERS = {
-    "group4": {"password": "member", "role": "admin"},
-    "alice": {"password": "user123", "role": "user"},
-    "bob": {"password": "user123", "role": "user"},
+    "group4": {"password_hash": "pbkdf2_sha256$600000$vPvXM3uHAwFqWD/PperOgA==$C/ZfOLGd0jsQ6cDjlTterwFeKsGDEjs4STaLMwWpE54=",
+               "role": "admin"},
+    "alice": {"password_hash": "pbkdf2_sha256$600000$u0WCoW+vDfo7fIRjNsz6AQ==$j7ficxTFB91PVuout65Gh4gDff+Od2IscljV6GwOV0c=",
+              "role": "user"},
+    "bob": {"password_hash": "pbkdf2_sha256$600000$JRuxHZS9e0wFyeFygJlbpQ==$TqvWk05tobBTRXtBhQmmzddU0UjfSx+BatgfxnvSYs8=",
+            "role": "user"},
 }
+USERS_FILE = "users.json"
+ROLES = ("admin", "user")
+PBKDF2_ITERATIONS = 600_000  # ~0.3 s per check on one core; paid once per header thanks to auth_cache
+AUTH_CACHE_SIZE = 1024  # verified Authorization headers kept (LRU)
+AUTH_CACHE_TTL_SEC = 300  # a cached header is re-verified after this long
+TOKEN_TTL_SEC = 900  # lifetime of a bearer token from POST /auth/token
+TOKEN_MAX = 10_000  # live tokens kept; the oldest go first
+LOGIN_FAILURES_MAX = 5  # failed Basic logins per client address within the window before 429
+LOGIN_FAILURE_WINDOW_SEC = 60
+LOGIN_CLIENTS_MAX = 10_000  # client addresses tracked; the least recently seen go first
+# Checked for unknown users so they take as long to reject as a wrong password.
+_UNKNOWN_USER_HASH = "pbkdf2_sha256$600000$mFSMgKbetmq1GOkPcc9vZg==$brIClLYMzGo1/Sl8Rd+R/nBKE/IptzWtkyggWM9MC8c="
 
 # --------------------
 # Auth helpers and RBAC
@@ -42,21 +138,249 @@ def parse_basic_auth(header_val):
     except Exception:
         return None, None
 
+def hash_password(password, iterations=None, salt=None):
+    iterations = iterations or PBKDF2_ITERATIONS
+    salt = salt or os.urandom(16)
+    dk = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${base64.b64encode(salt).decode()}${base64.b64encode(dk).decode()}"
+
+def verify_password(password, encoded):
+    try:
+        scheme, iterations, salt, expected = encoded.split("$")
+        salt, expected, iterations = base64.b64decode(salt), base64.b64decode(expected), int(iterations)
+    except (ValueError, TypeError):
+        return False
+    dk = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return scheme == "pbkdf2_sha256" and hmac.compare_digest(dk, expected)
+
+def check_credentials(username, password):
+    user = USERS.get(username)
+    encoded = user.get("password_hash") if user else None
+    ok = verify_password(password, encoded or _UNKNOWN_USER_HASH)
+    return (username, user["role"]) if ok and encoded else (None, None)
+
+class AuthCache:
+    # Verified Authorization headers -> (username, role), so only the first
+    # request with a header pays the key derivation. Keyed by a SHA-256 of the
+    # header, so no password is held; LRU-bounded to max_entries, and an entry
+    # is re-verified `ttl` seconds after it was stored. Failed logins are not
+    # cached; a LoginThrottle passed to verify() caps how many each client
+    # may try. invalidate() drops a user's entries; the generation check keeps a
+    # verification that raced a credential change from storing the old result.
+    def __init__(self, max_entries=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL_SEC):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+    def verify(self, header, throttle=None, client=None):
+        key = hashlib.sha256(header.encode("utf-8")).digest()
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[1]
+            self.misses += 1
+            generation = self.generation
+        username, password = parse_basic_auth(header)
+        if username is None:
+            return None, None
+        if throttle is not None:
+            wait = throttle.admit(client)
+            if wait:
+                raise LoginThrottled(wait)
+            try:
+                username, role = check_credentials(username, password)
+            finally:
+                throttle.done(client, failed=not username)
+        else:
+            username, role = check_credentials(username, password)
+        if username:
+            with self.lock:
+                if generation == self.generation:
+                    self.entries[key] = (username, role, now + self.ttl)
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+        return username, role
+
+    def invalidate(self, username=None):
+        with self.lock:
+            self.generation += 1
+            if username is None:
+                self.entries.clear()
+                return
+            for key in [k for k, e in self.entries.items() if e[0] == username]:
+                del self.entries[key]
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "max_entries": self.max_entries, "ttl_sec": self.ttl,
+                    "hits": self.hits, "misses": self.misses}
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"retry after {retry_after:.1f} s")
+        self.retry_after = retry_after
+
+class LoginThrottle:
+    # Failed Basic logins per client address. Every uncached login costs a
+    # full key derivation on a request thread, so once a client has
+    # max_failures failures (or derivations in flight) within `window`
+    # seconds, its next uncached logins are refused without deriving until
+    # the oldest failure ages out. Cached headers and tokens are not counted.
+    def __init__(self, max_failures=LOGIN_FAILURES_MAX, window=LOGIN_FAILURE_WINDOW_SEC,
+                 max_clients=LOGIN_CLIENTS_MAX):
+        self.max_failures = max_failures
+        self.window = window
+        self.max_clients = max_clients
+        self.clients = OrderedDict()  # client -> [failure times (deque), derivations in flight]
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def admit(self, client):
+        # 0 if `client` may derive now (counted in flight until done()), else
+        # the seconds until it may try again.
+        now = time.monotonic()
+        with self.lock:
+            entry = self.clients.get(client)
+            if entry is None:
+                entry = self.clients[client] = [deque(maxlen=self.max_failures), 0]
+                while len(self.clients) > self.max_clients:
+                    self.clients.popitem(last=False)
+            self.clients.move_to_end(client)
+            times = entry[0]
+            while times and times[0] <= now - self.window:
+                times.popleft()
+            if len(times) + entry[1] >= self.max_failures:
+                self.throttled += 1
+                return times[0] + self.window - now if len(times) == self.max_failures else 1.0
+            entry[1] += 1
+            return 0
+
+    def done(self, client, failed):
+        with self.lock:
+            entry = self.clients.get(client)
+            if entry is None:  # evicted meanwhile
+                return
+            entry[1] -= 1
+            if failed:
+                entry[0].append(time.monotonic())
+            elif not entry[0] and not entry[1]:
+                del self.clients[client]
+
+    def stats(self):
+        with self.lock:
+            return {"clients": len(self.clients), "throttled": self.throttled,
+                    "max_failures": self.max_failures, "window_sec": self.window}
+
+class TokenStore:
+    # Short-lived bearer tokens: POST /auth/token trades a Basic login for a
+    # random token that is checked with one dict lookup. Tokens live in this
+    # process only (a restart signs everyone out) and are revoked with their
+    # user's credentials.
+    def __init__(self, ttl=TOKEN_TTL_SEC, max_tokens=TOKEN_MAX):
+        self.ttl = ttl
+        self.max_tokens = max_tokens
+        self.tokens = OrderedDict()  # token -> (username, role, expires), oldest first
+        self.lock = threading.Lock()
+
+    def issue(self, username, role):
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        with self.lock:
+            while self.tokens and (len(self.tokens) >= self.max_tokens or next(iter(self.tokens.values()))[2] <= now):
+                self.tokens.popitem(last=False)
+            self.tokens[token] = (username, role, now + self.ttl)
+        return token
+
+    def lookup(self, token):
+        with self.lock:
+            entry = self.tokens.get(token)
+            if entry is None:
+                return None, None
+            if entry[2] <= time.monotonic():
+                del self.tokens[token]
+                return None, None
+        return entry[0], entry[1]
+
+    def revoke(self, token):
+        with self.lock:
+            return self.tokens.pop(token, None) is not None
+
+    def revoke_user(self, username):
+        with self.lock:
+            for token in [t for t, e in self.tokens.items() if e[0] == username]:
+                del self.tokens[token]
+
+auth_cache = AuthCache()
+login_throttle = LoginThrottle()
+token_store = TokenStore()
+users_lock = threading.Lock()
+
 def authenticate(handler):
-    auth = handler.headers.get("Authorization")
-    username, password = parse_basic_auth(auth)
-    if username in USERS and USERS[username]["password"] == password:
-        return username, USERS[username]["role"]
-    return None, None
+    header = handler.headers.get("Authorization")
+    if not header:
+        return None, None
+    if header.startswith("Bearer "):
+        return token_store.lookup(header[7:].strip())
+    return auth_cache.verify(header, login_throttle, handler.client_address[0])
+
+def _credentials_changed(username):
+    auth_cache.invalidate(username)
+    token_store.revoke_user(username)
+
+def set_user(username, password=None, role=None):
+    # Creates or updates a user; whatever was verified with the old
+    # credentials (cached headers, tokens) stops working.
+    password_hash = hash_password(password) if password is not None else None
+    with users_lock:
+        if username not in USERS and not password_hash:
+            raise ValueError("a new user needs a password")
+        user = dict(USERS.get(username) or {})
+        if password_hash:
+            user["password_hash"] = password_hash
+        user["role"] = role or user.get("role") or "user"
+        USERS[username] = user
+    _credentials_changed(username)
+    return user
+
+def delete_user(username):
+    with users_lock:
+        found = USERS.pop(username, None) is not None
+    _credentials_changed(username)
+    return found
+
+def save_users(path=USERS_FILE):
+    with users_lock:
+        data = json.dumps(USERS, indent=2)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def load_users(path=USERS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    with users_lock:
+        USERS.clear()
+        USERS.update(data)
+    auth_cache.invalidate()
 
 def require_auth(handler):
-    username, role = authenticate(handler)
+    try:
+        username, role = authenticate(handler)
+    except LoginThrottled as e:
+        handler._send_json(429, {"error": "Too many failed logins"},
+                           headers={"Retry-After": str(math.ceil(e.retry_after))})
+        return None, None
     if not username:
-        handler.send_response(401)
-        handler.send_header("WWW-Authenticate", 'Basic realm="transactions"')
-        handler.send_header("Content-Type", "application/json")
-        handler.end_headers()
-        handler.wfile.write(json.dumps({"error": "Unauthorized"}).encode("utf-8"))
+        handler._send_json(401, {"error": "Unauthorized"},
+                           headers={"WWW-Authenticate": 'Basic realm="transactions"'})
         return None, None
     return username, role
 
@@ -70,17 +394,439 @@ def can_write(username, role, tx):
         return True
     return tx and tx.get("owner") == username
 
+# --------------------
+# Response encoding
+# --------------------
+def project(tx, fields):
+    if fields is None:
+        return tx
+    return {k: tx[k] for k in fields if k in tx}
+
+def join_fragments(frags):
+    # One copy into the response body: brackets go onto the first and last
+    # fragment (the list is ours; the store's cached bytes are untouched).
+    if not frags:
+        return b"[]"
+    frags[0] = b"[" + frags[0]
+    frags[-1] = frags[-1] + b"]"
+    return b", ".join(frags)
+
+def json_fragments(records, fields=None, next_cursor=None, paged=False, encoded=False):
+    # Encodes one record at a time so a response never exists as one string.
+    # With encoded=True the records are already JSON bytes from the store.
+    yield b'{"items": [' if paged else b"["
+    first = True
+    for tx in records:
+        if not first:
+            yield b","
+        first = False
+        yield tx if encoded else json.dumps(project(tx, fields), ensure_ascii=False).encode("utf-8")
+    if paged:
+        yield b'], "next_cursor": ' + json.dumps(next_cursor).encode("utf-8") + b"}"
+    else:
+        yield b"]"
+
+# --------------------
+# Response cache
+# --------------------
+class ResponseCache:
+    # Encoded GET bodies keyed by (principal, path, query) and valid for one
+    # store version: any mutation or reload bumps the version, which makes
+    # every entry stale at once. Entries are [key, version, body, gzip body],
+    # the gzip copy made on first demand; LRU eviction keeps the total under
+    # max_bytes.
+    def __init__(self, max_bytes=RESPONSE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, version, body):
+        entry = [key, version, body, None]
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= self._entry_size(old)
+            self.entries[key] = entry
+            self.size += len(body)
+            self._evict()
+        return entry
+
+    def add_gzip(self, entry, gz):
+        with self.lock:
+            if entry[3] is None and self.entries.get(entry[0]) is entry:
+                entry[3] = gz
+                self.size += len(gz)
+                self._evict()
+        return gz
+
+    def _entry_size(self, entry):
+        return len(entry[2]) + (len(entry[3]) if entry[3] is not None else 0)
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self.size -= self._entry_size(entry)
+
+response_cache = ResponseCache()
+
+# Store versions restart with the process (and the sqlite backend starts its
+# count from the row ids), so the same number can come back with other data.
+# ETags carry this per-boot id so a validator from an earlier run never
+# matches; prefork workers inherit it from the parent.
+BOOT_ID = os.urandom(4).hex()
+
+def make_etag(version, key):
+    # Weak (same for identity and gzip bodies); the key digest keeps one
+    # principal's validator from matching another's response for the same URL.
+    digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=6).hexdigest()
+    return f'W/"{BOOT_ID}-{version:x}-{digest}"'
+
+# --------------------
+# Metrics (GET /metrics, Prometheus text format)
+# --------------------
+# Requests are counted per (method, route, status); latency and response
+# bytes are kept per route. Routes are the fixed paths below plus templates
+# for ids and user names, so label sets stay bounded whatever clients send.
+# In prefork mode each process reports its own requests.
+ROUTES = frozenset(("/transactions", "/stats", "/health", "/metrics", "/admin/ingest",
+                    "/admin/reload", "/admin/profile", "/auth/token"))
+METHODS = frozenset(("GET", "POST", "PUT", "DELETE", "HEAD"))
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+QUANTILES = (0.5, 0.95, 0.99)
+STARTED_AT = time.time()
+
+def route_label(path):
+    parts = [p for p in (path or "").split("?", 1)[0].split("/") if p]
+    if len(parts) == 2 and parts[0] == "transactions":
+        return "/transactions/{id}"
+    if len(parts) == 3 and parts[:2] == ["admin", "users"]:
+        return "/admin/users/{name}"
+    route = "/" + "/".join(parts)
+    return route if route in ROUTES else "other"
+
+class HttpMetrics:
+    def __init__(self):
+        self.requests = {}  # (method, route, status) -> count
+        self.latency = {}  # route -> Histogram of seconds
+        self.bytes = {}  # route -> response body bytes sent
+        self.lock = threading.Lock()
+
+    def observe(self, method, path, status, seconds, nbytes):
+        route = route_label(path)
+        key = (method if method in METHODS else "OTHER", route, status)
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes[route] = self.bytes.get(route, 0) + nbytes
+            hist = self.latency.get(route)
+            if hist is None:
+                hist = self.latency[route] = Histogram(LATENCY_BUCKETS)
+            hist.add(seconds)
+
+http_metrics = HttpMetrics()
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_str(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_label_value(v)}"' for k, v in labels.items()) + "}"
+
+class _Exposition:
+    # Builds the text format: one HELP/TYPE header per family, then samples.
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name, kind, help_text):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name, value, **labels):
+        self.lines.append(f"{name}{_label_str(labels)} {value!r}" if isinstance(value, float)
+                          else f"{name}{_label_str(labels)} {value}")
+
+    def histogram(self, name, hist, **labels):
+        cumulative, total, count = hist.snapshot()
+        for bound, c in zip(hist.bounds + (float("inf"),), cumulative):
+            self.sample(f"{name}_bucket", c, **labels, le="+Inf" if bound == float("inf") else repr(bound))
+        self.sample(f"{name}_sum", total, **labels)
+        self.sample(f"{name}_count", count, **labels)
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+def render_metrics():
+    ex = _Exposition()
+    with http_metrics.lock:
+        requests = sorted(http_metrics.requests.items())
+        latency = sorted(http_metrics.latency.items())
+        sent = sorted(http_metrics.bytes.items())
+    ex.family("momo_http_requests_total", "counter", "HTTP requests served, by method, route and status.")
+    for (method, route, status), n in requests:
+        ex.sample("momo_http_requests_total", n, method=method, route=route, status=status)
+    ex.family("momo_http_request_duration_seconds", "histogram",
+              "Time from the parsed request line to the last byte handed to the socket.")
+    for route, hist in latency:
+        ex.histogram("momo_http_request_duration_seconds", hist, route=route)
+    ex.family("momo_http_request_duration_quantile_seconds", "gauge",
+              "p50/p95/p99 request latency estimated from the histogram buckets.")
+    for route, hist in latency:
+        for q in QUANTILES:
+            ex.sample("momo_http_request_duration_quantile_seconds", hist.quantile(q), route=route, quantile=q)
+    ex.family("momo_http_response_bytes_total", "counter", "Response body bytes sent (after gzip).")
+    for route, n in sent:
+        ex.sample("momo_http_response_bytes_total", n, route=route)
+
+    ex.family("momo_store_lock_wait_seconds", "histogram", "Time spent waiting to acquire store_lock.")
+    for mode, hist in store_lock.wait.items():
+        ex.histogram("momo_store_lock_wait_seconds", hist, mode=mode)
+    ex.family("momo_store_lock_hold_seconds", "histogram", "Time store_lock was held once acquired.")
+    for mode, hist in store_lock.hold.items():
+        ex.histogram("momo_store_lock_hold_seconds", hist, mode=mode)
+
+    ex.family("momo_store_records", "gauge", "Transactions in the store.")
+    ex.sample("momo_store_records", transaction_count(), store=STORE_BACKEND)
+    ex.family("momo_store_version", "gauge", "Store version; every write, load and reload bumps it.")
+    ex.sample("momo_store_version", store_version(), store=STORE_BACKEND)
+    ex.family("momo_operation_duration_seconds", "histogram", "Duration of loads, snapshots, reloads and ingests.")
+    for op, hist in sorted(operation_seconds.items()):
+        ex.histogram("momo_operation_duration_seconds", hist, op=op)
+    ex.family("momo_operation_last_duration_seconds", "gauge", "Duration of the latest run of each operation.")
+    for op, (sec, _) in sorted(operation_last.items()):
+        ex.sample("momo_operation_last_duration_seconds", sec, op=op)
+    ex.family("momo_operation_last_finished_timestamp_seconds", "gauge", "When the latest run of each operation ended.")
+    for op, (_, at) in sorted(operation_last.items()):
+        ex.sample("momo_operation_last_finished_timestamp_seconds", at, op=op)
+
+    with response_cache.lock:
+        cache = (len(response_cache.entries), response_cache.size, response_cache.hits, response_cache.misses)
+    ex.family("momo_response_cache_entries", "gauge", "Encoded responses cached.")
+    ex.sample("momo_response_cache_entries", cache[0])
+    ex.family("momo_response_cache_bytes", "gauge", "Bytes held by the response cache.")
+    ex.sample("momo_response_cache_bytes", cache[1])
+    ex.family("momo_response_cache_lookups_total", "counter", "Response cache lookups, by result.")
+    ex.sample("momo_response_cache_lookups_total", cache[2], result="hit")
+    ex.sample("momo_response_cache_lookups_total", cache[3], result="miss")
+    auth = auth_cache.stats()
+    ex.family("momo_auth_cache_lookups_total", "counter", "Authorization header cache lookups, by result.")
+    ex.sample("momo_auth_cache_lookups_total", auth["hits"], result="hit")
+    ex.sample("momo_auth_cache_lookups_total", auth["misses"], result="miss")
+    ex.family("momo_login_throttled_total", "counter", "Uncached logins refused (429) after repeated failures.")
+    ex.sample("momo_login_throttled_total", login_throttle.stats()["throttled"])
+    if STORE_BACKEND == "sqlite":
+        pool = db.pool_metrics()
+        ex.family("momo_db_pool_connections", "gauge", "SQLite pool connections, by state.")
+        for state in ("open", "idle", "in_use"):
+            ex.sample("momo_db_pool_connections", pool[state], state=state)
+        ex.family("momo_db_pool_checkouts_total", "counter", "Connections handed out by the pool.")
+        ex.sample("momo_db_pool_checkouts_total", pool["checkouts"])
+        ex.family("momo_db_pool_waits_total", "counter", "Checkouts that had to wait for a free connection.")
+        ex.sample("momo_db_pool_waits_total", pool["waited"])
+        ex.family("momo_db_pool_wait_seconds_total", "counter", "Total time checkouts spent waiting.")
+        ex.sample("momo_db_pool_wait_seconds_total", pool["wait_ms_total"] / 1000)
+    ex.family("momo_process_start_time_seconds", "gauge", "Unix time the server process started.")
+    ex.sample("momo_process_start_time_seconds", STARTED_AT)
+    return ex.text()
+
+# --------------------
+# Profiling (sampled requests, GET/POST /admin/profile)
+# --------------------
+class RequestProfiler:
+    # Runs 1 in `every` requests under cProfile and writes each through
+    # data_dsa.write_profile, labelled with the method and route. One request
+    # is profiled at a time; a sample that comes due meanwhile is skipped.
+    def __init__(self, every=0):
+        self.every = every
+        self.seen = self.sampled = self.skipped = 0
+        self.lock = threading.Lock()
+        self.busy = threading.Lock()
+
+    def start(self):
+        every = self.every
+        if not every:
+            return None
+        with self.lock:
+            self.seen += 1
+            if self.seen % every:
+                return None
+            if not self.busy.acquire(blocking=False):
+                self.skipped += 1
+                return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def finish(self, profile, method, path, status, seconds):
+        profile.disable()
+        self.busy.release()
+        try:
+            write_profile(profile, f"{method} {route_label(path)}", status=status, request_sec=seconds)
+        except OSError:
+            return
+        with self.lock:
+            self.sampled += 1
+
+    def stats(self):
+        with self.lock:
+            return {"every": self.every, "seen": self.seen, "sampled": self.sampled, "skipped": self.skipped}
+
+request_profiler = RequestProfiler(PROFILE_EVERY)
+
+def profiling_status(recent=20):
+    return {"requests": request_profiler.stats(), **configure_profiling(),
+            "captures": profile_captures[-recent:]}
+
 # --------------------
 # HTTP handler
 # --------------------
 class Handler(BaseHTTPRequestHandler):
-    def _send_json(self, code, payload):
-        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    # HTTP/1.1: persistent connections and chunked transfer. Idle connections
+    # are dropped after KEEPALIVE_TIMEOUT.
+    # Writes are buffered per response and Nagle is off, so headers and body
+    # leave in one segment instead of waiting on the client's delayed ACK.
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    keep_alive = True
+    _cache_slot = None  # (key, version, etag) when the pending 200 should be cached
+    _started = None  # perf_counter when the request line was parsed
+    _status = None
+    _bytes_out = 0
+
+    def handle_one_request(self):
+        # Timed from parse_request, so waiting on an idle kept-alive connection
+        # does not count as latency (nor is it profiled).
+        self._started = self._profile = None
+        try:
+            super().handle_one_request()
+        finally:
+            seconds = time.perf_counter() - self._started if self._started is not None else 0.0
+            if self._profile is not None:
+                request_profiler.finish(self._profile, self.command, getattr(self, "path", ""),
+                                        self._status, seconds)
+        if self._started is not None and self._status is not None:
+            http_metrics.observe(self.command, getattr(self, "path", ""), self._status, seconds, self._bytes_out)
+
+    def parse_request(self):
+        self._started = time.perf_counter()
+        self._status, self._bytes_out = None, 0
+        self._profile = request_profiler.start()
+        return super().parse_request()
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def end_headers(self):
+        if not self.keep_alive:
+            self.send_header("Connection", "close")
+        super().end_headers()
+
+    def _read_body(self):
+        # Always drain the body first so a rejected request cannot leave bytes
+        # behind on a kept-alive connection.
+        length = int(self.headers.get("Content-Length", "0") or 0)
+        return self.rfile.read(length) if length > 0 else b""
+
+    def _refuse_read_only(self):
+        if READ_ONLY:
+            self._send_json(503, {"error": "Read-only replica (prefork mode)"})
+        return READ_ONLY
+
+    def _refuse_tokens(self):
+        # Tokens live in one process's memory and prefork children (the only
+        # read-only mode) would not recognise each other's, so say so instead
+        # of a 503 that suggests retrying.
+        if READ_ONLY:
+            self._send_json(501, {"error": "Bearer tokens are not available in prefork mode"})
+        return READ_ONLY
+
+    def _accepts_gzip(self):
+        return "gzip" in self.headers.get("Accept-Encoding", "")
+
+    def _send_json(self, code, payload, headers=None):
+        body = None if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send_encoded(code, body, headers)
+
+    def _send_encoded(self, code, body, headers=None):
+        slot, self._cache_slot = self._cache_slot, None
+        if slot is not None and code == 200:
+            key, version, etag = slot
+            self._send_entry(response_cache.put(key, version, body), etag)
+            return
+        self._send_body(code, body, headers)
+
+    def _send_entry(self, entry, etag):
+        body, gz = entry[2], None
+        if len(body) >= GZIP_MIN_BYTES and self._accepts_gzip():
+            gz = entry[3] or response_cache.add_gzip(entry, gzip.compress(body, GZIP_LEVEL))
+        self._send_body(200, body, {"ETag": etag}, gz)
+
+    def _send_body(self, code, body, headers=None, gz=None, content_type="application/json"):
+        # body None means no content (204/304 and friends).
+        self.send_response(code)
+        if body is not None:
+            if gz is None and len(body) >= GZIP_MIN_BYTES and self._accepts_gzip():
+                gz = gzip.compress(body, GZIP_LEVEL)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Vary", "Accept-Encoding")
+            if gz is not None:
+                self.send_header("Content-Encoding", "gzip")
+                body = gz
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        if body is not None or code not in (204, 304):
+            self.send_header("Content-Length", str(len(body or b"")))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+            self._bytes_out += len(body)
+
+    def _send_chunked(self, code, fragments):
         self.send_response(code)
         self.send_header("Content-Type", "application/json")
-        self.send_header("Content-Length", str(len(body)))
+        if self.request_version != "HTTP/1.1":
+            # HTTP/1.0 clients get the raw stream, delimited by closing the connection.
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            for frag in fragments:
+                self.wfile.write(frag)
+                self._bytes_out += len(frag)
+            return
+        self.send_header("Transfer-Encoding", "chunked")
         self.end_headers()
-        self.wfile.write(body)
+        buf, size = [], 0
+        for frag in fragments:
+            buf.append(frag)
+            size += len(frag)
+            if size >= STREAM_CHUNK_BYTES:
+                self.wfile.writelines([b"%x\r\n" % size, *buf, b"\r\n"])
+                self._bytes_out += size
+                buf, size = [], 0
+        if size:
+            self.wfile.writelines([b"%x\r\n" % size, *buf, b"\r\n"])
+            self._bytes_out += size
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _parse_user(self, path):
+        parts = [p for p in path.split("/") if p]
+        if len(parts) == 3 and parts[:2] == ["admin", "users"]:
+            return unquote(parts[2])
+        return None
 
     def _parse_id(self, path):
         parts = [p for p in path.split("/") if p]
@@ -89,17 +835,117 @@ class Handler(BaseHTTPRequestHandler):
         return None
 
     def do_GET(self):
+        if self.path == "/health":
+            # Unauthenticated liveness/readiness probe.
+            status = {"ok": True, "store": STORE_BACKEND}
+            if STORE_BACKEND == "sqlite":
+                status.update(db.health())
+            if status["ok"]:
+                status["records"] = transaction_count()
+            self._send_json(200 if status["ok"] else 503, status)
+            return
         username, role = require_auth(self)
         if not username:
             return
         parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        stream = query.get("stream", ["0"])[0] in ("1", "true")
+        self._cache_slot = None
+        if (parsed.path in ("/transactions", "/stats") and not stream) or self._parse_id(parsed.path):
+            # Polling the same URL costs a version check: 304 if the client's
+            # ETag is current, else the cached encoded body for this version.
+            key = ("*" if role == "admin" else username, parsed.path, parsed.query)
+            version = store_version()
+            etag = make_etag(version, key)
+            match = self.headers.get("If-None-Match", "")
+            if match.strip() == "*" or etag in (t.strip() for t in match.split(",")):
+                self._send_body(304, None, {"ETag": etag})
+                return
+            entry = response_cache.get(key, version)
+            if entry is not None:
+                self._send_entry(entry, etag)
+                return
+            self._cache_slot = (key, version, etag)
         if parsed.path == "/transactions":
-            with store_lock:
-                if role == "admin":
-                    data = transactions_list[:]
+            owner = query.get("owner", [None])[0]
+            type_ = query.get("type", [None])[0]
+            start = end = None
+            if "from" in query or "to" in query:
+                start = parse_epoch_ms(query.get("from", [""])[0])
+                end = parse_epoch_ms(query.get("to", [""])[0], end_of_day=True)
+                if (start is None and "from" in query) or (end is None and "to" in query):
+                    self._send_json(400, {"error": "from/to must be epoch ms or ISO dates"})
+                    return
+            if role != "admin":
+                if owner is not None and owner != username:
+                    self._send_json(403, {"error": "Forbidden"})
+                    return
+                owner = username
+            q = query.get("q", [None])[0]
+            if q is not None:
+                if STORE_BACKEND == "sqlite":
+                    self._send_json(501, {"error": "Search is not available with the sqlite store"})
+                    return
+                try:
+                    parse_search(q)
+                except ValueError as e:
+                    self._send_json(400, {"error": str(e)})
+                    return
+            fields = query.get("fields", [None])[0]
+            fields = [f for f in fields.split(",") if f] if fields is not None else None
+            if "limit" in query or "cursor" in query:
+                try:
+                    limit = int(query.get("limit", [PAGE_LIMIT_DEFAULT])[0])
+                except ValueError:
+                    limit = 0
+                if not 1 <= limit <= PAGE_LIMIT_MAX:
+                    self._send_json(400, {"error": f"limit must be 1..{PAGE_LIMIT_MAX}"})
+                    return
+                try:
+                    data, next_cursor = page_transactions(owner=owner, type_=type_, start=start, end=end, q=q,
+                                                          limit=limit, cursor=query.get("cursor", [None])[0])
+                except ValueError as e:
+                    self._send_json(400, {"error": str(e)})
+                    return
+                if stream:
+                    self._send_chunked(200, json_fragments(data, fields, next_cursor, paged=True))
                 else:
-                    data = [tx for tx in transactions_list if can_read(username, role, tx)]
-            self._send_json(200, data)
+                    self._send_json(200, {"items": [project(tx, fields) for tx in data],
+                                          "next_cursor": next_cursor})
+                return
+            if fields is None:
+                # Whole records: assembled from the store's cached per-record JSON.
+                frags = transaction_fragments(owner=owner, type_=type_, start=start, end=end, q=q)
+                if stream:
+                    self._send_chunked(200, json_fragments(frags, encoded=True))
+                else:
+                    self._send_encoded(200, join_fragments(frags))
+                return
+            if stream:
+                self._send_chunked(200, json_fragments(
+                    iter_transactions(owner=owner, type_=type_, start=start, end=end, q=q), fields))
+                return
+            if owner is None and type_ is None and start is None and end is None and q is None:
+                data = all_transactions()
+            else:
+                data = query_transactions(owner=owner, type_=type_, start=start, end=end, q=q)
+            self._send_json(200, [project(tx, fields) for tx in data])
+            return
+        if parsed.path == "/stats":
+            # Served from the rollup counters; non-admins see only their own records.
+            owner = query.get("owner", [None])[0]
+            if role != "admin":
+                if owner is not None and owner != username:
+                    self._send_json(403, {"error": "Forbidden"})
+                    return
+                owner = username
+            dims = query.get("dim", [None])[0]
+            dims = tuple(d for d in dims.split(",") if d) if dims is not None else ROLLUP_DIMENSIONS
+            unknown = [d for d in dims if d not in ROLLUP_DIMENSIONS]
+            if unknown:
+                self._send_json(400, {"error": f"unknown dim {unknown[0]!r}; expected {','.join(ROLLUP_DIMENSIONS)}"})
+                return
+            self._send_json(200, transaction_stats(owner=owner, dims=dims))
             return
         tx_id = self._parse_id(parsed.path)
         if tx_id:
@@ -112,59 +958,149 @@ class Handler(BaseHTTPRequestHandler):
                 return
             self._send_json(200, tx)
             return
-        if parsed.path == "/dsa/benchmark":
-            with store_lock:
-                sample_ids = [tx["id"] for tx in transactions_list[:20]] or [tx["id"] for tx in transactions_list]
-            result = benchmark_search(sample_ids, repeats=500)
-            self._send_json(200, {"sample_count": len(sample_ids), **result})
+        if parsed.path == "/admin/reload":
+            if role != "admin":
+                self._send_json(403, {"error": "Forbidden"})
+                return
+            self._send_json(200, reload_status)
+            return
+        if parsed.path == "/admin/profile":
+            if role != "admin":
+                self._send_json(403, {"error": "Forbidden"})
+                return
+            self._send_json(200, profiling_status())
+            return
+        if parsed.path == "/metrics":
+            if role != "admin":
+                self._send_json(403, {"error": "Forbidden"})
+                return
+            self._send_body(200, render_metrics().encode("utf-8"), content_type=METRICS_CONTENT_TYPE)
             return
         self._send_json(404, {"error": "Not found"})
 
     def do_POST(self):
+        body = self._read_body()
         username, role = require_auth(self)
         if not username:
             return
         parsed = urlparse(self.path)
+        if parsed.path == "/auth/token":
+            if self._refuse_tokens():
+                return
+            # Minted from Basic credentials only, so a token cannot extend itself.
+            if self.headers.get("Authorization", "").startswith("Bearer "):
+                self._send_json(400, {"error": "Use Basic credentials to get a token"})
+                return
+            token = token_store.issue(username, role)
+            self._send_json(200, {"token": token, "token_type": "Bearer", "expires_in": token_store.ttl})
+            return
+        if self._refuse_read_only():
+            return
         if parsed.path == "/transactions":
-            length = int(self.headers.get("Content-Length", "0"))
             try:
-                payload = json.loads(self.rfile.read(length) or b"{}")
+                payload = json.loads(body or b"{}")
             except json.JSONDecodeError:
                 self._send_json(400, {"error": "Invalid JSON"})
                 return
             tx = normalize_transaction(payload)
             if role != "admin":
                 tx["owner"] = username
-            with store_lock:
-                if tx["id"] in transactions_by_id:
-                    self._send_json(409, {"error": "ID already exists"})
-                    return
-                transactions_by_id[tx["id"]] = tx
-                transactions_list.append(tx)
-            snapshot_to_json(JSON_SNAPSHOT)
+            try:
+                added = add_transaction(tx)
+            except WALFailed:
+                self._send_json(500, {"error": "Write could not be logged"})
+                return
+            if not added:
+                self._send_json(409, {"error": "ID already exists"})
+                return
             self._send_json(201, tx)
             return
+        if parsed.path == "/admin/ingest":
+            if role != "admin":
+                self._send_json(403, {"error": "Forbidden"})
+                return
+            if STORE_BACKEND == "sqlite":
+                self._send_json(501, {"error": "Not available with the sqlite store"})
+                return
+            try:
+                payload = json.loads(body or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"error": "Invalid JSON"})
+                return
+            xml_path = payload.get("path") or XML_FILE
+            if not os.path.isfile(xml_path):
+                self._send_json(400, {"error": "XML file not found"})
+                return
+            stats = ingest_xml_incremental(xml_path)
+            if stats["appended"]:
+                checkpoint_store(snapshot_file())
+            save_ingest_state(INGEST_STATE_FILE)
+            self._send_json(200, stats)
+            return
+        if parsed.path == "/admin/reload":
+            if role != "admin":
+                self._send_json(403, {"error": "Forbidden"})
+                return
+            if STORE_BACKEND == "sqlite":
+                self._send_json(501, {"error": "Not available with the sqlite store"})
+                return
+            try:
+                payload = json.loads(body or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"error": "Invalid JSON"})
+                return
+            path = payload.get("path") or XML_FILE
+            if not os.path.isfile(path):
+                self._send_json(400, {"error": "Source file not found"})
+                return
+            if not start_reload(path):
+                self._send_json(409, {"error": "Reload already running"})
+                return
+            self._send_json(202, {"status": "reloading", "source": path})
+            return
+        if parsed.path == "/admin/profile":
+            if role != "admin":
+                self._send_json(403, {"error": "Forbidden"})
+                return
+            try:
+                payload = json.loads(body or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"error": "Invalid JSON"})
+                return
+            every, trace = payload.get("every"), payload.get("trace_loads")
+            if (every is not None and (type(every) is not int or every < 0)) or \
+                    (trace is not None and not isinstance(trace, bool)):
+                self._send_json(400, {"error": "every must be an integer >= 0, trace_loads a boolean"})
+                return
+            if every is not None:
+                request_profiler.every = every
+            configure_profiling(trace_allocations=trace)
+            self._send_json(200, profiling_status())
+            return
         self._send_json(404, {"error": "Not found"})
 
     def do_PUT(self):
+        body = self._read_body()
         username, role = require_auth(self)
-        if not username:
+        if not username or self._refuse_read_only():
+            return
+        name = self._parse_user(urlparse(self.path).path)
+        if name:
+            self._put_user(name, role, body)
             return
         tx_id = self._parse_id(urlparse(self.path).path)
         if not tx_id:
             self._send_json(404, {"error": "Not found"})
             return
-        with store_lock:
-            existing = transactions_by_id.get(tx_id)
+        existing = dict_lookup_by_id(tx_id)
         if not existing:
             self._send_json(404, {"error": "Not found"})
             return
         if not can_write(username, role, existing):
             self._send_json(403, {"error": "Forbidden"})
             return
-        length = int(self.headers.get("Content-Length", "0"))
         try:
-            payload = json.loads(self.rfile.read(length) or b"{}")
+            payload = json.loads(body or b"{}")
         except json.JSONDecodeError:
             self._send_json(400, {"error": "Invalid JSON"})
             return
@@ -172,53 +1108,358 @@ class Handler(BaseHTTPRequestHandler):
         if role != "admin":
             payload["owner"] = existing["owner"]
         updated = normalize_transaction({**existing, **payload})
-        with store_lock:
-            transactions_by_id[tx_id] = updated
-            for i, tx in enumerate(transactions_list):
-                if tx["id"] == tx_id:
-                    transactions_list[i] = updated
-                    break
-        snapshot_to_json(JSON_SNAPSHOT)
+        try:
+            replaced = replace_transaction(updated)
+        except WALFailed:
+            self._send_json(500, {"error": "Write could not be logged"})
+            return
+        if not replaced:
+            self._send_json(404, {"error": "Not found"})
+            return
         self._send_json(200, updated)
 
     def do_DELETE(self):
+        self._read_body()
         username, role = require_auth(self)
         if not username:
             return
-        tx_id = self._parse_id(urlparse(self.path).path)
+        path = urlparse(self.path).path
+        if path == "/auth/token":
+            if self._refuse_tokens():
+                return
+            header = self.headers.get("Authorization", "")
+            if not header.startswith("Bearer "):
+                self._send_json(400, {"error": "Send the token to revoke as the Bearer credential"})
+                return
+            token_store.revoke(header[7:].strip())
+            self._send_json(204, None)
+            return
+        if self._refuse_read_only():
+            return
+        name = self._parse_user(path)
+        if name:
+            if role != "admin":
+                self._send_json(403, {"error": "Forbidden"})
+            elif not delete_user(name):
+                self._send_json(404, {"error": "Not found"})
+            else:
+                save_users(USERS_FILE)
+                self._send_json(204, None)
+            return
+        tx_id = self._parse_id(path)
         if not tx_id:
             self._send_json(404, {"error": "Not found"})
             return
-        with store_lock:
-            existing = transactions_by_id.get(tx_id)
-            if not existing:
-                self._send_json(404, {"error": "Not found"})
-                return
-            if not can_write(username, role, existing):
-                self._send_json(403, {"error": "Forbidden"})
-                return
-            del transactions_by_id[tx_id]
-            for i, tx in enumerate(transactions_list):
-                if tx["id"] == tx_id:
-                    transactions_list.pop(i)
-                    break
-        snapshot_to_json(JSON_SNAPSHOT)
-        self._send_json(204, {"status": "deleted"})
+        existing = dict_lookup_by_id(tx_id)
+        if not existing:
+            self._send_json(404, {"error": "Not found"})
+            return
+        if not can_write(username, role, existing):
+            self._send_json(403, {"error": "Forbidden"})
+            return
+        try:
+            removed = remove_transaction(tx_id)
+        except WALFailed:
+            self._send_json(500, {"error": "Write could not be logged"})
+            return
+        if not removed:
+            self._send_json(404, {"error": "Not found"})
+            return
+        self._send_json(204, None)
+
+    def _put_user(self, name, role, body):
+        if role != "admin":
+            self._send_json(403, {"error": "Forbidden"})
+            return
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": "Invalid JSON"})
+            return
+        password, new_role = payload.get("password"), payload.get("role")
+        bad_password = password is not None and (not isinstance(password, str) or not password)
+        if bad_password or (new_role is not None and new_role not in ROLES):
+            self._send_json(400, {"error": f"password must be a non-empty string, role one of {list(ROLES)}"})
+            return
+        created = name not in USERS
+        try:
+            user = set_user(name, password, new_role)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        save_users(USERS_FILE)
+        self._send_json(201 if created else 200, {"username": name, "role": user["role"]})
 
     def log_message(self, format, *args):
         return
 
-def main():
-    # Choose one source of truth to load from on startup:
-    # Option A: XML (your current file)
-    load_from_xml(XML_FILE)
-    # Option B: JSON snapshot
-    # load_from_json(JSON_SNAPSHOT)
-
-    print(f"Loaded {len(transactions_list)} transactions")
-    print(f"Starting server at http://{HOST}:{PORT}")
-    with HTTPServer((HOST, PORT), Handler) as httpd:
-        httpd.serve_forever()
+def _reloaded(stats):
+    # XML reloads carry fresh watermarks; persist them once the swap is done.
+    save_ingest_state(INGEST_STATE_FILE)
+
+def start_reload(path):
+    return reload_async(path, on_done=_reloaded)
+
+class OneShotHandler(Handler):
+    # Serial mode: a kept-alive client would hold the only thread.
+    keep_alive = False
+
+# --------------------
+# Serving modes
+# --------------------
+class PooledHTTPServer(HTTPServer):
+    # Connections are handled on a bounded thread pool. When every worker is
+    # busy the accept loop waits and new connections queue in the listen
+    # backlog instead of spawning more threads.
+    def __init__(self, address, handler, workers=WORKER_THREADS):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http")
+        self.slots = threading.BoundedSemaphore(workers)
+        super().__init__(address, handler)
+
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def handle_error(self, request, client_address):
+        # Clients dropping a kept-alive connection is routine, not an error.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+class _LoopWriter:
+    # wfile for BufferedHandler: buffers a response and hands it to the event
+    # loop on flush (or every STREAM_CHUNK_BYTES), so streamed responses go
+    # out while the handler is still producing them. The worker thread waits
+    # for each chunk to drain, so a slow reader holds back the handler
+    # instead of the whole response piling up in the transport buffer.
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+        self.buf = []
+        self.size = 0
+
+    def write(self, data):
+        self.buf.append(bytes(data))
+        self.size += len(data)
+        if self.size >= STREAM_CHUNK_BYTES:
+            self.flush()
+        return len(data)
+
+    def writelines(self, chunks):
+        for chunk in chunks:
+            self.write(chunk)
+
+    def flush(self):
+        if self.buf:
+            data, self.buf, self.size = b"".join(self.buf), [], 0
+            asyncio.run_coroutine_threadsafe(self._write_and_drain(data), self.loop).result()
+
+    async def _write_and_drain(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+class BufferedHandler(Handler):
+    # Runs one request that the event loop has already read in full through
+    # the regular Handler routing, without a socket of its own.
+    def __init__(self, raw_request, wfile, client_address):
+        self.rfile = io.BytesIO(raw_request)
+        self.wfile = wfile
+        self.client_address = client_address
+        self.close_connection = True
+        self.handle_one_request()
+
+def _content_length(head):
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            return int(value.strip())
+    return 0
+
+async def _serve_connection(reader, writer, pool):
+    # Idle keep-alive connections cost a coroutine, not a pool thread: the
+    # request is read here and only the handler runs on the pool.
+    loop = asyncio.get_running_loop()
+    out = _LoopWriter(loop, writer)
+    peer = writer.get_extra_info("peername")
+    try:
+        while True:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+                length = _content_length(head)
+                body = await reader.readexactly(length) if length > 0 else b""
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError,
+                    ConnectionError, ValueError):
+                break
+            handler = await loop.run_in_executor(pool, BufferedHandler, head + body, out, peer)
+            if handler.close_connection:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def _serve_asyncio(host, port, workers):
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http")
+    server = await asyncio.start_server(lambda r, w: _serve_connection(r, w, pool), host, port)
+    async with server:
+        await server.serve_forever()
+
+def _serve_prefork(httpd, processes):
+    # The store is loaded once and the listening socket bound before fork(),
+    # so children share both (memory copy-on-write) and accept in turn.
+    children = []
+    for _ in range(processes):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                httpd.serve_forever()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        httpd.server_close()
+
+def serve(mode, host=HOST, port=PORT, workers=WORKER_THREADS, processes=PREFORK_PROCESSES):
+    if mode == "asyncio":
+        asyncio.run(_serve_asyncio(host, port, workers))
+    elif mode == "serial":
+        with HTTPServer((host, port), OneShotHandler) as httpd:
+            httpd.serve_forever()
+    elif mode == "threaded":
+        with PooledHTTPServer((host, port), Handler, workers) as httpd:
+            httpd.serve_forever()
+    elif mode == "prefork":
+        _serve_prefork(PooledHTTPServer((host, port), Handler, workers), processes)
+    else:
+        raise ValueError(f"mode must be one of {SERVER_MODES}")
+
+def snapshot_file():
+    return BINARY_SNAPSHOT if SNAPSHOT_FORMAT == "binary" else JSON_SNAPSHOT
+
+def latest_snapshot():
+    # The newest snapshot on disk in either format (SNAPSHOT_FORMAT may have
+    # changed since it was written), or None.
+    found = [p for p in (BINARY_SNAPSHOT, JSON_SNAPSHOT) if os.path.exists(p)]
+    return max(found, key=os.path.getmtime) if found else None
+
+def open_memory_store(backend, mode, watch=False):
+    global READ_ONLY, STORE_BACKEND
+    STORE_BACKEND = backend
+    # Source of truth on startup: the last snapshot if there is one, otherwise
+    # the XML backup (streamed with iterparse); mutations logged since that
+    # snapshot are then replayed from the write-ahead log.
+    use_store_backend(backend)
+    if DEDUP_FILE:
+        open_dedup_index(DEDUP_FILE, DEDUP_BLOOM_CAPACITY)
+    snapshot = latest_snapshot()
+    if snapshot is None:
+        load_from_xml_streaming(XML_FILE)
+    elif snapshot.endswith(".bin"):
+        load_from_binary(snapshot)
+    else:
+        load_from_json(snapshot)
+    if os.path.exists(INGEST_STATE_FILE):
+        load_ingest_state(INGEST_STATE_FILE)
+    replayed = replay_log(WAL_FILE)
+    wal = open_mutation_log(WAL_FILE, snapshot_file(), fsync=WAL_FSYNC)
+    if replayed:
+        print(f"Replayed {replayed} logged mutations")
+    if mode == "prefork":
+        # Forked processes cannot share one mutable store, so they serve reads
+        # only; fold any replayed log into the snapshot before forking.
+        if replayed:
+            wal.compact()
+        close_mutation_log()
+        READ_ONLY = True
+    elif replayed:
+        wal.compact_async()
+
+    # Background reload of the XML backup: POST /admin/reload, SIGHUP or --watch.
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: start_reload(XML_FILE))
+    if watch:
+        watch_source(XML_FILE, on_done=_reloaded)
+
+    if DASHBOARD_INTERVAL_SEC:
+        materialize_dashboard(DASHBOARD_FILE, DASHBOARD_INTERVAL_SEC)
+
+def open_sqlite_store(path, mode, workers=WORKER_THREADS):
+    # Serve from the SQLite file instead of the in-memory store: the handlers'
+    # store functions are rebound to db.py's. A missing file is bulk loaded
+    # from the snapshot or XML backup first.
+    global READ_ONLY, STORE_BACKEND
+    if not os.path.exists(path):
+        source = latest_snapshot() or XML_FILE
+        stats = db.import_source(path, source)
+        print(f"Loaded {stats['rows']} rows into {path} ({stats['rows_per_sec']:.0f} rows/s)")
+    # One pooled connection per request thread, opened now (or on first use
+    # in each prefork child, since connections must not cross a fork).
+    db.open_database(path, pool_size=workers, warm=mode != "prefork")
+    g = globals()
+    for name in db.STORE_API:
+        g[name] = getattr(db, name)
+    STORE_BACKEND = "sqlite"
+    READ_ONLY = mode == "prefork"  # per-process write versions would disagree
+
+def main(argv=None):
+    global DASHBOARD_INTERVAL_SEC, DEDUP_FILE, DEDUP_BLOOM_CAPACITY
+    ap = argparse.ArgumentParser(description="MoMo transactions REST API")
+    ap.add_argument("--mode", choices=SERVER_MODES, default="threaded")
+    ap.add_argument("--host", default=HOST)
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--workers", type=int, default=WORKER_THREADS, help="request threads (per process)")
+    ap.add_argument("--processes", type=int, default=PREFORK_PROCESSES, help="prefork mode only")
+    ap.add_argument("--store", choices=("dict", "compact", "sqlite"), default=STORE_BACKEND)
+    ap.add_argument("--watch", action="store_true", help="reload when the XML backup file changes")
+    ap.add_argument("--dashboard-interval", type=float, default=DASHBOARD_INTERVAL_SEC, help="0 disables it")
+    ap.add_argument("--no-dedup", action="store_true", help="keep messages repeated across backups")
+    ap.add_argument("--dedup-bloom", type=int, default=DEDUP_BLOOM_CAPACITY, metavar="KEYS",
+                    help="put a Bloom filter sized for KEYS messages in front of the dedup index")
+    ap.add_argument("--profile-every", type=int, default=PROFILE_EVERY, metavar="N",
+                    help="profile 1 in N requests under cProfile (env MOMO_PROFILE_EVERY)")
+    ap.add_argument("--trace-loads", action="store_true", default=TRACE_LOADS,
+                    help="tracemalloc captures of loads, ingests and reloads (env MOMO_TRACE_LOADS=1)")
+    ap.add_argument("--profile-dir", help="where captures are written (default: ./profiles)")
+    args = ap.parse_args(argv)
+    DASHBOARD_INTERVAL_SEC = args.dashboard_interval
+    DEDUP_FILE = None if args.no_dedup else DEDUP_FILE
+    DEDUP_BLOOM_CAPACITY = args.dedup_bloom
+    request_profiler.every = max(0, args.profile_every)
+    configure_profiling(args.profile_dir, args.trace_loads)
+
+    if os.path.exists(USERS_FILE):
+        load_users(USERS_FILE)
+    if args.store == "sqlite":
+        open_sqlite_store(DB_FILE, args.mode, args.workers)
+    else:
+        open_memory_store(args.store, args.mode, args.watch)
+
+    print(f"Loaded {transaction_count()} transactions")
+    print(f"Starting server at http://{args.host}:{args.port} ({args.mode} mode)", flush=True)
+    serve(args.mode, args.host, args.port, args.workers, args.processes)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,80 @@
+from datetime import datetime
+
+# --------------------
+# Typed field cleaning for values pulled out of SMS bodies
+# --------------------
+AMOUNT_FIELDS = ("amount", "fee", "balance")
+DATETIME_FIELDS = ("occurred_at",)
+TEXT_FIELDS = ("counterparty", "account")
+
+def parse_amount(text):
+    # MoMo amounts are whole RWF, sometimes with thousands separators ("1,000").
+    if text is None:
+        return None
+    text = text.replace(",", "").strip()
+    if not text:
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+def parse_datetime(text):
+    if not text:
+        return None
+    try:
+        return datetime.fromisoformat(text.strip())
+    except ValueError:
+        return None
+
+def clean_text(text):
+    if text is None:
+        return None
+    text = " ".join(text.split())
+    return text or None
+
+def clean_fields(fields):
+    out = {}
+    for k, v in fields.items():
+        if v is None:
+            continue
+        if k in AMOUNT_FIELDS:
+            v = parse_amount(v)
+        elif k in DATETIME_FIELDS:
+            v = parse_datetime(v)
+        elif k in TEXT_FIELDS:
+            v = clean_text(v)
+        else:
+            v = v.strip() or None
+        if v is not None:
+            out[k] = v
+    return out
+
+# --------------------
+# Categorization (matches the Transaction.Type enum in database_setup.sql)
+# --------------------
+KIND_CATEGORIES = {
+    "received": "Received",
+    "deposit": "Deposit",
+    "withdrawal": "Withdrawal",
+    "transfer": "Transfer",
+    "bank_transfer": "Transfer",
+    "payment": "Payment",
+    "direct_debit": "Payment",
+    "token_payment": "Payment",
+    "bundle": "Airtime",
+}
+AIRTIME_COUNTERPARTIES = ("airtime", "bundles and packs", "data bundle")
+UTILITY_COUNTERPARTIES = ("cash power", "wasac", "reg ", "electricity", "water", "canal+", "startimes", "dstv")
+
+def categorize(fields):
+    if not fields:
+        return None
+    category = KIND_CATEGORIES.get(fields.get("kind"))
+    if category == "Payment":
+        counterparty = (fields.get("counterparty") or "").lower() + " "
+        if counterparty.startswith(AIRTIME_COUNTERPARTIES):
+            return "Airtime"
+        if any(u in counterparty for u in UTILITY_COUNTERPARTIES):
+            return "Utility"
+    return category
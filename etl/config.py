@@ -0,0 +1,15 @@
+import os
+
+# --------------------
+# ETL defaults (paths are relative to the repository root)
+# --------------------
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+XML_PATH = os.path.join(ROOT_DIR, "data", "raw", "momo.xml")
+OUTPUT_JSON = os.path.join(ROOT_DIR, "data", "processed", "transactions.json")
+
+# Messages per batch shipped to a worker process; large enough to amortize
+# pickling, small enough to keep every core busy near the end of the file.
+BATCH_SIZE = 2000
+WORKERS = os.cpu_count() or 1
+# Batches allowed in flight per worker before the parser waits for results.
+INFLIGHT_PER_WORKER = 2
@@ -0,0 +1,379 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+# --------------------
+# Schema (SQLite port of database/database_setup.sql)
+# --------------------
+# Same tables and keys as the MySQL script. ENUMs become CHECK constraints and
+# DECIMAL columns NUMERIC. `Transaction` also carries what the API serves and
+# filters on: the record id, owner, SMS kind, epoch ms and the record itself
+# as JSON, so a row round-trips to exactly the record that was loaded.
+TRANSACTION_TYPES = ("Deposit", "Withdrawal", "Transfer", "Payment", "Utility", "Airtime", "Received")
+STATUS_BY_KIND = {"failed": "Failed", "reversal": "Reversed", "reversal_pending": "Reversal pending"}
+
+TABLES = [
+    """CREATE TABLE IF NOT EXISTS "User" (
+        UserID INTEGER PRIMARY KEY,
+        Name TEXT NOT NULL,
+        Phone TEXT NOT NULL,
+        Email TEXT UNIQUE NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS Message (
+        MessageID INTEGER PRIMARY KEY,
+        Raw_text TEXT NOT NULL,
+        Time TEXT NOT NULL,
+        UserID INTEGER REFERENCES "User"(UserID)
+    )""",
+    """CREATE TABLE IF NOT EXISTS Category (
+        CategoryID INTEGER PRIMARY KEY,
+        Name TEXT NOT NULL,
+        Description TEXT
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS "Transaction" (
+        TransactionID INTEGER PRIMARY KEY,
+        UserID INTEGER REFERENCES "User"(UserID),
+        MessageID INTEGER REFERENCES Message(MessageID),
+        CategoryID INTEGER REFERENCES Category(CategoryID),
+        Amount NUMERIC NOT NULL,
+        Currency TEXT DEFAULT 'RWF',
+        Date TEXT NOT NULL,
+        Type TEXT CHECK (Type IN {TRANSACTION_TYPES!r}),
+        Status TEXT,
+        Balance NUMERIC,
+        Charge NUMERIC,
+        RecordID TEXT NOT NULL,
+        Owner TEXT NOT NULL,
+        Kind TEXT NOT NULL,
+        Counterparty TEXT,
+        Epoch_ms INTEGER,
+        Record TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS System_logs (
+        LogID INTEGER PRIMARY KEY,
+        Log_level TEXT NOT NULL CHECK (Log_level IN ('Info', 'Urgent', 'Error', 'Debug')),
+        Log_category TEXT NOT NULL,
+        Details TEXT,
+        UserID INTEGER REFERENCES "User"(UserID),
+        TransactionID INTEGER REFERENCES "Transaction"(TransactionID),
+        Processing_time TEXT,
+        Created_at TEXT
+    )""",
+]
+
+# name -> definition. The first group mirrors the MySQL INDEX clauses; the
+# rest back the API's lookups (by id, by owner/kind in insertion order, by
+# time range in (epoch ms, id) order).
+INDEXES = {
+    "idx_user_phone": '"User"(Phone)',
+    "idx_message_time": "Message(Time)",
+    "idx_category_name": "Category(Name)",
+    "idx_transaction_type": '"Transaction"(Type)',
+    "idx_transaction_currency": '"Transaction"(Currency)',
+    "idx_transaction_message": '"Transaction"(MessageID)',
+    "idx_logs_level": "System_logs(Log_level)",
+    "idx_logs_transaction": "System_logs(TransactionID)",
+    "idx_transaction_record": '"Transaction"(RecordID)',
+    "idx_transaction_owner": '"Transaction"(Owner, TransactionID)',
+    "idx_transaction_kind": '"Transaction"(Kind, TransactionID)',
+    "idx_transaction_time": '"Transaction"(Epoch_ms, RecordID)',
+}
+UNIQUE_INDEXES = ("idx_transaction_record", "idx_category_name")
+
+TX_COLUMNS = ("TransactionID", "MessageID", "CategoryID", "Amount", "Date", "Type", "Status", "Balance",
+              "Charge", "RecordID", "Owner", "Kind", "Counterparty", "Epoch_ms", "Record")
+INSERT_TRANSACTION = (f'INSERT INTO "Transaction" ({", ".join(TX_COLUMNS)}) '
+                      f'VALUES ({", ".join("?" * len(TX_COLUMNS))})')
+INSERT_MESSAGE = "INSERT INTO Message (MessageID, Raw_text, Time) VALUES (?, ?, ?)"
+
+# --------------------
+# Connections and pragmas
+# --------------------
+# WAL lets readers run alongside the single writer; NORMAL sync is durable
+# across application crashes under WAL. The initial load turns sync off and
+# commits in large transactions, then restores it.
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -64 * 1024,  # KiB
+    "mmap_size": 256 * 1024 * 1024,
+    "foreign_keys": "ON",
+    "busy_timeout": 5000,  # ms a connection waits for another one's write lock
+}
+BATCH_ROWS = 5000  # rows per executemany call
+COMMIT_ROWS = 200_000  # rows per transaction during a bulk load
+
+def connect(path, check_same_thread=True, cached_statements=128):
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=check_same_thread,
+                           cached_statements=cached_statements)
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+def create_schema(conn, indexes=True):
+    for ddl in TABLES:
+        conn.execute(ddl)
+    if indexes:
+        create_indexes(conn)
+    if not conn.execute("SELECT 1 FROM Category LIMIT 1").fetchone():
+        conn.executemany("INSERT INTO Category (Name) VALUES (?)", [(t,) for t in TRANSACTION_TYPES])
+
+def create_indexes(conn):
+    for name, target in INDEXES.items():
+        unique = "UNIQUE " if name in UNIQUE_INDEXES else ""
+        conn.execute(f"CREATE {unique}INDEX IF NOT EXISTS {name} ON {target}")
+
+def drop_indexes(conn):
+    for name in INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+# --------------------
+# Record -> rows
+# --------------------
+def _amount(value):
+    if value is None or isinstance(value, int):
+        return value
+    text = str(value).replace(",", "").strip()
+    if text.isdigit():
+        return int(text)
+    if not text:
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def _epoch_ms(value):
+    text = str(value if value is not None else "").strip()
+    if text.isdigit():
+        return int(text)
+    try:
+        dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+def record_epoch_ms(tx):
+    # The record's timestamp, else the SMS `date` attribute (as data_dsa does).
+    ms = _epoch_ms(tx.get("timestamp"))
+    if ms is None:
+        ms = _epoch_ms((tx.get("_raw") or {}).get("date"))
+    return ms
+
+def transaction_row(tx, row_id, categories, record=None):
+    # (Transaction row, Message row) for one API record; both share row_id.
+    ms = record_epoch_ms(tx)
+    when = (datetime.fromtimestamp(ms / 1000, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            if ms is not None else tx.get("occurred_at") or "")
+    category = tx.get("category")
+    kind = tx.get("type") or ""
+    if record is None:
+        record = json.dumps(tx, ensure_ascii=False)
+    body = tx.get("body") or (tx.get("_raw") or {}).get("body") or ""
+    return ((row_id, row_id, categories.get(category), _amount(tx.get("amount")) or 0, when,
+             category if category in TRANSACTION_TYPES else None, STATUS_BY_KIND.get(kind),
+             _amount(tx.get("balance")), _amount(tx.get("fee")), tx["id"], tx.get("owner") or "unknown",
+             kind, tx.get("counterparty"), ms, record),
+            (row_id, body, when))
+
+def category_ids(conn):
+    return dict(conn.execute("SELECT Name, CategoryID FROM Category"))
+
+def next_row_id(conn):
+    return conn.execute('SELECT COALESCE(MAX(TransactionID), 0) + 1 FROM "Transaction"').fetchone()[0]
+
+# --------------------
+# Bulk loading
+# --------------------
+class BulkWriter:
+    # Appends records in executemany batches inside large transactions. When
+    # the tables start out empty, indexes are dropped for the load and built
+    # once at the end, which is much cheaper than maintaining them per row.
+    # Used as a context manager it closes on success and aborts on an error:
+    # the open transaction is rolled back (batches already committed stay),
+    # deferred indexes are rebuilt and synchronous is restored either way.
+    def __init__(self, conn, batch_size=BATCH_ROWS, commit_rows=COMMIT_ROWS, defer_indexes=True):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.commit_rows = commit_rows
+        create_schema(conn, indexes=False)
+        self.deferred = defer_indexes and not conn.execute('SELECT 1 FROM "Transaction" LIMIT 1').fetchone()
+        if self.deferred:
+            drop_indexes(conn)
+        else:
+            create_indexes(conn)
+        self.categories = category_ids(conn)
+        self.next_id = next_row_id(conn)
+        self.rows = 0
+        self.pending = 0
+        self.index_sec = 0.0
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("BEGIN")
+
+    def add(self, records):
+        tx_rows, msg_rows = [], []
+        for tx in records:
+            tx_row, msg_row = transaction_row(tx, self.next_id, self.categories)
+            self.next_id += 1
+            tx_rows.append(tx_row)
+            msg_rows.append(msg_row)
+            if len(tx_rows) >= self.batch_size:
+                self._flush(tx_rows, msg_rows)
+                tx_rows, msg_rows = [], []
+        if tx_rows:
+            self._flush(tx_rows, msg_rows)
+
+    def _flush(self, tx_rows, msg_rows):
+        self.conn.executemany(INSERT_MESSAGE, msg_rows)
+        self.conn.executemany(INSERT_TRANSACTION, tx_rows)
+        self.rows += len(tx_rows)
+        self.pending += len(tx_rows)
+        if self.pending >= self.commit_rows:
+            self.conn.execute("COMMIT")
+            self.conn.execute("BEGIN")
+            self.pending = 0
+
+    def close(self):
+        self.conn.execute("COMMIT")
+        self._finish()
+
+    def abort(self):
+        if self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+        self._finish()
+
+    def _finish(self):
+        try:
+            if self.deferred:
+                t0 = time.perf_counter()
+                create_indexes(self.conn)
+                self.conn.execute("ANALYZE")
+                self.index_sec = time.perf_counter() - t0
+        finally:
+            self.conn.execute(f"PRAGMA synchronous={PRAGMAS['synchronous']}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def bulk_load(conn, records, batch_size=BATCH_ROWS, defer_indexes=True):
+    t0 = time.perf_counter()
+    with BulkWriter(conn, batch_size, defer_indexes=defer_indexes) as writer:
+        writer.add(records)
+    sec = time.perf_counter() - t0
+    return {
+        "rows": writer.rows,
+        "deferred_indexes": writer.deferred,
+        "index_sec": writer.index_sec,
+        "sec": sec,
+        "rows_per_sec": writer.rows / sec if sec else 0.0,
+    }
+
+# --------------------
+# Indexed lookup latency
+# --------------------
+def _latency(conn, sql, params_list):
+    times = []
+    for params in params_list:
+        t0 = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+    return {"p50_ms": times[len(times) // 2], "p99_ms": times[int(len(times) * 0.99)],
+            "mean_ms": sum(times) / len(times)}
+
+def benchmark_queries(conn, samples=500, seed=42):
+    rng = random.Random(seed)
+    ids = [r[0] for r in conn.execute('SELECT RecordID FROM "Transaction"')]
+    owners = [r[0] for r in conn.execute('SELECT DISTINCT Owner FROM "Transaction"')]
+    kinds = [r[0] for r in conn.execute('SELECT DISTINCT Kind FROM "Transaction"')]
+    lo, hi = conn.execute('SELECT MIN(Epoch_ms), MAX(Epoch_ms) FROM "Transaction"').fetchone()
+    if not ids:
+        return {}
+    day = 24 * 60 * 60 * 1000
+    starts = [rng.randint(lo, max(lo, hi - day)) for _ in range(samples)] if lo is not None else [0]
+    return {
+        "rows": len(ids),
+        "by_id": _latency(conn, 'SELECT Record FROM "Transaction" WHERE RecordID = ?',
+                          [(rng.choice(ids),) for _ in range(samples)]),
+        "by_owner_page": _latency(conn, 'SELECT Record FROM "Transaction" WHERE Owner = ? '
+                                        'ORDER BY TransactionID LIMIT 100',
+                                  [(rng.choice(owners),) for _ in range(samples)]),
+        "by_kind_page": _latency(conn, 'SELECT Record FROM "Transaction" WHERE Kind = ? '
+                                       'ORDER BY TransactionID LIMIT 100',
+                                 [(rng.choice(kinds),) for _ in range(samples)]),
+        "by_time_day": _latency(conn, 'SELECT Record FROM "Transaction" WHERE Epoch_ms BETWEEN ? AND ? '
+                                      'ORDER BY Epoch_ms, RecordID',
+                                [(s, s + day) for s in starts]),
+    }
+
+def _synthetic_records(n, seed=42):
+    rng = random.Random(seed)
+    kinds = ("payment", "transfer", "deposit", "received", "token_payment")
+    for i in range(1, n + 1):
+        kind = rng.choice(kinds)
+        yield {"id": str(i), "type": kind, "amount": str(rng.randint(100, 50_000)), "sender": "M-Money",
+               "receiver": "", "timestamp": str(1715351458724 + i * 60_000), "owner": f"user{i % 50}",
+               "category": kind.title() if kind != "token_payment" else "Payment",
+               "counterparty": f"Shop {rng.randint(1, 500)}", "body": f"Synthetic message {i}"}
+
+def benchmark_load(path, n, batch_size=BATCH_ROWS):
+    # Initial load with indexes built at the end vs maintained on every row.
+    records = list(_synthetic_records(n))
+    result = {}
+    for label, defer in (("deferred_indexes", True), ("eager_indexes", False)):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        conn = connect(path)
+        create_schema(conn)
+        result[label] = bulk_load(conn, records, batch_size, defer_indexes=defer)
+        if defer:
+            result["queries"] = benchmark_queries(conn)
+        conn.close()
+    return result
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Bulk load transaction records (JSON) into SQLite")
+    ap.add_argument("json", nargs="?", help="records as written by run.py or data_dsa.snapshot_to_json")
+    ap.add_argument("--db", default="transactions.db")
+    ap.add_argument("--batch-size", type=int, default=BATCH_ROWS)
+    ap.add_argument("--bench", action="store_true", help="also time the indexed lookups")
+    ap.add_argument("--synthetic", type=int, metavar="N",
+                    help="load N generated records into --db twice (deferred vs eager indexes) and exit")
+    args = ap.parse_args(argv)
+    if args.synthetic:
+        json.dump(benchmark_load(args.db, args.synthetic, args.batch_size), sys.stdout, indent=2)
+        print()
+        return
+    if not args.json:
+        ap.error("a JSON file of records is required")
+    with open(args.json, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    conn = connect(args.db)
+    report = {"load": bulk_load(conn, records, args.batch_size)}
+    if args.bench:
+        report["queries"] = benchmark_queries(conn)
+    conn.close()
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import json
+import re
+import time
+import xml.etree.ElementTree as ET
+
+from clean_normalize import clean_fields
+
+# --------------------
+# SMS body templates
+# --------------------
+# Each template is (kind, prefix, pattern). Patterns are compiled once and
+# dispatched on the first DISPATCH_WIDTH characters of the body, so every
+# message costs one dict lookup, a startswith check and a single regex match.
+DISPATCH_WIDTH = 4
+
+_WHEN = r"(?P<occurred_at>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})"
+_BALANCE = r"(?:.*?new balance\s*(?:is|:)\s*(?P<balance>[\d,]+) RWF)?"
+_FEE = r"(?:.*?Fee (?:was|paid):?\s*(?P<fee>[\d,]+) RWF)?"
+_TXID = r"(?:.*?Financial Transaction Id: (?P<txid>\d+))?"
+
+TEMPLATES = [
+    ("received", "You have received",
+     r"You have received (?P<amount>[\d,]+) RWF from (?P<counterparty>.+?) \((?P<counterparty_phone>[^)]*)\)"
+     r" on your mobile money account at " + _WHEN + _BALANCE + _TXID),
+    ("bank_transfer", "You have transferred",
+     r"You have transferred (?P<amount>[\d,]+) RWF to (?P<counterparty>.+?) \((?P<counterparty_phone>[^)]*)\)"
+     r" from your mobile money account (?P<account>.+?) at " + _WHEN + _BALANCE + _TXID),
+    ("withdrawal", "You ",
+     r"You .+? have via agent: (?P<counterparty>.+?) \((?P<counterparty_phone>[^)]*)\), withdrawn "
+     r"(?P<amount>[\d,]+) RWF from your mobile money account: (?P<account>\d+) at " + _WHEN
+     + _BALANCE + _FEE + _TXID),
+    ("payment", "TxId:",
+     r"TxId: (?P<txid>\d+)\. Your payment of (?P<amount>[\d,]+) RWF to (?P<counterparty>.+?) \d+"
+     r" has been completed at " + _WHEN + _BALANCE + _FEE),
+    ("payment", "Your payment of",
+     r"Your payment of (?P<amount>[\d,]+) RWF to (?P<counterparty>.+?) \((?P<counterparty_phone>[^)]*)\)"
+     r" has been completed at " + _WHEN + _BALANCE + _FEE + _TXID),
+    ("deposit", "*113*R*A bank deposit",
+     r"\*113\*R\*A bank deposit of (?P<amount>[\d,]+) RWF has been added to your mobile money account at "
+     + _WHEN + r"(?:.*?NEW BALANCE :(?P<balance>[\d,]+) RWF)?"),
+    ("transfer", "*165*S*",
+     r"\*165\*S\*(?P<amount>[\d,]+) RWF transferred to (?P<counterparty>.+?) \((?P<counterparty_phone>[^)]*)\)"
+     r" from (?P<account>\d+) at " + _WHEN + _FEE + _BALANCE),
+    ("token_payment", "*162*TxId:",
+     r"\*162\*TxId:(?P<txid>\d+)\*S\*Your payment of (?P<amount>[\d,]+) RWF to (?P<counterparty>.+?) with token"
+     r".*? has been completed at " + _WHEN + _FEE + _BALANCE),
+    ("direct_debit", "*164*S*",
+     r"\*164\*S\*Y'ello,A transaction of (?P<amount>[\d,]+) RWF by (?P<counterparty>.+?) on your MOMO account"
+     r" was successfully completed at " + _WHEN + _BALANCE + _FEE + _TXID),
+    ("bundle", "Yello!Umaze kugura",
+     r"Yello!Umaze kugura (?P<product>.+?) igura (?P<amount>[\d,]+) RWF"),
+    ("failed", "*143*TxId:",
+     r"\*143\*TxId:(?P<txid>\d+)\*S\*Your payment of (?P<amount>[\d,]+) RWF to (?P<counterparty>.+?) with token"
+     r".*? has failed at " + _WHEN),
+    ("failed", "*143*R*",
+     r"\*143\*R\*Y'ello, the transaction with amount (?P<amount>[\d,]+) RWF for (?P<counterparty>.+?)"
+     r" with message: .*? failed at " + _WHEN),
+    ("reversal", "*143*S*",
+     r"\*143\*S\*Your transaction to (?P<counterparty>.+?) \((?P<counterparty_phone>[^)]*)\) with "
+     r"(?P<amount>[\d,]+) RWF has been reversed at " + _WHEN + _BALANCE),
+    ("reversal_pending", "A reversal has been initiated",
+     r"A reversal has been initiated for your transaction to (?P<counterparty>.+?)"
+     r" \((?P<counterparty_phone>[^)]*)\) with (?P<amount>[\d,]+) RWF"),
+    ("otp", "<#> ", r"<#> .*?one-time password"),
+]
+
+def _compile_templates(templates):
+    table = {}
+    for kind, prefix, pattern in templates:
+        compiled = re.compile(pattern, re.IGNORECASE | re.DOTALL)
+        table.setdefault(prefix[:DISPATCH_WIDTH], []).append((kind, prefix, compiled))
+    return table
+
+_DISPATCH = _compile_templates(TEMPLATES)
+
+# --------------------
+# Extraction API
+# --------------------
+def extract(body):
+    if not body:
+        return None
+    candidates = _DISPATCH.get(body[:DISPATCH_WIDTH])
+    if not candidates:
+        return None
+    for kind, prefix, pattern in candidates:
+        if not body.startswith(prefix):
+            continue
+        m = pattern.match(body)
+        if m is None:
+            continue
+        fields = clean_fields(m.groupdict())
+        fields["kind"] = kind
+        return fields
+    return None
+
+def extract_batch(bodies):
+    return [extract(body) for body in bodies]
+
+def _iter_sms_elements(xml_path):
+    root = None
+    for event, elem in ET.iterparse(xml_path, events=("start", "end")):
+        if root is None:
+            root = elem
+        elif event == "end" and elem.tag.lower().split("}")[-1] == "sms":
+            yield elem
+            elem.clear()
+            del root[:]
+
+def iter_sms(xml_path):
+    for elem in _iter_sms_elements(xml_path):
+        yield dict(elem.attrib)
+
+def iter_sms_fields(xml_path):
+    # Every attribute, keys lowercased and values stripped as
+    # data_dsa.xml_element_to_dict does, so records built from it keep the
+    # same _raw the XML loaders store.
+    for elem in _iter_sms_elements(xml_path):
+        yield {k.lower(): v.strip() for k, v in elem.attrib.items()}
+
+def benchmark_extraction(bodies, repeats=5):
+    bodies = list(bodies)
+    matched = sum(1 for fields in extract_batch(bodies) if fields)  # also warms up
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        extract_batch(bodies)
+    sec = time.perf_counter() - t0
+    total = len(bodies) * repeats
+    return {
+        "messages": len(bodies),
+        "matched": matched,
+        "repeats": repeats,
+        "sec": sec,
+        "messages_per_sec": total / sec if sec else 0.0,
+    }
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Extract typed fields from MoMo SMS bodies")
+    ap.add_argument("xml")
+    ap.add_argument("--bench", action="store_true", help="report extraction throughput instead of fields")
+    ap.add_argument("--repeats", type=int, default=5)
+    args = ap.parse_args()
+    bodies = [sms.get("body", "") for sms in iter_sms(args.xml)]
+    if args.bench:
+        print(json.dumps(benchmark_extraction(bodies, args.repeats), indent=2))
+    else:
+        for fields in extract_batch(bodies):
+            print(json.dumps(fields, default=str, ensure_ascii=False))
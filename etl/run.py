@@ -0,0 +1,290 @@
+import argparse
+import cProfile
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource  # peak RSS; not available on Windows
+except ImportError:
+    resource = None
+
+import config
+import load_db
+from clean_normalize import categorize
+from parse_xml import extract, iter_sms_fields
+
+# --------------------
+# Pipeline stages
+# --------------------
+# Parse runs in the parent, which keeps each batch of SMS attribute dicts and
+# ships only the bodies to the workers; workers send back fixed-width result
+# tuples in ROW_FIELDS order.
+ROW_FIELDS = ("type", "category", "amount", "fee", "balance", "txid", "counterparty", "counterparty_phone",
+              "occurred_at")
+
+def transform_batch(bodies):
+    t0 = time.process_time()
+    rows = []
+    for body in bodies:
+        fields = extract(body)
+        if not fields:
+            rows.append(None)
+            continue
+        occurred = fields.get("occurred_at")
+        rows.append((
+            fields["kind"],
+            categorize(fields),
+            fields.get("amount"),
+            fields.get("fee"),
+            fields.get("balance"),
+            fields.get("txid"),
+            fields.get("counterparty"),
+            fields.get("counterparty_phone"),
+            occurred.isoformat(sep=" ") if occurred else None,
+        ))
+    return rows, time.process_time() - t0
+
+def transform_batch_traced(bodies):
+    # transform_batch plus the peak bytes traced while it ran (--trace-memory).
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    rows, cpu = transform_batch(bodies)
+    return rows, cpu, tracemalloc.get_traced_memory()[1]
+
+def _batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# --------------------
+# Loaders
+# --------------------
+def build_record(n, sms, row):
+    # One record as data_dsa.normalize_transaction would build it from the
+    # same SMS (same keys, same order, every attribute under _raw), so
+    # load_from_json stores it as-is instead of normalizing it again.
+    address = sms.get("address", "")
+    rec = {
+        "id": str(n),
+        "type": sms.get("type", ""),  # the SMS type attribute unless the body parses
+        "amount": "",
+        "sender": address,
+        "receiver": "",
+        "timestamp": sms.get("date") or sms.get("readable_date", ""),
+        "owner": address or "unknown",
+    }
+    if row:
+        for k, v in zip(ROW_FIELDS, row):
+            if v is not None and v != "":
+                rec[k] = str(v) if k == "amount" else v
+    rec["_raw"] = dict(sms)
+    return rec
+
+class JsonLoader:
+    # Writes to a temp file beside `path`, renamed into place on close; abort
+    # discards it, so a failed run never leaves a truncated file behind.
+    def __init__(self, path):
+        self.path = path
+        fd, self.tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                        prefix=os.path.basename(path) + ".", suffix=".tmp")
+        self.f = open(fd, "w", encoding="utf-8")
+        self.f.write("[")
+        self.count = 0
+
+    def add_batch(self, batch, rows):
+        out = []
+        for sms, row in zip(batch, rows):
+            self.count += 1
+            out.append(json.dumps(build_record(self.count, sms, row), ensure_ascii=False))
+        if out:
+            self.f.write(("," if self.count > len(out) else "") + ",".join(out))
+
+    def close(self):
+        self.f.write("]")
+        self.f.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self):
+        self.f.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+class SqliteLoader:
+    # Same records, bulk loaded into the SQLite schema from load_db.py.
+    def __init__(self, path):
+        self.path = path
+        self.conn = load_db.connect(path)
+        self.writer = load_db.BulkWriter(self.conn)
+        self.count = self.writer.next_id - 1
+
+    def add_batch(self, batch, rows):
+        start = self.count
+        self.count += len(batch)
+        self.writer.add(build_record(start + i, sms, row) for i, (sms, row) in enumerate(zip(batch, rows), 1))
+
+    def close(self):
+        self.writer.close()
+        self.conn.close()
+
+    def abort(self):
+        # Rolls back the batch in progress; batches already committed stay.
+        try:
+            self.writer.abort()
+        finally:
+            self.conn.close()
+
+# --------------------
+# Driver
+# --------------------
+def _max_rss_mb(children=False):
+    # Peak resident set of this process, or of the largest child reaped so far.
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024  # bytes on macOS, KB elsewhere
+
+def run_pipeline(xml_path, loader, workers=1, batch_size=config.BATCH_SIZE, trace_memory=False):
+    # Each stage reports wall and CPU seconds; with trace_memory the parent
+    # (and each worker) runs under tracemalloc and every stage also reports the
+    # highest traced memory seen while it ran (about 6x slower overall).
+    stats = {"parse_sec": 0.0, "transform_cpu_sec": 0.0, "transform_wait_sec": 0.0, "load_sec": 0.0}
+    usage = {stage: {"wall_sec": 0.0, "cpu_sec": 0.0, "peak_mb": 0.0 if trace_memory else None}
+             for stage in ("parse", "transform", "load")}
+    clock, cpu_clock = time.perf_counter, time.process_time
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    transform = transform_batch_traced if trace_memory else transform_batch
+    t_start = clock()
+    batches = _batched(iter_sms_fields(xml_path), batch_size)
+    messages = n_batches = 0
+
+    def note_peak(stage, peak_bytes):
+        if trace_memory:
+            usage[stage]["peak_mb"] = max(usage[stage]["peak_mb"], peak_bytes / (1024 * 1024))
+
+    def timed_stage(stage, fn, *args):
+        if trace_memory:
+            tracemalloc.reset_peak()
+        t0, c0 = clock(), cpu_clock()
+        result = fn(*args)
+        usage[stage]["wall_sec"] += clock() - t0
+        usage[stage]["cpu_sec"] += cpu_clock() - c0
+        if trace_memory:
+            note_peak(stage, tracemalloc.get_traced_memory()[1])
+        return result
+
+    def next_batch():
+        return timed_stage("parse", next, batches, None)
+
+    def load(batch, result):
+        nonlocal messages, n_batches
+        rows, cpu = result[0], result[1]
+        if trace_memory:
+            note_peak("transform", result[2])
+        timed_stage("load", loader.add_batch, batch, rows)
+        stats["transform_cpu_sec"] += cpu
+        messages += len(batch)
+        n_batches += 1
+
+    try:
+        if workers <= 1:
+            while (batch := next_batch()) is not None:
+                t0 = clock()
+                result = transform([sms.get("body", "") for sms in batch])
+                stats["transform_wait_sec"] += clock() - t0
+                load(batch, result)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                inflight = deque()
+                max_inflight = workers * config.INFLIGHT_PER_WORKER
+                while True:
+                    batch = next_batch()
+                    if batch is not None:
+                        inflight.append((batch, pool.submit(transform, [sms.get("body", "") for sms in batch])))
+                    if not inflight:
+                        break
+                    if batch is not None and len(inflight) < max_inflight:
+                        continue
+                    done_batch, fut = inflight.popleft()
+                    t0 = clock()
+                    result = fut.result()
+                    stats["transform_wait_sec"] += clock() - t0
+                    load(done_batch, result)
+        timed_stage("load", loader.close)
+    except BaseException:
+        loader.abort()
+        raise
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    wall = clock() - t_start
+    stats["parse_sec"], stats["load_sec"] = usage["parse"]["wall_sec"], usage["load"]["wall_sec"]
+    # Transform runs in the workers: wall is the time the parent waited on
+    # them (all of it with one worker), CPU what the workers spent.
+    usage["transform"]["wall_sec"] = stats["transform_wait_sec"]
+    usage["transform"]["cpu_sec"] = stats["transform_cpu_sec"]
+    return {
+        "workers": workers,
+        "batch_size": batch_size,
+        "batches": n_batches,
+        "messages": messages,
+        "stages": stats,
+        "usage": usage,
+        "max_rss_mb": {"main": _max_rss_mb(), "workers": _max_rss_mb(children=True) if workers > 1 else None},
+        "wall_sec": wall,
+        "messages_per_sec": messages / wall if wall else 0.0,
+    }
+
+def scaling_report(xml_path, max_workers, batch_size=config.BATCH_SIZE):
+    counts, n = [], 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for w in counts:
+            loader = JsonLoader(os.path.join(tmp, f"out_{w}.json"))
+            results.append(run_pipeline(xml_path, loader, workers=w, batch_size=batch_size))
+    return results
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="MoMo SMS ETL: parse, extract, categorize, load")
+    ap.add_argument("--xml", default=config.XML_PATH)
+    ap.add_argument("--out", default=config.OUTPUT_JSON, help="JSON file loadable by data_dsa.load_from_json")
+    ap.add_argument("--sqlite", metavar="DB", help="bulk load into this SQLite database instead of --out")
+    ap.add_argument("--workers", type=int, default=config.WORKERS)
+    ap.add_argument("--batch-size", type=int, default=config.BATCH_SIZE)
+    ap.add_argument("--scaling", action="store_true", help="time 1, 2, 4 .. --workers processes and exit")
+    ap.add_argument("--trace-memory", action="store_true", help="report each stage's peak traced memory (slower)")
+    ap.add_argument("--profile", metavar="PSTATS", help="cProfile the main process into this .pstats file")
+    args = ap.parse_args(argv)
+    if args.scaling:
+        report = scaling_report(args.xml, args.workers, args.batch_size)
+    else:
+        loader = SqliteLoader(args.sqlite) if args.sqlite else JsonLoader(args.out)
+        profile = cProfile.Profile() if args.profile else None
+        if profile:
+            profile.enable()
+        report = run_pipeline(args.xml, loader, args.workers, args.batch_size, args.trace_memory)
+        if profile:
+            profile.disable()
+            profile.dump_stats(args.profile)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import base64
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_DSA_DIR = os.path.join(_ROOT, "DSA")
+_API_DIR = os.path.join(_ROOT, "api")
+for _dir in (_DSA_DIR, _API_DIR):
+    if _dir not in sys.path:
+        sys.path.append(_dir)
+
+import api_server
+import data_dsa
+from bench_store import scale_xml
+
+# Server benchmarks, run through scripts/benchmark.py. Each server under test
+# is api/api_server.py in a child process, started from api/ like a normal run.
+SERVER = os.path.join(_API_DIR, "api_server.py")
+AUTH = "Basic " + base64.b64encode(b"group4:member").decode("ascii")
+
+def _server_env():
+    # The child imports data_dsa from DSA/ even without a copy beside it.
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (_DSA_DIR, env.get("PYTHONPATH")) if p)
+    return env
+
+# --------------------
+# Mode comparison under concurrent clients
+# --------------------
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+def _wait_for_port(host, port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def _drive(host, port, auth, paths, stop, latencies):
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    headers = {"Authorization": auth}
+    while not stop.is_set():
+        path = random.choice(paths)
+        t0 = time.perf_counter()
+        conn.request("GET", path, headers=headers)
+        conn.getresponse().read()
+        latencies.append(time.perf_counter() - t0)
+    conn.close()
+
+def benchmark_modes(modes=api_server.SERVER_MODES, clients=8, seconds=5.0, slow_clients=1,
+                    slow_path="/transactions", port=8100):
+    # Starts the server in each mode and runs `clients` keep-alive clients
+    # fetching single records while `slow_clients` keep requesting slow_path.
+    # Latency percentiles are for the single-record requests.
+    host = api_server.HOST
+    results = {}
+    for mode in modes:
+        if mode == "prefork" and not hasattr(os, "fork"):
+            continue
+        proc = subprocess.Popen([sys.executable, SERVER, "--mode", mode, "--port", str(port)], cwd=_API_DIR,
+                                env=_server_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not _wait_for_port(host, port):
+                raise RuntimeError(f"server in {mode} mode did not start")
+            fast, slow = [], []
+            ids = [f"/transactions/{i}" for i in range(1, 1001)]
+            stop = threading.Event()
+            threads = [threading.Thread(target=_drive, args=(host, port, AUTH, ids, stop, fast))
+                       for _ in range(clients)]
+            threads += [threading.Thread(target=_drive, args=(host, port, AUTH, [slow_path], stop, slow))
+                        for _ in range(slow_clients)]
+            for t in threads:
+                t.start()
+            time.sleep(seconds)
+            stop.set()
+            for t in threads:
+                t.join()
+            fast.sort()
+            results[mode] = {
+                "requests_per_sec": len(fast) / seconds,
+                "p50_ms": _percentile(fast, 50) * 1000,
+                "p95_ms": _percentile(fast, 95) * 1000,
+                "p99_ms": _percentile(fast, 99) * 1000,
+                "slow_requests": len(slow),
+            }
+        finally:
+            proc.terminate()
+            proc.wait()
+        port += 1
+    return results
+
+# --------------------
+# Cold start: launch to first response
+# --------------------
+def _first_response_sec(host, port, path, auth, timeout=120):
+    # Polls until `path` answers 200; returns the seconds that took.
+    t0 = time.perf_counter()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+            conn.request("GET", path, headers={"Authorization": auth})
+            status = conn.getresponse().status
+            conn.close()
+            if status == 200:
+                return time.perf_counter() - t0
+        except OSError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"no 200 from {path} within {timeout} s")
+
+def benchmark_cold_start(xml_path, scale=20, runs=3, port=8200):
+    # Launch to first served GET /transactions/1, starting from the XML backup
+    # (repeated `scale` times), a JSON snapshot or a binary snapshot of it.
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        xml = os.path.join(tmp, "backup.xml")
+        results["records"] = scale_xml(xml_path, xml, scale)
+        data_dsa.load_from_xml_streaming(xml)
+        snapshots = {"json": os.path.join(tmp, api_server.JSON_SNAPSHOT),
+                     "binary": os.path.join(tmp, api_server.BINARY_SNAPSHOT)}
+        for path in snapshots.values():
+            data_dsa.snapshot_store(path)
+        data_dsa.store.clear()
+        for source in ("xml", "json", "binary"):
+            times = []
+            for _ in range(runs):
+                with tempfile.TemporaryDirectory(dir=tmp) as cwd:
+                    os.link(xml, os.path.join(cwd, api_server.XML_FILE))
+                    if source in snapshots:
+                        os.link(snapshots[source], os.path.join(cwd, os.path.basename(snapshots[source])))
+                    # The scaled backup repeats every message, so dedup would fold it back to one copy.
+                    cmd = [sys.executable, SERVER, "--port", str(port), "--dashboard-interval", "0", "--no-dedup"]
+                    t0 = time.perf_counter()
+                    proc = subprocess.Popen(cmd, cwd=cwd, env=_server_env(), stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.DEVNULL)
+                    try:
+                        _first_response_sec(api_server.HOST, port, "/transactions/1", AUTH)
+                        times.append(time.perf_counter() - t0)
+                    finally:
+                        proc.terminate()
+                        proc.wait()
+                port += 1
+            times.sort()
+            results[source] = {"file_mb": os.path.getsize(snapshots.get(source, xml)) / (1024 * 1024),
+                               "min_sec": times[0], "median_sec": times[len(times) // 2]}
+    return results
+
+# --------------------
+# Per-request auth cost
+# --------------------
+def benchmark_auth(calls=20_000, hash_calls=5):
+    # Per-request cost of authenticate() in us: the plaintext check it used to
+    # do, a PBKDF2 check on every request, a cached Basic header and a bearer
+    # token; plus the one cache miss a new header pays.
+    class _Request:
+        def __init__(self, header):
+            self.headers = {"Authorization": header}
+            self.client_address = ("127.0.0.1", 0)
+
+    plain = {"group4": {"password": "member", "role": "admin"}}
+
+    def plaintext(handler):
+        username, password = api_server.parse_basic_auth(handler.headers.get("Authorization"))
+        if username in plain and plain[username]["password"] == password:
+            return username, plain[username]["role"]
+        return None, None
+
+    def per_request(handler):
+        return api_server.check_credentials(*api_server.parse_basic_auth(handler.headers.get("Authorization")))
+
+    basic = _Request(AUTH)
+    token = api_server.token_store.issue("group4", "admin")
+    bearer = _Request("Bearer " + token)
+    api_server.auth_cache.invalidate()
+    t0 = time.perf_counter()
+    api_server.authenticate(basic)
+    result = {"cache_miss_ms": (time.perf_counter() - t0) * 1000}
+    for name, fn, req, n in (("plaintext", plaintext, basic, calls), ("pbkdf2_per_request", per_request, basic, hash_calls),
+                             ("cached", api_server.authenticate, basic, calls),
+                             ("bearer", api_server.authenticate, bearer, calls)):
+        times = []
+        for _ in range(n):
+            t0 = time.perf_counter()
+            fn(req)
+            times.append(time.perf_counter() - t0)
+        times.sort()
+        result[name] = {"calls": n, "p50_us": times[n // 2] * 1e6, "mean_us": sum(times) / n * 1e6}
+    api_server.token_store.revoke(token)
+    result["auth_cache"] = api_server.auth_cache.stats()
+    return result
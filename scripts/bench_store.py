@@ -0,0 +1,469 @@
+import gc
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_DSA_DIR = os.path.join(_ROOT, "DSA")
+if _DSA_DIR not in sys.path:
+    sys.path.append(_DSA_DIR)
+
+import data_dsa
+from data_dsa import (
+    DEDUP_FP_RATE,
+    STORE_BACKENDS,
+    DedupIndex,
+    DictStore,
+    RollupTotals,
+    RWLock,
+    _IdSequence,
+    _query_ids,
+    _rollup_keys,
+    _TXID_RE,
+    dedup_key,
+    iter_xml_records,
+    normalize_transaction,
+)
+
+# One-off store and loader benchmarks, run through scripts/benchmark.py. They
+# work on data_dsa's module state (store, store_lock, next_id) the way the
+# server does, and put back whatever they swap out.
+
+# --------------------
+# Linear search vs dict lookup
+# --------------------
+def benchmark_search(sample_ids, repeats=1000, owner=None, type_=None, filter_repeats=20):
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        for i in sample_ids:
+            _ = data_dsa.linear_search_by_id(i)
+    t1 = time.perf_counter()
+    for _ in range(repeats):
+        for i in sample_ids:
+            _ = data_dsa.dict_lookup_by_id(i)
+    t2 = time.perf_counter()
+    result = {"linear_sec": t1 - t0, "dict_sec": t2 - t1}
+    if owner is not None or type_ is not None:
+        t3 = time.perf_counter()
+        for _ in range(filter_repeats):
+            matches = data_dsa.scan_transactions(owner, type_)
+        t4 = time.perf_counter()
+        for _ in range(filter_repeats):
+            _ = data_dsa.query_transactions(owner, type_)
+        t5 = time.perf_counter()
+        result.update({
+            "filter": {"owner": owner, "type": type_},
+            "filter_matches": len(matches),
+            "scan_filter_sec": t4 - t3,
+            "index_filter_sec": t5 - t4,
+        })
+    return result
+
+def benchmark_lookup(xml_path, samples=20, repeats=500):
+    # benchmark_search over the backup, filtering on the first sample's type.
+    data_dsa.load_from_xml_streaming(xml_path)
+    try:
+        sample_ids = data_dsa.sample_transaction_ids(samples)
+        type_ = data_dsa.dict_lookup_by_id(sample_ids[0])["type"] if sample_ids else None
+        return {"sample_count": len(sample_ids), **benchmark_search(sample_ids, repeats, type_=type_)}
+    finally:
+        with data_dsa.store_lock:
+            data_dsa.store.clear()
+
+# --------------------
+# Tree vs streaming XML load
+# --------------------
+def scale_xml(src_path, dst_path, factor):
+    root_attrs = {}
+    records = [ET.tostring(ET.Element("sms", raw), encoding="unicode")
+               for raw in iter_xml_records(src_path, root_attrs=root_attrs)]
+    root_attrs["count"] = str(len(records) * factor)
+    header = ET.tostring(ET.Element("smses", root_attrs), encoding="unicode")[:-2] + ">\n"
+    with open(dst_path, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        f.write(header)
+        for _ in range(factor):
+            for rec in records:
+                f.write("  " + rec + "\n")
+        f.write("</smses>\n")
+    return len(records) * factor
+
+def _measure_load(loader, xml_path):
+    with data_dsa.store_lock:
+        data_dsa.store.clear()
+        data_dsa.next_id = 1
+    gc.collect()
+    t0 = time.perf_counter()
+    loader(xml_path)
+    sec = time.perf_counter() - t0
+    count = len(data_dsa.store)
+    with data_dsa.store_lock:
+        data_dsa.store.clear()
+    gc.collect()
+    tracemalloc.start()
+    loader(xml_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "sec": sec,
+        "records_per_sec": count / sec if sec else 0.0,
+        "peak_mb": peak / (1024 * 1024),
+    }
+
+def benchmark_load(xml_path, scale=20):
+    with tempfile.TemporaryDirectory() as tmp:
+        scaled = os.path.join(tmp, "scaled.xml")
+        records = scale_xml(xml_path, scaled, scale)
+        result = {
+            "records": records,
+            "xml_mb": os.path.getsize(scaled) / (1024 * 1024),
+            "tree": _measure_load(data_dsa.load_from_xml, scaled),
+            "streaming": _measure_load(data_dsa.load_from_xml_streaming, scaled),
+        }
+    return result
+
+def benchmark_snapshot(xml_path, scale=20):
+    # Startup load of the same records from the XML backup, a JSON snapshot
+    # and a binary snapshot.
+    with tempfile.TemporaryDirectory() as tmp:
+        scaled = os.path.join(tmp, "scaled.xml")
+        json_path = os.path.join(tmp, "snapshot.json")
+        bin_path = os.path.join(tmp, "snapshot.bin")
+        records = scale_xml(xml_path, scaled, scale)
+        data_dsa.load_from_xml_streaming(scaled)
+        data_dsa.snapshot_store(json_path)
+        data_dsa.snapshot_store(bin_path)
+        result = {"records": records}
+        for name, loader, path in (("xml", data_dsa.load_from_xml_streaming, scaled),
+                                   ("json", data_dsa.load_from_json, json_path),
+                                   ("binary", data_dsa.load_from_binary, bin_path)):
+            result[name] = {"file_mb": os.path.getsize(path) / (1024 * 1024), **_measure_load(loader, path)}
+        with data_dsa.store_lock:
+            data_dsa.store.clear()  # drop the records mapping bin_path before it is removed
+    return result
+
+# --------------------
+# Dict vs compact store memory
+# --------------------
+def _synthetic_raws(xml_path, n):
+    templates = list(iter_xml_records(xml_path))
+    for i in range(n):
+        t = templates[i % len(templates)]
+        # Fresh string objects per record, as a parser would hand them over.
+        raw = {k: (v + " ")[:-1] for k, v in t.items()}
+        raw["date"] = str(int(t.get("date") or 0) + i)
+        raw["body"] = f"{t.get('body', '')} #{i}"
+        yield raw
+
+def memory_report(xml_path, n=1_000_000):
+    saved_next_id = data_dsa.next_id
+    result = {"records": n}
+    try:
+        for name, backend in STORE_BACKENDS.items():
+            gc.collect()
+            tracemalloc.start()
+            st = backend()
+            for i, raw in enumerate(_synthetic_raws(xml_path, n), 1):
+                tx = normalize_transaction(raw)
+                tx["id"] = str(i)
+                st.append(tx)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result[name] = {
+                "mb": current / (1024 * 1024),
+                "bytes_per_record": current / n if n else 0.0,
+                "peak_mb": peak / (1024 * 1024),
+            }
+            del st
+    finally:
+        data_dsa.next_id = saved_next_id
+    result["compact_vs_dict"] = result["compact"]["mb"] / result["dict"]["mb"] if result["dict"]["mb"] else 0.0
+    return result
+
+# --------------------
+# List serialization, json.dumps vs cached per-record fragments
+# --------------------
+def _best_of(fn, repeats):
+    best = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        sec = time.perf_counter() - t0
+        best = sec if best is None or sec < best else best
+    return best
+
+def benchmark_fragments(xml_path, sizes=(10_000, 100_000), repeats=3):
+    # "dumps" is the old list path (json.dumps over the record dicts);
+    # "cold" encodes every fragment once (first request after a load),
+    # "warm" only joins cached fragments.
+    saved_next_id = data_dsa.next_id
+    result = {}
+    try:
+        for n in sizes:
+            st = DictStore()
+            for i, raw in enumerate(_synthetic_raws(xml_path, n), 1):
+                tx = normalize_transaction(raw)
+                tx["id"] = str(i)
+                st.append(tx)
+
+            def cold():
+                st.frags = [None] * len(st.frags)
+                b", ".join(st.fragments())
+
+            dumps = _best_of(lambda: json.dumps(list(st), ensure_ascii=False).encode("utf-8"), repeats)
+            cold_sec = _best_of(cold, repeats)
+            warm = _best_of(lambda: b", ".join(st.fragments()), repeats)
+            result[str(n)] = {
+                "dumps_ms": dumps * 1000,
+                "fragments_cold_ms": cold_sec * 1000,
+                "fragments_warm_ms": warm * 1000,
+                "speedup_warm": dumps / warm if warm else 0.0,
+                "fragment_cache_mb": sum(len(f) for f in st.frags) / (1024 * 1024),
+            }
+            del st
+            gc.collect()
+    finally:
+        data_dsa.next_id = saved_next_id
+    return result
+
+# --------------------
+# Mutation throughput (slots + tombstones vs list scan)
+# --------------------
+def _bench_record(i):
+    return {"id": str(i), "type": "payment", "amount": str(i % 5000), "sender": "M-Money", "receiver": "",
+            "timestamp": str(1715351458724 + i * 1000), "owner": "M-Money", "_raw": {}}
+
+def _time_ops(fn, ids):
+    t0 = time.perf_counter()
+    for i in ids:
+        fn(i)
+    sec = time.perf_counter() - t0
+    return len(ids) / sec if sec else 0.0
+
+def benchmark_mutations(sizes=(10_000, 100_000, 1_000_000), ops=2000, list_scan_max=100_000):
+    rng = random.Random(42)
+    result = {}
+    for n in sizes:
+        row = {}
+        for name, backend in STORE_BACKENDS.items():
+            st = backend()
+            for i in range(n):
+                st.append(_bench_record(i))
+            victims = rng.sample(range(n), ops)
+            row[name] = {
+                "replace_per_sec": _time_ops(lambda i: st.replace(_bench_record(i)), victims),
+                "delete_per_sec": _time_ops(lambda i: st.delete(str(i)), victims),
+            }
+            del st
+        if n <= list_scan_max:
+            # The previous layout: find by enumerate, then list.pop(i).
+            records = [_bench_record(i) for i in range(n)]
+            victims = rng.sample(range(n), min(ops, 200))
+
+            def scan_delete(i):
+                target = str(i)
+                for j, tx in enumerate(records):
+                    if tx["id"] == target:
+                        records.pop(j)
+                        break
+            row["list_scan"] = {"delete_per_sec": _time_ops(scan_delete, victims)}
+            del records
+        gc.collect()
+        result[str(n)] = row
+    return result
+
+# --------------------
+# Concurrent readers with a writer (shared vs exclusive store_lock)
+# --------------------
+class _ExclusiveLock(RWLock):
+    # The old behaviour for comparison: readers take the lock exclusively.
+    def read(self):
+        return self
+
+def _concurrency_run(readers, seconds, n):
+    stop = threading.Event()
+    counts = [0] * readers
+    writes = [0]
+    rng = random.Random(7)
+
+    def read_loop(k):
+        r = random.Random(k)
+        done = 0
+        while not stop.is_set():
+            data_dsa.dict_lookup_by_id(str(r.randrange(n)))
+            done += 1
+            if done % 200 == 0:
+                data_dsa.all_transactions()
+            elif done % 20 == 0:
+                data_dsa.page_transactions(limit=100)
+        counts[k] = done
+
+    def write_loop():
+        while not stop.is_set():
+            data_dsa.replace_transaction(_bench_record(rng.randrange(n)))
+            writes[0] += 1
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=read_loop, args=(k,)) for k in range(readers)]
+    threads.append(threading.Thread(target=write_loop))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return {"reads_per_sec": sum(counts) / seconds, "writes_per_sec": writes[0] / seconds}
+
+def benchmark_concurrency(threads=(1, 2, 4, 8), seconds=2.0, n=100_000):
+    # Reader threads mix id lookups, 100-row pages and full list copies while
+    # one writer replaces a record every millisecond. Run once with readers
+    # sharing store_lock and once with the old exclusive lock.
+    saved = data_dsa.store, data_dsa.store_lock, data_dsa.mutation_log
+    result = {}
+    try:
+        data_dsa.store, data_dsa.mutation_log = DictStore(), None
+        for i in range(n):
+            data_dsa.store.append(_bench_record(i))
+        for name, lock_cls in (("shared", RWLock), ("exclusive", _ExclusiveLock)):
+            data_dsa.store_lock = lock_cls()
+            result[name] = {str(k): _concurrency_run(k, seconds, n) for k in threads}
+    finally:
+        data_dsa.store, data_dsa.store_lock, data_dsa.mutation_log = saved
+    return result
+
+# --------------------
+# Rollups vs a full pass
+# --------------------
+def _full_pass_stats(records):
+    # What a dashboard cost before the rollups: every record, every request.
+    totals = RollupTotals()
+    for tx in records:
+        totals.apply(*_rollup_keys(tx), 1)
+    return totals.summary()
+
+def benchmark_rollups(sizes=(10_000, 100_000, 1_000_000), repeats=5):
+    result = {}
+    for n in sizes:
+        row = {}
+        for label, keep in (("append_per_sec_no_rollups", False), ("append_per_sec", True)):
+            st = DictStore()
+            if not keep:
+                del st.indexes["rollup"]
+            t0 = time.perf_counter()
+            for i in range(n):
+                st.append(_bench_record(i))
+            row[label] = n / (time.perf_counter() - t0)
+        rollups = st.indexes["rollup"]
+        row["full_pass_ms"] = _best_of(lambda: _full_pass_stats(st), 1 if n >= 1_000_000 else repeats) * 1000
+        row["rollup_read_ms"] = _best_of(lambda: rollups.totals().summary(), repeats) * 1000
+        row["distinct_days"] = len(rollups.total.cells["day"])
+        result[str(n)] = row
+        del st, rollups
+    return result
+
+# --------------------
+# Full-text search
+# --------------------
+SEARCH_QUERIES = ("samuel carter", "carte", '"jane smith"', "airtime token", "bundle")
+
+def benchmark_text_search(xml_path, sizes=(10_000, 100_000, 1_000_000), repeats=50):
+    # Append throughput with and without the text index, its size, and ?q=
+    # latency: first 100-record page (p50 of `repeats`) and all matches.
+    saved = data_dsa.store
+    result = {}
+    try:
+        for n in sizes:
+            ids = _IdSequence()
+            txs = [normalize_transaction(raw, ids) for raw in _synthetic_raws(xml_path, n)]
+            row = {}
+            for label, keep in (("append_per_sec_no_text_index", False), ("append_per_sec", True)):
+                st = DictStore()
+                if not keep:
+                    del st.indexes["text"]
+                gc.collect()
+                t0 = time.perf_counter()
+                for tx in txs:
+                    st.append(tx)
+                row[label] = n / (time.perf_counter() - t0)
+            del txs
+            data_dsa.store = st
+            row["index"] = st.indexes["text"].report()
+            tail = next((str(tx["txid"])[-6:] for tx in itertools.islice(st, n // 2, None) if tx.get("txid")), "")
+            row["queries"] = {}
+            for q in SEARCH_QUERIES + ((tail,) if tail else ()):
+                times = []
+                for _ in range(repeats):
+                    t0 = time.perf_counter()
+                    data_dsa.page_transactions(q=q, limit=100)
+                    times.append(time.perf_counter() - t0)
+                times.sort()
+                t0 = time.perf_counter()
+                matches = len(_query_ids(None, None, None, None, q))
+                row["queries"][q] = {"matches": matches, "page_p50_ms": times[len(times) // 2] * 1000,
+                                     "all_ids_ms": (time.perf_counter() - t0) * 1000}
+            result[str(n)] = row
+            del st
+    finally:
+        data_dsa.store = saved
+    return result
+
+# --------------------
+# Dedup across overlapping backups
+# --------------------
+def _overlapping_raws(xml_path, start, n):
+    # Messages start..start+n-1: sample messages with the date shifted and any
+    # TxId replaced by one unique to the message number, so two ranges share
+    # exactly the messages they overlap on.
+    templates = list(iter_xml_records(xml_path))
+    for i in range(start, start + n):
+        t = templates[i % len(templates)]
+        body = _TXID_RE.sub(lambda m: m.group(0)[:m.start(1) - m.start()] + str(10 ** 11 + i), t.get("body", ""))
+        yield {**t, "date": str(int(t.get("date") or 0) + i), "body": body}
+
+def benchmark_dedup(xml_path, sizes=(100_000, 1_000_000), overlap=0.5, fp_rate=DEDUP_FP_RATE):
+    # Two backups of n messages sharing `overlap` of them. Keys are derived
+    # once (key_us) and fed to an in-memory set, the on-disk table, and the
+    # table behind a Bloom filter sized for both backups.
+    result = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            second_start = int(n * (1 - overlap))
+            t0 = time.perf_counter()
+            first = [dedup_key(raw) for raw in _overlapping_raws(xml_path, 0, n)]
+            key_us = (time.perf_counter() - t0) / n * 1e6
+            second = [dedup_key(raw) for raw in _overlapping_raws(xml_path, second_start, n)]
+            row = {"key_us": key_us, "expected_duplicates": n - second_start,
+                   "key_collision_probability": (2 * n) ** 2 / 2 ** 65}
+            for label, bloom in (("set", None), ("table", 0), ("table_bloom", 2 * n)):
+                gc.collect()
+                if bloom is None:
+                    seen = set()
+                    add = lambda k: k not in seen and not seen.add(k)
+                else:
+                    index = DedupIndex(os.path.join(tmp, f"{label}_{n}.idx"), bloom, fp_rate)
+                    add = index.add
+                t0 = time.perf_counter()
+                for k in first:
+                    add(k)
+                t1 = time.perf_counter()
+                dups = sum(not add(k) for k in second)
+                if bloom is not None:
+                    index.flush()
+                t2 = time.perf_counter()
+                entry = {"first_per_sec": n / (t1 - t0), "second_per_sec": n / (t2 - t1), "duplicates": dups}
+                if bloom is not None:
+                    stats = index.stats()
+                    entry["file_mb"] = stats["file_bytes"] / (1024 * 1024)
+                    if "bloom" in stats:
+                        entry["bloom"] = stats["bloom"]
+                    index.close()
+                row[label] = entry
+            result[str(n)] = row
+    return result
@@ -0,0 +1,325 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from itertools import islice
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_DSA_DIR = os.path.join(_ROOT, "DSA")
+if _DSA_DIR not in sys.path:
+    sys.path.append(_DSA_DIR)
+
+import bench_api
+import bench_store
+import data_dsa
+from synth_sms import write_smses
+
+# --------------------
+# Config
+# --------------------
+SIZES = (10_000, 100_000, 1_000_000, 10_000_000)
+DEFAULT_SIZES = (10_000, 100_000)
+CALLS = 2_000  # timed calls per per-call case
+WARMUP_CALLS = 200
+RUNS = 3  # timed runs per whole-store case (ingest, full filters, list/snapshot encoding)
+WARMUP_RUNS = 1
+CASE_BUDGET_SEC = 10.0  # a case stops early past this, once it has MIN_SAMPLES
+MIN_SAMPLES = 20
+REGRESSION_THRESHOLD = 0.20  # p50 slower than the baseline by more than this is flagged
+PAGE = 100
+SAMPLE_XML = os.path.join(_ROOT, "tests", "modified_sms_v2 (1).xml")
+
+# --------------------
+# Timing
+# --------------------
+def time_calls(fn, inputs, warmup=WARMUP_CALLS, budget=CASE_BUDGET_SEC):
+    # Seconds per call of fn(*args) for each args tuple, after `warmup` untimed
+    # calls. Calls that scale with the store (owner pages at 10M records) stop
+    # at the time budget instead of running every input.
+    clock = time.perf_counter
+    deadline = clock() + budget / 10
+    for args in islice(inputs, warmup):
+        fn(*args)
+        if clock() > deadline:
+            break
+    samples = []
+    deadline = clock() + budget
+    for args in inputs[warmup:]:
+        t0 = clock()
+        fn(*args)
+        t1 = clock()
+        samples.append(t1 - t0)
+        if t1 > deadline and len(samples) >= MIN_SAMPLES:
+            break
+    return samples
+
+def time_runs(fn, runs=RUNS, warmup=WARMUP_RUNS):
+    clock = time.perf_counter
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(runs):
+        t0 = clock()
+        fn()
+        samples.append(clock() - t0)
+    return samples
+
+def _percentile(sorted_values, p):
+    # Nearest-rank percentile of an ascending list.
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+def summarize(samples, items=1):
+    # Latency stats in ms; `items` is how many records one sample handled.
+    s = sorted(samples)
+    p50 = _percentile(s, 50)
+    return {
+        "samples": len(s),
+        "min_ms": s[0] * 1000,
+        "mean_ms": sum(s) / len(s) * 1000,
+        "p50_ms": p50 * 1000,
+        "p95_ms": _percentile(s, 95) * 1000,
+        "p99_ms": _percentile(s, 99) * 1000,
+        "max_ms": s[-1] * 1000,
+        "items_per_sec": items / p50 if p50 else 0.0,
+    }
+
+# --------------------
+# Cases
+# --------------------
+# Each case runs against the store the ingest case loaded and returns
+# {name: summary}. Mutations run last; they delete records and add them back.
+def bench_ingest(xml_path, n, runs, warmup):
+    samples = time_runs(lambda: data_dsa.load_from_xml_streaming(xml_path), runs, warmup)
+    return {"ingest": summarize(samples, n)}
+
+def bench_normalize(xml_path, rng, calls):
+    raws = [(raw, data_dsa._IdSequence()) for raw in islice(data_dsa.iter_xml_records(xml_path), calls + WARMUP_CALLS)]
+    rng.shuffle(raws)
+    return {"normalize": summarize(time_calls(data_dsa.normalize_transaction, raws))}
+
+def bench_lookup(ids, rng, calls):
+    hits = [(rng.choice(ids),) for _ in range(calls + WARMUP_CALLS)]
+    misses = [(f"missing-{i}",) for i in range(calls + WARMUP_CALLS)]
+    return {
+        "lookup_hit": summarize(time_calls(data_dsa.dict_lookup_by_id, hits)),
+        "lookup_miss": summarize(time_calls(data_dsa.dict_lookup_by_id, misses)),
+    }
+
+def bench_filter(ids, rng, calls, runs, warmup):
+    first = data_dsa.dict_lookup_by_id(ids[0])
+    type_, owner = first["type"], first["owner"]
+    times = sorted(data_dsa.parse_epoch_ms(data_dsa.dict_lookup_by_id(i)["timestamp"]) or 0
+                   for i in rng.sample(ids, min(len(ids), 1000)))
+    day = 86_400_000
+    ranges = [(None, None, t, t + day, PAGE) for t in (rng.choice(times) for _ in range(calls + WARMUP_CALLS))]
+    matches = len(data_dsa.query_transactions(type_=type_))
+    return {
+        "filter_type_full": summarize(time_runs(lambda: data_dsa.query_transactions(type_=type_), runs, warmup),
+                                      matches),
+        "filter_type_page": summarize(time_calls(data_dsa.page_transactions,
+                                                 [(None, type_, None, None, PAGE)] * (calls + WARMUP_CALLS))),
+        "filter_owner_page": summarize(time_calls(data_dsa.page_transactions,
+                                                  [(owner, None, None, None, PAGE)] * (calls + WARMUP_CALLS))),
+        "filter_time_range_page": summarize(time_calls(data_dsa.page_transactions, ranges)),
+    }
+
+def bench_serialize(ids, rng, calls, runs, warmup, tmp):
+    n = len(ids)
+    records = [(data_dsa.dict_lookup_by_id(rng.choice(ids)),) for _ in range(calls + WARMUP_CALLS)]
+    json_path, bin_path = os.path.join(tmp, "snapshot.json"), os.path.join(tmp, "snapshot.bin")
+    return {
+        "encode_record": summarize(time_calls(data_dsa.encode_record, records)),
+        "encode_list": summarize(time_runs(lambda: b",".join(data_dsa.transaction_fragments()), runs, warmup), n),
+        "snapshot_json": summarize(time_runs(lambda: data_dsa.snapshot_store(json_path), runs, warmup), n),
+        "snapshot_binary": summarize(time_runs(lambda: data_dsa.snapshot_store(bin_path), runs, warmup), n),
+    }
+
+def bench_mutation(ids, rng, calls):
+    picked = rng.sample(ids, min(len(ids), calls + WARMUP_CALLS))
+    originals = [data_dsa.dict_lookup_by_id(i) for i in picked]
+    updates = [({**tx, "amount": str(rng.randint(100, 500_000))},) for tx in originals]
+    result = {"replace": summarize(time_calls(data_dsa.replace_transaction, updates))}
+    result["delete"] = summarize(time_calls(data_dsa.remove_transaction, [(i,) for i in picked]))
+    result["insert"] = summarize(time_calls(data_dsa.add_transaction, [(tx,) for tx in originals]))
+    return result
+
+def run_size(n, data_dir, seed=0, calls=CALLS, runs=RUNS, warmup=WARMUP_RUNS):
+    xml_path = os.path.join(data_dir, f"smses_{n}_seed{seed}.xml")
+    if not os.path.exists(xml_path):
+        write_smses(xml_path, n, seed)
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory(dir=data_dir) as tmp:
+        results = bench_ingest(xml_path, n, runs, warmup)
+        ids = [tx["id"] for tx in data_dsa.store]
+        for case in (
+            lambda: bench_normalize(xml_path, rng, calls),
+            lambda: bench_lookup(ids, rng, calls),
+            lambda: bench_filter(ids, rng, calls, runs, warmup),
+            lambda: bench_serialize(ids, rng, calls, runs, warmup, tmp),
+            lambda: bench_mutation(ids, rng, calls),
+        ):
+            gc.collect()
+            results.update(case())
+        with data_dsa.store_lock:
+            data_dsa.store.clear()  # also drops the records mapping the binary snapshot
+    return results
+
+# --------------------
+# Baseline comparison
+# --------------------
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    # Cases whose p50 moved by more than `threshold` against the baseline.
+    report = {"threshold": threshold, "regressions": [], "improvements": []}
+    for size, cases in results["results"].items():
+        for name, stats in cases.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if not base or not base["p50_ms"]:
+                continue
+            ratio = stats["p50_ms"] / base["p50_ms"]
+            entry = {"size": int(size), "case": name, "baseline_p50_ms": base["p50_ms"],
+                     "p50_ms": stats["p50_ms"], "ratio": ratio}
+            if ratio > 1 + threshold:
+                report["regressions"].append(entry)
+            elif ratio < 1 / (1 + threshold):
+                report["improvements"].append(entry)
+    return report
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run_suite(sizes=DEFAULT_SIZES, data_dir=None, seed=0, calls=CALLS, runs=RUNS, warmup=WARMUP_RUNS,
+              backend="dict"):
+    data_dsa.use_store_backend(backend)
+    owned = data_dir is None
+    data_dir = data_dir or tempfile.mkdtemp(prefix="momo-bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    out = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "backend": backend,
+            "seed": seed,
+            "calls": calls,
+            "runs": runs,
+            "warmup_runs": warmup,
+        },
+        "results": {},
+    }
+    try:
+        for n in sizes:
+            t0 = time.perf_counter()
+            out["results"][str(n)] = run_size(n, data_dir, seed, calls, runs, warmup)
+            print(f"{n} messages: {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+    finally:
+        if owned:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return out
+
+# --------------------
+# One-off comparisons
+# --------------------
+# Each flag runs one comparison from bench_store or bench_api on the sample
+# backup (or --xml) and prints it instead of running the suite.
+def run_one(args):
+    xml = args.xml
+    if args.lookup:
+        return bench_store.benchmark_lookup(xml)
+    if args.load:
+        return bench_store.benchmark_load(xml, args.scale)
+    if args.snapshot:
+        return bench_store.benchmark_snapshot(xml, args.scale)
+    if args.memory:
+        return bench_store.memory_report(xml, args.memory)
+    if args.fragments:
+        return bench_store.benchmark_fragments(xml)
+    if args.mutations:
+        return bench_store.benchmark_mutations()
+    if args.concurrency:
+        return bench_store.benchmark_concurrency()
+    if args.rollups:
+        return bench_store.benchmark_rollups()
+    if args.search is not None:
+        return bench_store.benchmark_text_search(xml, args.search or (10_000, 100_000, 1_000_000))
+    if args.dedup is not None:
+        return bench_store.benchmark_dedup(xml, args.dedup or (100_000, 1_000_000))
+    if args.compare_modes:
+        return bench_api.benchmark_modes(clients=args.clients, seconds=args.seconds, slow_path=args.slow_path)
+    if args.cold_start:
+        return bench_api.benchmark_cold_start(xml, args.cold_start)
+    if args.auth_bench:
+        return bench_api.benchmark_auth()
+    return None
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Store benchmark suite on synthetic MoMo SMS backups")
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                    help=f"messages per run (e.g. {' '.join(map(str, SIZES))})")
+    ap.add_argument("--backend", choices=sorted(data_dsa.STORE_BACKENDS), default="dict")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--calls", type=int, default=CALLS, help="timed calls per lookup/filter/mutation case")
+    ap.add_argument("--runs", type=int, default=RUNS, help="timed runs per whole-store case")
+    ap.add_argument("--warmup", type=int, default=WARMUP_RUNS, help="untimed runs before those")
+    ap.add_argument("--data-dir", help="keep generated backups here and reuse them (default: a temp dir)")
+    ap.add_argument("--out", help="write the JSON results here as well as to stdout")
+    ap.add_argument("--baseline", help="results file to compare against; exits 1 on a regression")
+    ap.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    one = ap.add_argument_group("one-off comparisons (print one report and exit)")
+    one.add_argument("--xml", default=SAMPLE_XML, help="backup the comparisons start from")
+    one.add_argument("--lookup", action="store_true", help="linear search vs dict lookup, scan vs indexed filter")
+    one.add_argument("--load", action="store_true", help="tree vs streaming load on the XML repeated --scale times")
+    one.add_argument("--snapshot", action="store_true", help="startup load: XML vs JSON vs binary snapshot (--scale)")
+    one.add_argument("--scale", type=int, default=20)
+    one.add_argument("--memory", type=int, metavar="N", help="tracemalloc dict vs compact store at N records")
+    one.add_argument("--fragments", action="store_true", help="list encoding: json.dumps vs cached fragments, 10k/100k")
+    one.add_argument("--mutations", action="store_true", help="replace/delete throughput at 10k/100k/1M rows")
+    one.add_argument("--concurrency", action="store_true", help="reader threads vs one writer, shared vs exclusive lock")
+    one.add_argument("--rollups", action="store_true", help="dashboard: full pass vs rollup counters, 10k/100k/1M")
+    one.add_argument("--search", type=int, nargs="*", metavar="N",
+                     help="?q= text index: build cost, size and query latency at N records (10k/100k/1M)")
+    one.add_argument("--dedup", type=int, nargs="*", metavar="N",
+                     help="dedup of two overlapping N-message backups: set vs on-disk table vs Bloom + table")
+    one.add_argument("--compare-modes", action="store_true",
+                     help="run the server in each mode under concurrent clients: throughput/latency")
+    one.add_argument("--clients", type=int, default=8)
+    one.add_argument("--seconds", type=float, default=5.0)
+    one.add_argument("--slow-path", default="/transactions", help="endpoint hammered alongside the lookups")
+    one.add_argument("--cold-start", type=int, metavar="SCALE",
+                     help="server launch to first response from XML/JSON/binary at SCALE x the backup")
+    one.add_argument("--auth-bench", action="store_true",
+                     help="authenticate(): plaintext vs PBKDF2 per request vs cached header vs bearer token")
+    args = ap.parse_args()
+    report = run_one(args)
+    if report is not None:
+        print(json.dumps(report, indent=2))
+        sys.exit(0)
+    results = run_suite(args.sizes, args.data_dir, args.seed, args.calls, args.runs, args.warmup, args.backend)
+    regressed = False
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            results["comparison"] = compare(results, json.load(f), args.threshold)
+        regressed = bool(results["comparison"]["regressions"])
+        for r in results["comparison"]["regressions"]:
+            print(f"REGRESSION {r['size']} {r['case']}: p50 {r['baseline_p50_ms']:.3f} -> {r['p50_ms']:.3f} ms "
+                  f"(x{r['ratio']:.2f})", file=sys.stderr)
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    sys.exit(1 if regressed else 0)
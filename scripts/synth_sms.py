@@ -0,0 +1,126 @@
+import argparse
+import os
+import random
+import re
+import sys
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from xml.sax.saxutils import escape
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_DSA_DIR = os.path.join(_ROOT, "DSA")
+if _DSA_DIR not in sys.path:
+    sys.path.append(_DSA_DIR)
+
+from data_dsa import iter_xml_records
+
+# --------------------
+# Templates from the sample backup
+# --------------------
+# Every distinct message body in the sample becomes a template: its date/time,
+# amounts and long reference numbers (TxIds, customer codes) turn into slots
+# that are refilled per message, everything else (names, wording, promo text)
+# is kept. Templates are drawn in proportion to how often they occur, so the
+# mix of payments, transfers, deposits, bundles, ... follows the sample.
+SAMPLE_XML = os.path.join(_ROOT, "tests", "modified_sms_v2 (1).xml")
+LOCAL_TZ = timezone(timedelta(hours=2))  # message texts are in Kigali time
+_SLOTS = re.compile(r"(?P<when>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})"
+                    r"|(?P<amount>\d[\d,]*)(?= ?(?:RWF|FRW|Frw))"
+                    r"|(?P<ref>\d{5,})")
+_VARIABLE_ATTRS = ("date", "date_sent", "readable_date", "body")
+
+def _escape(value):
+    return escape(value, {'"': "&quot;"})
+
+def _template(body):
+    # Literal text and (slot, detail) pairs; a zero amount (fees) stays literal.
+    parts, pos = [], 0
+    for m in _SLOTS.finditer(body):
+        if m.group("amount") == "0":
+            continue
+        parts.append(body[pos:m.start()])
+        if m.group("when"):
+            parts.append(("when", None))
+        elif m.group("amount"):
+            parts.append(("amount", "," in m.group("amount")))
+        else:
+            parts.append(("ref", len(m.group("ref"))))
+        pos = m.end()
+    parts.append(body[pos:])
+    return tuple(parts)
+
+def load_templates(sample=SAMPLE_XML):
+    # [(weight, attribute prefix, body parts)], plus the first message date.
+    counts, attrs, first = Counter(), {}, None
+    for raw in iter_xml_records(sample):
+        if "body" not in raw:
+            continue
+        key = _template(raw["body"])
+        counts[key] += 1
+        attrs.setdefault(key, raw)
+        if first is None and raw.get("date", "").isdigit():
+            first = int(raw["date"])
+    templates = []
+    for key, n in counts.most_common():
+        fixed = "".join(f' {k}="{_escape(v)}"' for k, v in attrs[key].items() if k not in _VARIABLE_ATTRS)
+        templates.append((n, fixed, key))
+    return templates, first or 1715351458724
+
+# --------------------
+# Generator
+# --------------------
+def _amount(rng, commas):
+    value = round(10 ** rng.uniform(2, 5.7), -2) or 100
+    return f"{value:,.0f}" if commas else f"{value:.0f}"
+
+def _readable(dt):
+    return f"{dt.day} {dt:%b %Y} {dt.hour % 12 or 12}:{dt:%M:%S %p}"
+
+def iter_sms_lines(n, seed=0, sample=SAMPLE_XML, gap_ms=60_000):
+    # `n` <sms .../> lines, oldest first, `gap_ms` apart on average.
+    rng = random.Random(seed)
+    templates, date = load_templates(sample)
+    weights = list(accumulate(t[0] for t in templates))
+    for _ in range(n):
+        _, fixed, parts = rng.choices(templates, cum_weights=weights)[0]
+        date += 1 + int(rng.expovariate(1 / gap_ms))
+        dt = datetime.fromtimestamp(date / 1000, LOCAL_TZ)
+        sent = date - rng.randint(1_000, 9_000)
+        out = []
+        for part in parts:
+            if type(part) is str:
+                out.append(part)
+            elif part[0] == "when":
+                out.append(datetime.fromtimestamp(sent // 1000, LOCAL_TZ).strftime("%Y-%m-%d %H:%M:%S"))
+            elif part[0] == "amount":
+                out.append(_amount(rng, part[1]))
+            else:
+                out.append(str(rng.randrange(10 ** (part[1] - 1), 10 ** part[1])))
+        body = _escape("".join(out))
+        yield (f'  <sms{fixed} date="{date}" date_sent="{sent // 1000 * 1000}" body="{body}"'
+               f' readable_date="{_readable(dt)}" />\n')
+
+def write_smses(path, n, seed=0, sample=SAMPLE_XML):
+    # Writes a backup of `n` messages to `path` and returns `n`.
+    rng = random.Random(seed)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        f.write(f'<smses count="{n}" backup_set="{uuid.UUID(int=rng.getrandbits(128))}" '
+                f'backup_date="{1737023646162 + seed}" type="full">\n')
+        f.writelines(iter_sms_lines(n, seed, sample))
+        f.write("</smses>\n")
+    os.replace(tmp, path)
+    return n
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Synthetic MoMo SMS backup modelled on the sample messages")
+    ap.add_argument("out", help="XML file to write")
+    ap.add_argument("-n", "--count", type=int, default=10_000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--sample", default=SAMPLE_XML, help="backup whose messages serve as templates")
+    args = ap.parse_args()
+    write_smses(args.out, args.count, args.seed, args.sample)
+    print(f"Wrote {args.count} messages to {args.out} ({os.path.getsize(args.out) / (1024 * 1024):.1f} MB)")
@@ -1,15 +1,354 @@
+from array import array
+import base64
+import functools
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+import gc
+import hashlib
+import heapq
+import itertools
 import json
+import math
+import mmap
+import os
+import pstats
+import re
+import struct
+import sys
+import tempfile
 import threading
 import time
+import tracemalloc
 import xml.etree.ElementTree as ET
 
+# The SMS body extraction engine lives in etl/; data_dsa.py still works on its
+# own (e.g. copied next to api_server.py) and then only copies XML attributes.
+_ETL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "etl")
+if os.path.isdir(_ETL_DIR) and _ETL_DIR not in sys.path:
+    sys.path.append(_ETL_DIR)
+try:
+    from clean_normalize import categorize
+    from parse_xml import extract as extract_sms_fields
+except ImportError:
+    categorize = extract_sms_fields = None
+
+# --------------------
+# Metrics
+# --------------------
+# Prometheus-style histograms behind GET /metrics (see api_server): store_lock
+# wait and hold times, and how long loads, snapshots, reloads and ingests take.
+# Recording is a bisect and a few adds under a small lock, cheap enough to
+# leave on.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOCK_BUCKETS = (1e-06, 5e-06, 1e-05, 5e-05, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+OPERATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+class Histogram:
+    # Count per upper bound (le, inclusive) plus one past the last, with sum and count.
+    __slots__ = ("bounds", "counts", "sum", "count", "lock")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.add(value)
+
+    def add(self, value):
+        # observe() for callers that already serialize their updates.
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        # (cumulative counts per bound and +Inf, sum, count)
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        return list(itertools.accumulate(counts)), total, count
+
+    def quantile(self, q):
+        # Estimate, interpolating linearly inside the bucket (as
+        # histogram_quantile does); the last finite bound if it falls past it.
+        cumulative, _, count = self.snapshot()
+        if not count:
+            return 0.0
+        rank = q * count
+        for i, c in enumerate(cumulative[:-1]):
+            if c >= rank:
+                lo = self.bounds[i - 1] if i else 0.0
+                below = cumulative[i - 1] if i else 0
+                inside = c - below
+                return lo + (self.bounds[i] - lo) * ((rank - below) / inside if inside else 1.0)
+        return self.bounds[-1]
+
+operation_seconds = {}  # operation -> Histogram of its durations
+operation_last = {}  # operation -> (seconds, unix time it finished) of the latest run
+
+def record_operation(op, seconds):
+    hist = operation_seconds.get(op)
+    if hist is None:
+        hist = operation_seconds.setdefault(op, Histogram(OPERATION_BUCKETS))
+    hist.observe(seconds)
+    operation_last[op] = (seconds, time.time())
+
+def timed_operation(op):
+    # Decorator: records every call's duration under `op`, failed ones included.
+    # With allocation tracing on (configure_profiling), the outermost traced call
+    # is also run under tracemalloc.
+    def wrap(fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            traced = allocation_tracing and _trace_lock.acquire(blocking=False)
+            if traced:
+                started_tracing = _begin_allocation_trace()
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - t0
+                record_operation(op, seconds)
+                if traced:
+                    _end_allocation_trace(op, seconds, started_tracing)
+
+        return timed
+    return wrap
+
+# --------------------
+# Profiling (opt-in)
+# --------------------
+# cProfile captures are written as .pstats (pstats, snakeviz) plus collapsed
+# stacks, one "caller;callee <microseconds>" line per call path, for
+# flamegraph.pl or speedscope. Allocation captures are tracemalloc snapshots
+# (.tracemalloc, loadable with tracemalloc.Snapshot.load) of the timed
+# operations above: loads, ingests, snapshots, WAL replay and reloads. Nothing
+# is recorded until enabled; api_server samples requests with write_profile.
+PROFILE_DIR = "profiles"
+PROFILE_KEEP = 100  # captures kept, in PROFILE_DIR and in profile_captures
+COLLAPSED_MIN_SEC = 1e-6  # call paths cheaper than this are left out
+TRACEMALLOC_FRAMES = 1  # frames kept per allocation; more gives tracebacks but traces ~3x slower
+TRACEMALLOC_TOP = 15  # allocation sites listed per capture
+
+profile_captures = []  # newest last: what was captured, when, and where the files are
+allocation_tracing = False
+_trace_lock = threading.Lock()  # one allocation capture at a time; nested operations are not traced
+_trace_baseline = threading.local()
+_captures_lock = threading.Lock()
+_profile_seq = itertools.count(1)
+
+def _frame_name(func):
+    filename, lineno, name = func
+    if filename == "~":  # built-in
+        label = name
+    else:
+        label = f"{name} ({os.path.basename(filename)}:{lineno})"
+    return label.replace(";", ",")
+
+def collapsed_stacks(stats, min_sec=COLLAPSED_MIN_SEC):
+    # {"a;b;c": self seconds} from a pstats.Stats. cProfile keeps caller ->
+    # callee edges rather than whole stacks, so a callee's time is split
+    # across its callers in proportion to each edge's cumulative time. That is
+    # approximate for a helper whose callees depend on who called it, and a
+    # function already on the path (recursion) is not descended into again.
+    table = stats.stats  # func -> (primitive calls, calls, self, cumulative, {caller: edge stats})
+    callees = {}
+    for func, (_, _, _, _, callers) in table.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    out = {}
+
+    def walk(func, path, on_path, scale):
+        _, _, tt, _, _ = table[func]
+        path = path + ";" + _frame_name(func) if path else _frame_name(func)
+        if tt * scale >= min_sec:
+            out[path] = out.get(path, 0.0) + tt * scale
+        on_path.add(func)
+        for callee, edge_ct in callees.get(func, ()):
+            callee_ct = table[callee][3]
+            share = scale * edge_ct / callee_ct if callee_ct > 0 else 0.0
+            if callee not in on_path and callee_ct * share >= min_sec:
+                walk(callee, path, on_path, share)
+        on_path.discard(func)
+
+    for func, (_, _, _, _, callers) in table.items():
+        if not callers:
+            walk(func, "", set(), 1.0)
+    return out
+
+def collapsed_lines(stats):
+    # collapsed_stacks as "path <microseconds>" lines, sorted by path.
+    for path, sec in sorted(collapsed_stacks(stats).items()):
+        yield f"{path} {max(1, round(sec * 1e6))}\n"
+
+def _new_capture(kind, label, **fields):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_") or "capture"
+    base = os.path.join(PROFILE_DIR, f"{stamp}-{next(_profile_seq):05d}-{slug}")
+    capture = {"kind": kind, "label": label, "at": time.time(), **fields}
+    return base, capture
+
+def _keep_capture(capture):
+    with _captures_lock:
+        profile_captures.append(capture)
+        dropped = profile_captures[:-PROFILE_KEEP]
+        del profile_captures[:-PROFILE_KEEP]
+    for old in dropped:
+        for path in old["files"]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return capture
+
+def write_profile(profile, label, **fields):
+    # Writes a finished cProfile.Profile as <PROFILE_DIR>/<time>-<n>-<label>.pstats
+    # and .collapsed; returns the capture's entry in profile_captures.
+    base, capture = _new_capture("cprofile", label, **fields)
+    stats = pstats.Stats(profile)
+    stats.dump_stats(base + ".pstats")
+    with open(base + ".collapsed", "w", encoding="utf-8") as f:
+        f.writelines(collapsed_lines(stats))
+    capture["profiled_sec"] = stats.total_tt
+    capture["files"] = [base + ".pstats", base + ".collapsed"]
+    return _keep_capture(capture)
+
+def configure_profiling(directory=None, trace_allocations=None):
+    # Sets where captures are written and whether timed operations run under
+    # tracemalloc (several times slower while on); returns the settings.
+    global PROFILE_DIR, allocation_tracing
+    if directory is not None:
+        PROFILE_DIR = directory
+    if trace_allocations is not None:
+        allocation_tracing = bool(trace_allocations)
+    return {"dir": os.path.abspath(PROFILE_DIR), "trace_allocations": allocation_tracing}
+
+def _begin_allocation_trace():
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+    _trace_baseline.bytes = tracemalloc.get_traced_memory()[0]
+    return started
+
+def _end_allocation_trace(op, seconds, started_tracing):
+    # Called with _trace_lock held; a capture that cannot be written is
+    # dropped rather than failing the operation it measured.
+    try:
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),))
+        if started_tracing:
+            tracemalloc.stop()
+        baseline = _trace_baseline.bytes
+        base, capture = _new_capture("tracemalloc", op, sec=seconds,
+                                     peak_mb=(peak - baseline) / (1024 * 1024),
+                                     retained_mb=(current - baseline) / (1024 * 1024))
+        capture["top"] = [{"at": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+                           "kb": s.size / 1024, "blocks": s.count}
+                          for s in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]]
+        snapshot.dump(base + ".tracemalloc")
+        capture["files"] = [base + ".tracemalloc"]
+        _keep_capture(capture)
+    except OSError:
+        pass
+    finally:
+        if started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        _trace_lock.release()
+
 # --------------------
 # In-memory store and config for parsing
 # --------------------
-store_lock = threading.Lock()
-transactions_list = []  # list[dict]
-transactions_by_id = {}  # id -> dict
+class RWLock:
+    # Shared/exclusive lock. `with lock.read():` admits any number of readers;
+    # `with lock:` is exclusive. Writer preference: once a writer is waiting,
+    # new readers queue behind it, so a steady stream of reads cannot starve
+    # writes. Not reentrant. wait/hold hold histograms of how long each side
+    # waited for the lock and then held it.
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+        self._read_side = _ReadSide(self)
+        self._read_wait, self._write_wait, self._read_hold, self._write_hold = (
+            Histogram(LOCK_BUCKETS) for _ in range(4))
+        self.wait = {"read": self._read_wait, "write": self._write_wait}
+        self.hold = {"read": self._read_hold, "write": self._write_hold}
+        self._read_since = threading.local()
+        self._write_since = 0.0
+
+    def read(self):
+        return self._read_side
+
+    # The histograms are updated under _cond, which serializes them already.
+    def acquire_read(self):
+        clock = time.perf_counter
+        t0 = clock()
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+            t1 = self._read_since.t = clock()
+            self._read_wait.add(t1 - t0)
+
+    def release_read(self):
+        t = time.perf_counter()
+        with self._cond:
+            self._read_hold.add(t - self._read_since.t)
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire(self):
+        clock = time.perf_counter
+        t0 = clock()
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+            self._write_since = clock()
+            self._write_wait.add(self._write_since - t0)
+
+    def release(self):
+        t = time.perf_counter()
+        with self._cond:
+            self._write_hold.add(t - self._write_since)
+            self._writer = False
+            self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class _ReadSide:
+    __slots__ = ("lock",)
+
+    def __init__(self, lock):
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire_read()
+        return self.lock
+
+    def __exit__(self, *exc):
+        self.lock.release_read()
+
+# Readers take store_lock.read(); anything that mutates `store` (or must see
+# no mutation at all, like WAL rotation) takes store_lock exclusively.
+store_lock = RWLock()
 next_id = 1
+ingest_lock = threading.Lock()  # serializes loads/ingests; taken before store_lock
+ingest_state = {}  # backup_set -> {"watermark": epoch_ms or None, "seen": {identity: epoch_ms}}
 
 # Heuristic hints for XML → records parsing.
 RECORD_TAG_CANDIDATES = ["transaction", "sms", "record", "message", "entry", "item", "sms"]
@@ -22,6 +361,824 @@ FIELD_KEYS = {
     "timestamp": ["timestamp", "time", "date", "datetime", "created_at", "readable_date"],
     "owner": ["owner", "user", "account", "username"],
 }
+# Typed details pulled from MoMo SMS bodies, kept next to the core fields.
+DETAIL_FIELDS = ["category", "fee", "balance", "txid", "counterparty", "counterparty_phone", "occurred_at"]
+
+# --------------------
+# Secondary indexes
+# --------------------
+class HashIndex:
+    # field value -> ids. Each bucket is a dict used as an insertion-ordered
+    # set, so add/remove are O(1) and a bucket lists ids in arrival order.
+    # A replace that moves a record into a bucket appends it out of store
+    # order; such buckets are noted in `unordered` and re-sorted by sequence
+    # number the next time a query walks them.
+    def __init__(self, field):
+        self.field = field
+        self.buckets = {}
+        self.unordered = set()
+
+    def add(self, tx):
+        self.buckets.setdefault(tx.get(self.field, ""), {})[tx["id"]] = None
+
+    def remove(self, tx):
+        key = tx.get(self.field, "")
+        bucket = self.buckets.get(key)
+        if bucket is not None:
+            bucket.pop(tx["id"], None)
+            if not bucket:
+                del self.buckets[key]
+
+    def update(self, old, new):
+        if old.get(self.field, "") != new.get(self.field, ""):
+            self.remove(old)
+            self.add(new)
+            self.unordered.add(new.get(self.field, ""))
+
+    def ids(self, value):
+        return self.buckets.get(value, {})
+
+    def ordered_ids(self, value, seq_of):
+        # ids(value) in store order. Readers may race to re-sort a bucket;
+        # each swaps in an equal dict, never mutating one being walked.
+        bucket = self.buckets.get(value, {})
+        if value in self.unordered:
+            if bucket:
+                bucket = self.buckets[value] = dict.fromkeys(sorted(bucket, key=seq_of))
+            self.unordered.discard(value)
+        return bucket
+
+    def clear(self):
+        self.buckets.clear()
+        self.unordered.clear()
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+def parse_epoch_ms(value, end_of_day=False):
+    # Epoch milliseconds, or an ISO date/datetime (naive values are taken as UTC).
+    # A bare date used as an upper bound covers the whole day.
+    text = to_str(value)
+    if not text:
+        return None
+    if text.isdigit():
+        return int(text)
+    try:
+        dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    ms = int(dt.timestamp() * 1000)
+    if end_of_day and len(text) == 10:
+        ms += DAY_MS - 1
+    return ms
+
+def tx_epoch_ms(tx):
+    ms = parse_epoch_ms(tx.get("timestamp"))
+    if ms is None:
+        ms = parse_epoch_ms((tx.get("_raw") or {}).get("date"))
+    return ms
+
+class TimeIndex:
+    # Records ordered by epoch ms, split into per-day buckets of sorted
+    # (epoch_ms, id) pairs. A range query bisects the sorted day keys, then
+    # the first/last buckets, and walks the rest: O(log N + k). Inserts only
+    # shift entries within one day's bucket.
+    def __init__(self):
+        self.day_keys = []
+        self.days = {}
+
+    def add(self, tx):
+        ms = tx_epoch_ms(tx)
+        if ms is None:
+            return
+        day = ms // DAY_MS
+        bucket = self.days.get(day)
+        if bucket is None:
+            bucket = self.days[day] = []
+            insort(self.day_keys, day)
+        insort(bucket, (ms, tx["id"]))
+
+    def remove(self, tx):
+        ms = tx_epoch_ms(tx)
+        if ms is None:
+            return
+        day = ms // DAY_MS
+        bucket = self.days.get(day)
+        if bucket is None:
+            return
+        entry = (ms, tx["id"])
+        i = bisect_left(bucket, entry)
+        if i < len(bucket) and bucket[i] == entry:
+            del bucket[i]
+        if not bucket:
+            del self.days[day]
+            del self.day_keys[bisect_left(self.day_keys, day)]
+
+    def update(self, old, new):
+        if tx_epoch_ms(old) != tx_epoch_ms(new):
+            self.remove(old)
+            self.add(new)
+
+    def entries(self, start=None, end=None, after=None):
+        # (epoch_ms, id) pairs in order; `after` resumes strictly past a pair.
+        lower, find = (None, bisect_left) if start is None else ((start, ""), bisect_left)
+        if after is not None and (lower is None or after >= lower):
+            lower, find = after, bisect_right
+        i = 0 if lower is None else bisect_left(self.day_keys, lower[0] // DAY_MS)
+        j = len(self.day_keys) if end is None else bisect_right(self.day_keys, end // DAY_MS)
+        for day in self.day_keys[i:j]:
+            bucket = self.days[day]
+            lo = 0 if lower is None else find(bucket, lower)
+            hi = len(bucket) if end is None else bisect_left(bucket, (end + 1, ""))
+            for k in range(lo, hi):
+                yield bucket[k]
+
+    def ids(self, start=None, end=None):
+        for _, tx_id in self.entries(start, end):
+            yield tx_id
+
+    def clear(self):
+        self.day_keys.clear()
+        self.days.clear()
+
+ROLLUP_DIMENSIONS = ("type", "day", "owner", "counterparty")
+_DAY_NAMES = {}  # epoch day -> "YYYY-MM-DD"
+
+def _amount_value(value):
+    # Amounts are stored as text ("2000", "1,500", "12.50"); anything else counts as 0.
+    text = to_str(value).replace(",", "")
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return 0
+
+def _day_name(ms):
+    if ms is None:
+        return None
+    day = ms // DAY_MS
+    name = _DAY_NAMES.get(day)
+    if name is None:
+        name = _DAY_NAMES[day] = datetime.fromtimestamp(day * 86400, timezone.utc).date().isoformat()
+    return name
+
+def _rollup_keys(tx):
+    # One key per ROLLUP_DIMENSIONS entry (None: not counted there), and the amount.
+    keys = (tx.get("type", ""), _day_name(tx_epoch_ms(tx)), tx.get("owner", ""), tx.get("counterparty") or None)
+    return keys, _amount_value(tx.get("amount"))
+
+class RollupTotals:
+    # Running count and amount, overall and per key of each dimension. A key
+    # whose count drops to zero is dropped, so the size follows the number of
+    # distinct keys, not the number of records.
+    __slots__ = ("count", "amount", "cells")
+
+    def __init__(self):
+        self.count = 0
+        self.amount = 0
+        self.cells = {d: {} for d in ROLLUP_DIMENSIONS}
+
+    def apply(self, keys, amount, sign):
+        self.count += sign
+        self.amount = self.amount + sign * amount if self.count else 0
+        for dim, key in zip(ROLLUP_DIMENSIONS, keys):
+            if key is None:
+                continue
+            cells = self.cells[dim]
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = [0, 0]
+            cell[0] += sign
+            cell[1] += sign * amount
+            if not cell[0]:
+                del cells[key]
+
+    def summary(self, dims=ROLLUP_DIMENSIONS):
+        out = {"count": self.count, "amount": _round_amount(self.amount)}
+        for dim in dims:
+            out["by_" + dim] = {k: {"count": c, "amount": _round_amount(a)}
+                                for k, (c, a) in sorted(self.cells[dim].items())}
+        return out
+
+def _round_amount(amount):
+    return round(amount, 2) if isinstance(amount, float) else amount
+
+class Rollups:
+    # Store-wide totals plus the same breakdown per owner, so both an admin's
+    # and a single user's dashboard are read straight from the counters. Each
+    # mutation is a fixed number of dict updates (O(1)); a load rebuilds the
+    # rollups in the same pass that fills the store.
+    def __init__(self):
+        self.total = RollupTotals()
+        self.owners = {}
+
+    def _apply(self, tx, sign):
+        keys, amount = _rollup_keys(tx)
+        self.total.apply(keys, amount, sign)
+        owner = keys[2]
+        totals = self.owners.get(owner)
+        if totals is None:
+            totals = self.owners[owner] = RollupTotals()
+        totals.apply(keys, amount, sign)
+        if not totals.count:
+            del self.owners[owner]
+
+    def add(self, tx):
+        self._apply(tx, 1)
+
+    def remove(self, tx):
+        self._apply(tx, -1)
+
+    def update(self, old, new):
+        self.remove(old)
+        self.add(new)
+
+    def totals(self, owner=None):
+        if owner is None:
+            return self.total
+        return self.owners.get(owner) or RollupTotals()
+
+    def clear(self):
+        self.total = RollupTotals()
+        self.owners.clear()
+
+# Full-text search over SMS bodies: an inverted index from each token to the
+# sorted sequence numbers of the records containing it (a record's doc number
+# is its store seq; both count appends since the last clear), plus a trigram
+# index over the token vocabulary, so a term of 3+ characters also matches
+# tokens that contain it ("carte" -> "carter", the tail of a TxId). Deletes
+# and replaces edit the posting lists in place, so hits need no re-check
+# except for quoted phrases.
+SEARCH_MIN_PARTIAL = 3  # shorter terms match whole tokens only
+SEARCH_MERGE_LISTS = 64  # a partial term matching more tokens is merged into one list
+# Tokens are lowercased UTF-8 bytes: every ASCII character other than a
+# letter or digit separates tokens (bytes.translate + split is ~2x a regex).
+_TOKEN_TABLE = bytes(c if c >= 128 or chr(c).isalnum() else 32 for c in range(256)).lower()
+_THOUSANDS_RE = re.compile(rb"(?<=\d),(?=\d{3})")  # "1,500" is one token, "1500"
+_PHRASE_RE = re.compile(r'"([^"]*)"')
+_EMPTY_POSTINGS = array("I")
+
+def _search_tokens(text):
+    data = text.encode("utf-8")
+    if b"," in data:
+        data = _THOUSANDS_RE.sub(b"", data)
+    return set(data.translate(_TOKEN_TABLE).split())
+
+def _trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+def _holds(sorted_arr, value):
+    i = bisect_left(sorted_arr, value)
+    return i < len(sorted_arr) and sorted_arr[i] == value
+
+def search_text(tx):
+    # The SMS body; records created through the API have none and are found
+    # by their parties and type instead. Snapshots written before
+    # _snapshot_record nest the original SMS one _raw deeper per round-trip.
+    raw = tx.get("_raw")
+    body = None
+    while isinstance(raw, (dict, LazyRaw)):
+        body = raw.get("body")
+        if body is not None:
+            break
+        raw = raw.get("_raw")
+    if isinstance(body, str) and body:
+        return body
+    return " ".join(to_str(tx.get(k)) for k in ("type", "sender", "receiver", "counterparty") if tx.get(k))
+
+def parse_search(q):
+    # (terms, phrases) for a ?q= string; quoted parts must also match as written.
+    phrases = [" ".join(p.lower().split()) for p in _PHRASE_RE.findall(q)]
+    terms = sorted(_search_tokens(q.replace('"', " ")))
+    if not terms:
+        raise ValueError("q must contain letters or digits")
+    return terms, [p for p in phrases if p]
+
+def phrase_match(tx, phrases):
+    text = " ".join(search_text(tx).lower().split())
+    return all(p in text for p in phrases)
+
+class TextIndex:
+    def __init__(self):
+        self.postings = {}  # token -> array("I") of doc numbers, ascending
+        self.vocab = []  # token number -> token
+        self.grams = {}  # trigram -> array("I") of token numbers, ascending
+        self.doc_ids = []  # doc number -> id, None once deleted
+        self.docs_by_id = {}
+
+    def _post(self, token, doc):
+        plist = self.postings.get(token)
+        if plist is None:
+            self.postings[token] = array("I", (doc,))
+            n = len(self.vocab)
+            self.vocab.append(token)
+            for g in _trigrams(token):
+                self.grams.setdefault(g, array("I")).append(n)
+        elif not plist or plist[-1] < doc:
+            plist.append(doc)
+        else:
+            insort(plist, doc)  # a replaced record keeps its doc number
+
+    def _unpost(self, token, doc):
+        plist = self.postings.get(token)
+        if plist:
+            i = bisect_left(plist, doc)
+            if i < len(plist) and plist[i] == doc:
+                del plist[i]
+
+    def add(self, tx):
+        # Appends always carry the highest doc number, so known tokens just append.
+        doc = len(self.doc_ids)
+        self.doc_ids.append(tx["id"])
+        self.docs_by_id[tx["id"]] = doc
+        get = self.postings.get
+        for token in _search_tokens(search_text(tx)):
+            plist = get(token)
+            if plist is None:
+                self._post(token, doc)
+            else:
+                plist.append(doc)
+
+    def remove(self, tx):
+        doc = self.docs_by_id.pop(tx["id"], None)
+        if doc is None:
+            return
+        self.doc_ids[doc] = None
+        for token in _search_tokens(search_text(tx)):
+            self._unpost(token, doc)
+
+    def update(self, old, new):
+        before, after = search_text(old), search_text(new)
+        if before == after:
+            return
+        doc = self.docs_by_id[old["id"]]
+        old_tokens, new_tokens = _search_tokens(before), _search_tokens(after)
+        for token in old_tokens - new_tokens:
+            self._unpost(token, doc)
+        for token in new_tokens - old_tokens:
+            self._post(token, doc)
+
+    def clear(self):
+        self.__init__()
+
+    def _term_lists(self, term):
+        # Sorted doc-number arrays whose union is every record matching `term`.
+        if len(term) < SEARCH_MIN_PARTIAL:
+            plist = self.postings.get(term)
+            return [plist] if plist else []
+        grams = sorted((self.grams.get(g, _EMPTY_POSTINGS) for g in _trigrams(term)), key=len)
+        first, rest = grams[0], grams[1:]
+        vocab, postings = self.vocab, self.postings
+        lists = [postings[vocab[n]] for n in first
+                 if all(_holds(g, n) for g in rest) and term in vocab[n] and postings[vocab[n]]]
+        if len(lists) > SEARCH_MERGE_LISTS:
+            lists = [array("I", sorted(set().union(*lists)))]
+        return lists
+
+    def docs(self, terms, after=-1):
+        # Doc numbers above `after` matching every term, ascending. The term
+        # with the fewest postings drives; the others are probed by bisection.
+        per_term = [self._term_lists(t) for t in terms]
+        if not all(per_term):
+            return
+        per_term.sort(key=lambda lists: sum(map(len, lists)))
+        driver, rest = per_term[0], per_term[1:]
+        tails = [map(a.__getitem__, range(bisect_right(a, after), len(a))) for a in driver]
+        last = -1
+        for doc in heapq.merge(*tails) if len(tails) > 1 else tails[0]:
+            if doc == last:
+                continue
+            last = doc
+            if all(any(_holds(a, doc) for a in lists) for lists in rest):
+                yield doc
+
+    def report(self):
+        # Entry counts and approximate bytes held by the index structures.
+        postings = sum(map(len, self.postings.values()))
+        gram_entries = sum(map(len, self.grams.values()))
+        size = sys.getsizeof
+        nbytes = (size(self.postings) + sum(size(t) + size(a) for t, a in self.postings.items())
+                  + size(self.vocab) + size(self.grams) + sum(size(g) + size(a) for g, a in self.grams.items())
+                  + size(self.doc_ids) + size(self.docs_by_id))
+        return {
+            "documents": len(self.docs_by_id),
+            "tokens": len(self.postings),
+            "postings": postings,
+            "trigrams": len(self.grams),
+            "trigram_entries": gram_entries,
+            "bytes": nbytes,
+            "bytes_per_document": nbytes / len(self.docs_by_id) if self.docs_by_id else 0.0,
+        }
+
+INDEXED_FIELDS = ["owner", "type"]
+
+# --------------------
+# Store backends
+# --------------------
+def encode_record(tx):
+    # Same bytes json.dumps(list, ensure_ascii=False) produces per element, so
+    # b"[" + b", ".join(fragments) + b"]" equals encoding the whole list.
+    return json.dumps(tx, ensure_ascii=False).encode("utf-8")
+
+# Both backends keep insertion order and expose the same small API
+# (len/iter/get/append/replace/delete/clear/copy/seq_of/page); `store` is the
+# live one. Each slot also caches its record's encoded JSON (`fragments`),
+# filled on first read and dropped when the record is replaced or deleted.
+# StoreBase keeps the secondary indexes in step with every mutation
+# and stamps each appended record with a sequence number that only grows, so
+# a position in insertion order survives deletes and compaction. `version`
+# counts mutations (and is carried across reloads/backend swaps) so callers
+# can tell whether anything changed.
+class StoreBase:
+    def __init__(self):
+        self.indexes = {f: HashIndex(f) for f in INDEXED_FIELDS}
+        self.indexes["time"] = TimeIndex()
+        self.indexes["rollup"] = Rollups()
+        self.indexes["text"] = TextIndex()
+        self.next_seq = 0
+        self.version = 0
+
+    def append(self, tx):
+        self._append(tx, self.next_seq)
+        self.next_seq += 1
+        self.version += 1
+        for idx in self.indexes.values():
+            idx.add(tx)
+
+    def replace(self, tx):
+        old = self.get(tx["id"])
+        self._replace(tx)
+        self.version += 1
+        for idx in self.indexes.values():
+            idx.update(old, tx)
+
+    def delete(self, tx_id):
+        tx = self._delete(tx_id)
+        if tx is not None:
+            self.version += 1
+            for idx in self.indexes.values():
+                idx.remove(tx)
+        return tx
+
+    def clear(self):
+        self._clear()
+        self.next_seq = 0
+        self.version += 1
+        for idx in self.indexes.values():
+            idx.clear()
+
+    def copy(self):
+        # A read-only view for iteration off-lock; indexes are not carried over.
+        other = self._copy()
+        other.indexes = {}
+        other.next_seq = self.next_seq
+        other.version = self.version
+        return other
+
+    def iter_stored(self):
+        # Records as held, with a _raw loaded from a binary snapshot left
+        # encoded (so saving a snapshot does not decode it).
+        return iter(self)
+
+# Deleting leaves a tombstone in the record's slot instead of shifting
+# everything after it; once tombstones outnumber live rows (and there are at
+# least TOMBSTONE_COMPACT_MIN of them) the slots are compacted in one pass,
+# so replace and delete are O(1) and compaction is amortized O(1).
+TOMBSTONE_COMPACT_MIN = 1024
+
+class DictStore(StoreBase):
+    # Every record is a dict held in an insertion-ordered slot list; `pos`
+    # maps id -> slot, None marks a deleted slot and `seqs` runs parallel to
+    # `slots` (ascending, so a sequence number bisects to its slot).
+    def __init__(self):
+        super().__init__()
+        self.slots = []
+        self.seqs = array("q")
+        self.frags = []
+        self.pos = {}
+        self.dead = 0
+
+    def __len__(self):
+        return len(self.pos)
+
+    def __iter__(self):
+        for tx in self.slots:
+            if tx is not None:
+                yield _resolve_raw(tx)
+
+    def iter_stored(self):
+        for tx in self.slots:
+            if tx is not None:
+                yield tx
+
+    def __contains__(self, tx_id):
+        return tx_id in self.pos
+
+    def get(self, tx_id):
+        i = self.pos.get(tx_id)
+        return None if i is None else _resolve_raw(self.slots[i])
+
+    def seq_of(self, tx_id):
+        return self.seqs[self.pos[tx_id]]
+
+    def _fragment(self, i):
+        # Readers may race to fill a slot; both write the same bytes.
+        frag = self.frags[i]
+        if frag is None:
+            frag = self.frags[i] = encode_record(_resolve_raw(self.slots[i]))
+        return frag
+
+    def fragments(self, ids=None):
+        if ids is None:
+            return [self._fragment(i) for i, tx in enumerate(self.slots) if tx is not None]
+        pos = self.pos
+        return [self._fragment(pos[i]) for i in ids]
+
+    def page(self, after, limit):
+        # Up to `limit` (seq, record) pairs past sequence number `after`.
+        out = []
+        slots, seqs = self.slots, self.seqs
+        for i in range(bisect_right(seqs, after), len(slots)):
+            if slots[i] is not None:
+                out.append((seqs[i], _resolve_raw(slots[i])))
+                if len(out) >= limit:
+                    break
+        return out
+
+    def _append(self, tx, seq):
+        self.pos[tx["id"]] = len(self.slots)
+        self.slots.append(tx)
+        self.seqs.append(seq)
+        self.frags.append(None)
+
+    def _replace(self, tx):
+        i = self.pos[tx["id"]]
+        self.slots[i] = tx
+        self.frags[i] = None
+
+    def _delete(self, tx_id):
+        i = self.pos.pop(tx_id, None)
+        if i is None:
+            return None
+        tx = _resolve_raw(self.slots[i])
+        self.slots[i] = None
+        self.frags[i] = None
+        self.dead += 1
+        if self.dead >= TOMBSTONE_COMPACT_MIN and self.dead > len(self.pos):
+            self._compact()
+        return tx
+
+    def _compact(self):
+        live = [i for i, tx in enumerate(self.slots) if tx is not None]
+        self.slots = [self.slots[i] for i in live]
+        self.seqs = array("q", [self.seqs[i] for i in live])
+        self.frags = [self.frags[i] for i in live]
+        self.pos = {tx["id"]: i for i, tx in enumerate(self.slots)}
+        self.dead = 0
+
+    def _clear(self):
+        self.slots = []
+        self.seqs = array("q")
+        self.frags = []
+        self.pos = {}
+        self.dead = 0
+
+    def _copy(self):
+        # Records are replaced, never mutated in place, so sharing them is safe.
+        other = DictStore()
+        other.slots = list(self.slots)
+        other.seqs = array("q", self.seqs)
+        other.frags = list(self.frags)
+        other.pos = dict(self.pos)
+        other.dead = self.dead
+        return other
+
+CORE_FIELDS = ("type", "amount", "sender", "receiver", "timestamp", "owner")
+INTERN_MAX_LEN = 32  # categorical values ("M-Money", "null", "+250788110381", ...)
+_NOT_INT = -(2 ** 63)  # array slot marker: the original text lives in a side dict
+
+def _compact_value(v):
+    if type(v) is str and len(v) <= INTERN_MAX_LEN:
+        return sys.intern(v)
+    return v
+
+def _as_int(text):
+    # Only canonical integer text round-trips through the int column.
+    if text and (text.isdigit() or (text[0] == "-" and text[1:].isdigit())) and str(int(text)) == text:
+        return int(text)
+    return None
+
+class CompactStore(StoreBase):
+    # Column-oriented: one slot per record across parallel columns. Categorical
+    # strings are interned, amounts and epoch timestamps live in array("q"),
+    # and the detail fields plus _raw are packed as a value tuple against a
+    # shared, interned key tuple ("shape") instead of a dict per record.
+    # Records are materialized back into dicts only when read. Deleted rows
+    # keep their slot with a None id until the next compaction.
+    def __init__(self):
+        super().__init__()
+        self._ids = []
+        self._seq = array("q")
+        self._pos = {}
+        self._dead = 0
+        self._type, self._sender, self._receiver, self._owner = [], [], [], []
+        self._amount = array("q")
+        self._timestamp = array("q")
+        self._text = {}  # (field, id) -> original text for non-integer amount/timestamp
+        self._extra = []  # (shape, values)
+        self._shapes = {}
+        self._frag = []
+
+    def __len__(self):
+        return len(self._pos)
+
+    def __iter__(self):
+        ids = self._ids
+        for row in range(len(ids)):
+            if ids[row] is not None:
+                yield self._materialize(row)
+
+    def iter_stored(self):
+        ids = self._ids
+        for row in range(len(ids)):
+            if ids[row] is not None:
+                yield self._materialize(row, resolve=False)
+
+    def __contains__(self, tx_id):
+        return tx_id in self._pos
+
+    def get(self, tx_id):
+        row = self._pos.get(tx_id)
+        return None if row is None else self._materialize(row)
+
+    def seq_of(self, tx_id):
+        return self._seq[self._pos[tx_id]]
+
+    def _fragment(self, row):
+        frag = self._frag[row]
+        if frag is None:
+            frag = self._frag[row] = encode_record(self._materialize(row))
+        return frag
+
+    def fragments(self, ids=None):
+        if ids is None:
+            return [self._fragment(row) for row, tx_id in enumerate(self._ids) if tx_id is not None]
+        pos = self._pos
+        return [self._fragment(pos[i]) for i in ids]
+
+    def page(self, after, limit):
+        out = []
+        ids, seqs = self._ids, self._seq
+        for row in range(bisect_right(seqs, after), len(ids)):
+            if ids[row] is not None:
+                out.append((seqs[row], self._materialize(row)))
+                if len(out) >= limit:
+                    break
+        return out
+
+    def _shape(self, detail_keys, raw_keys):
+        key = (detail_keys, raw_keys)
+        return self._shapes.setdefault(key, key)
+
+    def _pack(self, tx):
+        tx_id = tx["id"]
+        amount, timestamp = to_str(tx.get("amount")), to_str(tx.get("timestamp"))
+        a, t = _as_int(amount), _as_int(timestamp)
+        if a is None:
+            self._text[("amount", tx_id)] = _compact_value(amount)
+        else:
+            self._text.pop(("amount", tx_id), None)
+        if t is None:
+            self._text[("timestamp", tx_id)] = _compact_value(timestamp)
+        else:
+            self._text.pop(("timestamp", tx_id), None)
+        detail_keys = tuple(k for k in tx if k != "id" and k != "_raw" and k not in CORE_FIELDS)
+        raw = tx.get("_raw") or {}
+        values = tuple(_compact_value(tx[k]) for k in detail_keys)
+        if type(raw) is LazyRaw:
+            # Kept encoded (raw_keys None) until the row is first read.
+            shape = self._shape(detail_keys, None)
+            values += (raw,)
+        else:
+            shape = self._shape(detail_keys, tuple(raw))
+            values += tuple(_compact_value(v) for v in raw.values())
+        return (
+            _compact_value(to_str(tx.get("type"))), _NOT_INT if a is None else a,
+            _compact_value(to_str(tx.get("sender"))), _compact_value(to_str(tx.get("receiver"))),
+            _NOT_INT if t is None else t, _compact_value(to_str(tx.get("owner"))), (shape, values),
+        )
+
+    def _materialize(self, row, resolve=True):
+        tx_id = self._ids[row]
+        a, t = self._amount[row], self._timestamp[row]
+        tx = {
+            "id": tx_id,
+            "type": self._type[row],
+            "amount": self._text[("amount", tx_id)] if a == _NOT_INT else str(a),
+            "sender": self._sender[row],
+            "receiver": self._receiver[row],
+            "timestamp": self._text[("timestamp", tx_id)] if t == _NOT_INT else str(t),
+            "owner": self._owner[row],
+        }
+        (detail_keys, raw_keys), values = self._extra[row]
+        n = len(detail_keys)
+        for k, v in zip(detail_keys, values):
+            tx[k] = v
+        if raw_keys is None:
+            raw = values[n]
+            if resolve:
+                # Repack with the decoded _raw so the next read is the usual path.
+                raw = raw.load()
+                self._extra[row] = (self._shape(detail_keys, tuple(raw)),
+                                    values[:n] + tuple(_compact_value(v) for v in raw.values()))
+            tx["_raw"] = raw
+        else:
+            tx["_raw"] = dict(zip(raw_keys, values[n:]))
+        return tx
+
+    def _append(self, tx, seq):
+        typ, a, sender, receiver, t, owner, extra = self._pack(tx)
+        self._pos[tx["id"]] = len(self._ids)
+        self._ids.append(tx["id"])
+        self._seq.append(seq)
+        self._type.append(typ)
+        self._amount.append(a)
+        self._sender.append(sender)
+        self._receiver.append(receiver)
+        self._timestamp.append(t)
+        self._owner.append(owner)
+        self._extra.append(extra)
+        self._frag.append(None)
+
+    def _replace(self, tx):
+        row = self._pos[tx["id"]]
+        (self._type[row], self._amount[row], self._sender[row], self._receiver[row],
+         self._timestamp[row], self._owner[row], self._extra[row]) = self._pack(tx)
+        self._frag[row] = None
+
+    def _delete(self, tx_id):
+        row = self._pos.get(tx_id)
+        if row is None:
+            return None
+        tx = self._materialize(row)
+        del self._pos[tx_id]
+        self._ids[row] = None
+        self._extra[row] = None
+        self._frag[row] = None
+        self._text.pop(("amount", tx_id), None)
+        self._text.pop(("timestamp", tx_id), None)
+        self._dead += 1
+        if self._dead >= TOMBSTONE_COMPACT_MIN and self._dead > len(self._pos):
+            self._compact()
+        return tx
+
+    def _compact(self):
+        live = [row for row, tx_id in enumerate(self._ids) if tx_id is not None]
+        for name in ("_ids", "_type", "_sender", "_receiver", "_owner", "_extra", "_frag"):
+            col = getattr(self, name)
+            setattr(self, name, [col[row] for row in live])
+        for name in ("_seq", "_amount", "_timestamp"):
+            col = getattr(self, name)
+            setattr(self, name, array("q", [col[row] for row in live]))
+        self._pos = {tx_id: row for row, tx_id in enumerate(self._ids)}
+        self._dead = 0
+
+    def _clear(self):
+        version = self.version
+        self.__init__()
+        self.version = version
+
+    def _copy(self):
+        other = CompactStore()
+        other._ids = list(self._ids)
+        other._seq = array("q", self._seq)
+        other._pos = dict(self._pos)
+        other._type, other._sender = list(self._type), list(self._sender)
+        other._receiver, other._owner = list(self._receiver), list(self._owner)
+        other._amount, other._timestamp = array("q", self._amount), array("q", self._timestamp)
+        other._text = dict(self._text)
+        other._extra = list(self._extra)
+        other._frag = list(self._frag)
+        other._dead = self._dead
+        other._shapes = self._shapes
+        return other
+
+STORE_BACKENDS = {"dict": DictStore, "compact": CompactStore}
+store = DictStore()
+
+def use_store_backend(name):
+    global store
+    new = STORE_BACKENDS[name]()
+    with store_lock:
+        for tx in store:
+            new.append(tx)
+        new.version = store.version + 1
+        store = new
+    return store
 
 def to_str(x):
     return "" if x is None else str(x).strip()
@@ -63,11 +1220,15 @@ def xml_element_to_dict(elem):
         data["text"] = to_str(elem.text)
     return data
 
-def normalize_transaction(raw):
+def normalize_transaction(raw, ids=None):
+    # `ids` is an _IdSequence when building a store generation off to the side;
+    # otherwise missing ids come from the live next_id.
     global next_id
     d = dict(raw)
     rid = pick_first_key(d, FIELD_KEYS["id"])
-    if not rid:
+    if not rid and ids is not None:
+        rid = ids.take()
+    elif not rid:
         rid = str(next_id)
         next_id += 1
     else:
@@ -80,12 +1241,38 @@ def normalize_transaction(raw):
         "receiver": to_str(pick_first_key(d, FIELD_KEYS["receiver"]) or d.get("receiver")),
         "timestamp": to_str(pick_first_key(d, FIELD_KEYS["timestamp"]) or d.get("timestamp")),
         "owner": to_str(pick_first_key(d, FIELD_KEYS["owner"]) or d.get("owner")),
-        "_raw": d,
     }
     if not norm["owner"]:
         norm["owner"] = norm["sender"] or "unknown"
+    fields = extract_sms_fields(d["body"]) if extract_sms_fields and d.get("body") else None
+    if fields:
+        norm["type"] = fields["kind"]
+        fields["category"] = categorize(fields)
+        if not norm["amount"] and "amount" in fields:
+            norm["amount"] = str(fields["amount"])
+    for k in DETAIL_FIELDS:
+        v = fields.get(k) if fields else None
+        if v is None:
+            v = d.get(k)
+        if v is None or v == "":
+            continue
+        norm[k] = v.isoformat(sep=" ") if hasattr(v, "isoformat") else v
+    norm["_raw"] = d
     return norm
 
+def _next_id_after(tx_id, current):
+    try:
+        nid = int(tx_id)
+    except ValueError:
+        return current
+    return nid + 1 if nid >= current else current
+
+def _store_loaded(tx):
+    global next_id
+    store.append(tx)
+    next_id = _next_id_after(tx["id"], next_id)
+
+@timed_operation("load_xml")
 def load_from_xml(xml_path):
     global next_id
     tree = ET.parse(xml_path)
@@ -100,66 +1287,1382 @@ def load_from_xml(xml_path):
     else:
         for elem in list(root):
             records.append(xml_element_to_dict(elem))
-    with store_lock:
-        transactions_list.clear()
-        transactions_by_id.clear()
+    with ingest_lock, store_lock:
+        store.clear()
         next_id = 1
-        for raw in records:
-            tx = normalize_transaction(raw)
-            transactions_list.append(tx)
-            transactions_by_id[tx["id"]] = tx
-            try:
-                nid = int(tx["id"])
-                if nid >= next_id:
-                    next_id = nid + 1
-            except ValueError:
-                pass
+        ingest_state.clear()
+        _reset_dedup()
+        state = _watermark_state(to_str(root.get("backup_set")))
+        for i, raw in enumerate(records, 1):
+            if _first_sighting(raw):
+                _store_loaded(normalize_transaction(raw))
+            _note_ingested(state, raw)
+            if i % STREAM_CHUNK_SIZE == 0:
+                _prune_seen(state)
+        _prune_seen(state)
+        _flush_dedup()
 
+def _snapshot_record(raw, ids=None):
+    # Snapshot entries are stored records already; normalizing one again would
+    # wrap it in a fresh _raw on every round-trip. Anything else (ETL output
+    # with a top-level body, hand-written JSON) is normalized as usual.
+    if "id" in raw and isinstance(raw.get("_raw"), dict):
+        return raw
+    return normalize_transaction(raw, ids)
+
+@timed_operation("load_json")
 def load_from_json(path):
     global next_id
     with open(path, "r", encoding="utf-8") as f:
         data = json.load(f)
-    with store_lock:
-        transactions_list.clear()
-        transactions_by_id.clear()
+    with ingest_lock, store_lock:
+        store.clear()
         next_id = 1
+        ingest_state.clear()  # snapshots carry no backup metadata; see load_ingest_state
         for raw in data:
-            tx = normalize_transaction(raw)
-            transactions_list.append(tx)
-            transactions_by_id[tx["id"]] = tx
-            try:
-                nid = int(tx["id"])
-                next_id = max(next_id, nid + 1)
-            except ValueError:
-                pass
+            _store_loaded(_snapshot_record(raw))
+
+# --------------------
+# Streaming XML loader (iterparse)
+# --------------------
+# Only the first STREAM_PROBE_ELEMENTS closed elements are buffered to infer
+# the record tag; after that every record is normalized as soon as it closes
+# and released, so memory stays flat regardless of the backup size.
+STREAM_PROBE_ELEMENTS = 64
+STREAM_CHUNK_SIZE = 5000
+
+def _pick_record_tag(counts, child_counts):
+    if counts:
+        return max(counts.items(), key=lambda kv: kv[1])[0]
+    if child_counts:
+        return max(child_counts.items(), key=lambda kv: kv[1])[0]
+    return None
+
+def _release(elem, parent, root):
+    elem.clear()
+    if parent is root:
+        parent.remove(elem)
+
+def iter_xml_records(xml_path, probe=STREAM_PROBE_ELEMENTS, root_attrs=None):
+    stack = []
+    pending = []  # (elem, parent, tag) closed before the record tag is known
+    counts, child_counts = {}, {}
+    record_tag = None
+    for event, elem in ET.iterparse(xml_path, events=("start", "end")):
+        if event == "start":
+            if not stack and root_attrs is not None:
+                for k, v in elem.attrib.items():
+                    root_attrs[k.lower()] = to_str(v)
+            stack.append(elem)
+            continue
+        stack.pop()
+        if not stack:
+            break
+        root, parent = stack[0], stack[-1]
+        tag = elem.tag.lower().split("}")[-1]
+        if record_tag is None:
+            if tag in RECORD_TAG_CANDIDATES:
+                counts[tag] = counts.get(tag, 0) + 1
+            if len(stack) == 1:
+                child_counts[tag] = child_counts.get(tag, 0) + 1
+            pending.append((elem, parent, tag))
+            if len(pending) < probe:
+                continue
+            record_tag = _pick_record_tag(counts, child_counts)
+            for p_elem, p_parent, p_tag in pending:
+                if p_tag == record_tag:
+                    yield xml_element_to_dict(p_elem)
+                    _release(p_elem, p_parent, root)
+                elif p_parent is root:
+                    _release(p_elem, p_parent, root)
+            pending = []
+            continue
+        if tag == record_tag:
+            yield xml_element_to_dict(elem)
+            _release(elem, parent, root)
+        elif parent is root:
+            _release(elem, parent, root)
+    if record_tag is None:
+        record_tag = _pick_record_tag(counts, child_counts)
+        for p_elem, _, p_tag in pending:
+            if p_tag == record_tag:
+                yield xml_element_to_dict(p_elem)
+
+def _commit_chunk(txs):
+    with store_lock:
+        for tx in txs:
+            _store_loaded(tx)
+
+@timed_operation("load_xml")
+def load_from_xml_streaming(xml_path, chunk_size=STREAM_CHUNK_SIZE):
+    global next_id
+    with ingest_lock:
+        with store_lock:
+            store.clear()
+            next_id = 1
+        ingest_state.clear()
+        _reset_dedup()
+        root_attrs = {}
+        state = None
+        chunk = []
+        for raw in iter_xml_records(xml_path, root_attrs=root_attrs):
+            if state is None:
+                state = _watermark_state(root_attrs.get("backup_set", ""))
+            if _first_sighting(raw):
+                chunk.append(normalize_transaction(raw))
+            _note_ingested(state, raw)
+            if len(chunk) >= chunk_size:
+                _commit_chunk(chunk)
+                _prune_seen(state)
+                chunk = []
+        if chunk:
+            _commit_chunk(chunk)
+        if state is not None:
+            _prune_seen(state)
+        _flush_dedup()
+
+# --------------------
+# Incremental ingestion (watermark per backup_set)
+# --------------------
+# A backup set remembers the newest SMS date it has ingested plus the
+# identities of messages within INGEST_SLACK_MS of that watermark. On the next
+# backup, anything older than the slack window is skipped without hashing,
+# anything inside it is checked against the identities, and only the rest is
+# normalized and appended, so a daily run costs O(file scan + delta).
+INGEST_SLACK_MS = 24 * 60 * 60 * 1000
+
+def message_identity(raw):
+    key = "\x1f".join((to_str(raw.get("address")), to_str(raw.get("date")), to_str(raw.get("body"))))
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+
+def _sms_date(raw):
+    try:
+        return int(raw.get("date"))
+    except (TypeError, ValueError):
+        return None
+
+def _watermark_state(backup_set):
+    return ingest_state.setdefault(backup_set, {"watermark": None, "seen": {}})
+
+def _note_ingested(state, raw, date=None, ident=None):
+    if date is None:
+        date = _sms_date(raw)
+    wm = state["watermark"]
+    if date is not None and wm is not None and date < wm - INGEST_SLACK_MS:
+        return
+    state["seen"][ident or message_identity(raw)] = date
+    if date is not None and (wm is None or date > wm):
+        state["watermark"] = date
+
+def _prune_seen(state):
+    wm = state["watermark"]
+    if wm is None:
+        return
+    floor = wm - INGEST_SLACK_MS
+    state["seen"] = {k: d for k, d in state["seen"].items() if d is None or d >= floor}
+
+@timed_operation("ingest")
+def ingest_xml_incremental(xml_path, chunk_size=STREAM_CHUNK_SIZE):
+    t0 = time.perf_counter()
+    stats = {"backup_set": None, "scanned": 0, "appended": 0, "skipped": 0, "duplicates": 0}
+    root_attrs = {}
+    with ingest_lock:
+        state = floor = None
+        chunk = []
+        for raw in iter_xml_records(xml_path, root_attrs=root_attrs):
+            if state is None:
+                stats["backup_set"] = root_attrs.get("backup_set", "")
+                state = _watermark_state(stats["backup_set"])
+                if state["watermark"] is not None:
+                    floor = state["watermark"] - INGEST_SLACK_MS
+            stats["scanned"] += 1
+            date = _sms_date(raw)
+            if floor is not None and date is not None and date < floor:
+                stats["skipped"] += 1
+                continue
+            ident = message_identity(raw)
+            if ident in state["seen"]:
+                stats["skipped"] += 1
+                continue
+            if not _first_sighting(raw):
+                # Already ingested from another backup set.
+                stats["duplicates"] += 1
+                _note_ingested(state, raw, date, ident)
+                continue
+            chunk.append(normalize_transaction(raw))
+            _note_ingested(state, raw, date, ident)
+            if len(chunk) >= chunk_size:
+                _commit_chunk(chunk)
+                stats["appended"] += len(chunk)
+                chunk = []
+        if chunk:
+            _commit_chunk(chunk)
+            stats["appended"] += len(chunk)
+        if state is not None:
+            _prune_seen(state)
+            stats["watermark"] = state["watermark"]
+        if dedup_index is not None:
+            dedup_index.flush()
+            stats["dedup"] = dedup_index.stats()
+    stats["sec"] = time.perf_counter() - t0
+    return stats
+
+def save_ingest_state(path):
+    with ingest_lock:
+        data = {bs: {"watermark": st["watermark"], "seen": st["seen"]} for bs, st in ingest_state.items()}
+    tmp = _temp_beside(path)
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except BaseException:
+        _discard_temp(tmp)
+        raise
+
+def load_ingest_state(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    with ingest_lock:
+        for bs, saved in data.items():
+            state = _watermark_state(bs)
+            state["seen"].update(saved.get("seen", {}))
+            wm = saved.get("watermark")
+            if wm is not None and (state["watermark"] is None or wm > state["watermark"]):
+                state["watermark"] = wm
+            _prune_seen(state)
+
+# --------------------
+# Identity dedup across backups
+# --------------------
+# Watermarks only cover one backup set. Overlapping backups, and a new backup
+# set from the same phone, carry the same messages again. Each message gets a
+# 64-bit key: its TxId / Financial Transaction Id when the body has one,
+# otherwise a hash of (address, date, body). Keys live in an open-addressing
+# hash table in a memory-mapped file, so the history survives restarts and
+# costs no heap however long it gets. New keys are buffered and merged into
+# the table in slot order, DEDUP_BATCH at a time.
+# With bloom_capacity set, a Bloom filter sized for that many keys sits in
+# front. A message it has never seen skips the table probe, which on a history
+# larger than the page cache is a random disk read. Its false positives only
+# cost that probe. Only a 64-bit key collision would drop a distinct message:
+# about n^2 / 2^65, or 3e-6 for 10M messages.
+# Loaders consult `dedup_index` when one is open (the API opens it). A full
+# load clears it first, as it does the watermarks; everything runs under
+# ingest_lock.
+DEDUP_MAGIC = b"MOMODDP1"
+BLOOM_MAGIC = b"MOMOBLM1"
+DEDUP_MIN_SLOTS = 1 << 16
+DEDUP_BATCH = 65_536
+DEDUP_FP_RATE = 0.01
+_DEDUP_HEADER = struct.Struct("<8sQQ")
+_BLOOM_HEADER = struct.Struct("<8sQQQ")
+_U64 = struct.Struct("<Q")
+_TXID_RE = re.compile(r"(?:Financial Transaction Id|TxId): ?(\d+)")
+dedup_index = None
+
+def dedup_key(raw):
+    body = to_str(raw.get("body"))
+    m = _TXID_RE.search(body)
+    text = "txid\x1f" + m.group(1) if m else "\x1f".join((to_str(raw.get("address")), to_str(raw.get("date")), body))
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+class BloomFilter:
+    # k bit positions per key by double hashing the (already uniform) 64-bit key.
+    def __init__(self, capacity, fp_rate=DEDUP_FP_RATE):
+        capacity = max(1, capacity)
+        self.bits = max(64, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.data = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        step, m = key >> 32 | 1, self.bits
+        return [(key + i * step) % m for i in range(self.hashes)]
+
+    def add(self, key):
+        data = self.data
+        for p in self._positions(key):
+            data[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        data = self.data
+        for p in self._positions(key):
+            if not data[p >> 3] & 1 << (p & 7):
+                return False
+        return True
+
+    def expected_fp_rate(self):
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_BLOOM_HEADER.pack(BLOOM_MAGIC, self.bits, self.hashes, self.count))
+            f.write(self.data)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        # False (and untouched) unless the file was saved with the same sizing.
+        with open(path, "rb") as f:
+            head = f.read(_BLOOM_HEADER.size)
+            if len(head) < _BLOOM_HEADER.size:
+                return False
+            magic, bits, hashes, count = _BLOOM_HEADER.unpack(head)
+            if (magic, bits, hashes) != (BLOOM_MAGIC, self.bits, self.hashes):
+                return False
+            data = bytearray(f.read())
+        if len(data) != len(self.data):
+            return False
+        self.data, self.count = data, count
+        return True
+
+class DedupIndex:
+    # On-disk hash set of message keys (see above); slot value 0 means empty.
+    def __init__(self, path, bloom_capacity=0, fp_rate=DEDUP_FP_RATE):
+        self.path = path
+        self.bloom_capacity, self.fp_rate = bloom_capacity, fp_rate
+        self.lookups = self.duplicates = self.bloom_skips = self.bloom_false_positives = 0
+        self._pending = set()
+        if not os.path.exists(path):
+            self._create(path, DEDUP_MIN_SLOTS)
+        self._open()
+
+    @staticmethod
+    def _create(path, slots):
+        with open(path, "wb") as f:
+            f.write(_DEDUP_HEADER.pack(DEDUP_MAGIC, slots, 0))
+            f.truncate(_DEDUP_HEADER.size + 8 * slots)
+
+    def _open_table(self):
+        self._f = open(self.path, "r+b")
+        self._mm = mmap.mmap(self._f.fileno(), 0)
+        magic, self.slots, self.count = _DEDUP_HEADER.unpack_from(self._mm, 0)
+        if magic != DEDUP_MAGIC:
+            self._unmap()
+            raise ValueError(f"{self.path}: not a dedup index")
+        self._mask = self.slots - 1
+
+    def _open(self):
+        self._open_table()
+        self.bloom = None
+        if self.bloom_capacity:
+            self.bloom = BloomFilter(self.bloom_capacity, self.fp_rate)
+            bloom_path = self.path + ".bloom"
+            if not (os.path.exists(bloom_path) and self.bloom.load(bloom_path) and self.bloom.count == self.count):
+                self.bloom = BloomFilter(self.bloom_capacity, self.fp_rate)
+                for key in self._keys():
+                    self.bloom.add(key)
+
+    def _unmap(self):
+        self._mm.close()
+        self._f.close()
+
+    def _keys(self):
+        base, step = _DEDUP_HEADER.size, 1 << 16
+        for lo in range(0, self.slots, step):
+            chunk = array("Q")
+            chunk.frombytes(self._mm[base + 8 * lo:base + 8 * min(self.slots, lo + step)])
+            yield from filter(None, _little_endian(chunk))
+
+    def _probe(self, key):
+        # (slot, True) where `key` is stored, or (empty slot, False).
+        mm, mask, unpack, base = self._mm, self._mask, _U64.unpack_from, _DEDUP_HEADER.size
+        i = key & mask
+        while True:
+            v = unpack(mm, base + 8 * i)[0]
+            if v == key:
+                return i, True
+            if not v:
+                return i, False
+            i = (i + 1) & mask
+
+    def __contains__(self, key):
+        return key in self._pending or self._probe(key)[1]
+
+    def __len__(self):
+        return self.count + len(self._pending)
+
+    def add(self, key):
+        # True if `key` is new (and now recorded), False for a duplicate.
+        self.lookups += 1
+        bloom = self.bloom
+        if key in self._pending:
+            self.duplicates += 1
+            return False
+        if bloom is not None and key not in bloom:
+            self.bloom_skips += 1
+        elif self._probe(key)[1]:
+            self.duplicates += 1
+            return False
+        elif bloom is not None:
+            self.bloom_false_positives += 1
+        self._pending.add(key)
+        if bloom is not None:
+            bloom.add(key)
+        if len(self._pending) >= DEDUP_BATCH:
+            self._merge()
+        return True
+
+    def _merge(self):
+        if not self._pending:
+            return
+        need = (self.count + len(self._pending)) * 2
+        if need > self.slots:
+            slots = self.slots
+            while need > slots:
+                slots *= 2
+            self._grow(slots)
+        mask, pack, base = self._mask, _U64.pack_into, _DEDUP_HEADER.size
+        for key in sorted(self._pending, key=lambda k: k & mask):
+            i, found = self._probe(key)
+            if not found:
+                pack(self._mm, base + 8 * i, key)
+                self.count += 1
+        self._pending.clear()
+        _DEDUP_HEADER.pack_into(self._mm, 0, DEDUP_MAGIC, self.slots, self.count)
+
+    def _grow(self, slots):
+        tmp = self.path + ".grow"
+        self._create(tmp, slots)
+        with open(tmp, "r+b") as f, mmap.mmap(f.fileno(), 0) as mm:
+            mask, unpack, pack, base = slots - 1, _U64.unpack_from, _U64.pack_into, _DEDUP_HEADER.size
+            for key in self._keys():
+                i = key & mask
+                while unpack(mm, base + 8 * i)[0]:
+                    i = (i + 1) & mask
+                pack(mm, base + 8 * i, key)
+            _DEDUP_HEADER.pack_into(mm, 0, DEDUP_MAGIC, slots, self.count)
+            mm.flush()
+        self._unmap()
+        os.replace(tmp, self.path)
+        self._open_table()
+
+    def flush(self):
+        self._merge()
+        self._mm.flush()
+        if self.bloom is not None:
+            self.bloom.save(self.path + ".bloom")
+
+    def close(self):
+        self.flush()
+        self._unmap()
+
+    def clear(self):
+        self._pending.clear()
+        self._unmap()
+        self._create(self.path, DEDUP_MIN_SLOTS)
+        if os.path.exists(self.path + ".bloom"):
+            os.remove(self.path + ".bloom")
+        self._open()
+
+    def fresh(self):
+        # An empty index beside this one, for a store generation being built.
+        other = DedupIndex(self.path + ".next", self.bloom_capacity, self.fp_rate)
+        other.clear()
+        return other
+
+    def discard(self):
+        self._unmap()
+        for p in (self.path, self.path + ".bloom"):
+            if os.path.exists(p):
+                os.remove(p)
+
+    def adopt(self, other):
+        # Takes over `other`'s keys (files included); `other` is unusable after.
+        other.close()
+        self._pending.clear()
+        self._unmap()
+        os.replace(other.path, self.path)
+        if os.path.exists(other.path + ".bloom"):
+            os.replace(other.path + ".bloom", self.path + ".bloom")
+        self._open()
+
+    def stats(self):
+        out = {"keys": len(self), "slots": self.slots, "file_bytes": _DEDUP_HEADER.size + 8 * self.slots,
+               "lookups": self.lookups, "duplicates": self.duplicates}
+        if self.bloom is not None:
+            new = self.bloom_skips + self.bloom_false_positives
+            out["bloom"] = {"bits": self.bloom.bits, "hashes": self.bloom.hashes, "bytes": len(self.bloom.data),
+                            "capacity": self.bloom_capacity, "skips": self.bloom_skips,
+                            "false_positives": self.bloom_false_positives,
+                            "fp_rate": self.bloom_false_positives / new if new else 0.0,
+                            "expected_fp_rate": self.bloom.expected_fp_rate()}
+        return out
+
+def open_dedup_index(path, bloom_capacity=0, fp_rate=DEDUP_FP_RATE):
+    global dedup_index
+    with ingest_lock:
+        if dedup_index is not None:
+            dedup_index.close()
+        dedup_index = DedupIndex(path, bloom_capacity, fp_rate)
+    return dedup_index
+
+def close_dedup_index():
+    global dedup_index
+    with ingest_lock:
+        if dedup_index is not None:
+            dedup_index.close()
+            dedup_index = None
+
+def _first_sighting(raw):
+    # True unless the open dedup index has seen this message before.
+    return dedup_index is None or dedup_index.add(dedup_key(raw))
+
+def _reset_dedup():
+    if dedup_index is not None:
+        dedup_index.clear()
+
+def _flush_dedup():
+    if dedup_index is not None:
+        dedup_index.flush()
+
+# Snapshot writers (compaction, ingest, shutdown) take _snapshot_lock around
+# both the store copy and the write, so a snapshot on disk is never replaced
+# by one copied earlier. Each write goes to its own temp file beside the
+# target and is renamed into place.
+_snapshot_lock = threading.Lock()
+
+def _temp_beside(path):
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                               dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    return tmp
+
+def _discard_temp(tmp):
+    try:
+        os.remove(tmp)
+    except OSError:
+        pass
+
+def _write_snapshot(path, records):
+    tmp = _temp_beside(path)
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        _discard_temp(tmp)
+        raise
 
 def snapshot_to_json(path):
+    # A store copy is cheap (references/arrays, no per-record work), so the
+    # lock is only held for that; records are materialized and dumped off-lock.
+    with _snapshot_lock:
+        with store_lock.read():
+            view = store.copy()
+        _write_snapshot(path, list(view))
+
+@timed_operation("snapshot")
+def save_snapshot(path, view):
+    # Binary for a .bin path, JSON otherwise; `view` is a store copy.
+    if path.endswith(".bin"):
+        write_binary_snapshot(path, view.iter_stored())
+    else:
+        _write_snapshot(path, list(view))
+
+# --------------------
+# Binary snapshots
+# --------------------
+# Layout (little-endian):
+#   header   magic, record count, string count, string table offset, index offset
+#   records  per record: u32 length, then 7 u32 string-table refs for id and
+#            CORE_FIELDS, u32 length of a JSON object with the detail fields,
+#            u16 count of _raw key/value pairs, that JSON, then the _raw: the
+#            pairs as u32 string-table refs, or (count 0xFFFF) JSON in the
+#            remaining bytes
+#   strings  u64 byte length, string count + 1 u64 character offsets, UTF-8 text
+#   index    u64 file offset of every record
+# Loading maps the file, decodes the string table once (repeated values such
+# as owners and types come back as one shared str) and builds each record from
+# its refs and detail JSON. A _raw of plain strings (every message from an XML
+# backup) is rebuilt from its refs, so the text index gets the bodies without
+# JSON decoding; any other _raw is a LazyRaw over the mapped bytes, decoded
+# once (the text index reads its body as the record is added) and swapped
+# for the dict when the record is first served. Records come back exactly as saved, key order
+# included; one that does not start with id + CORE_FIELDS as strings and end
+# with _raw keeps all its fields in the detail JSON.
+SNAPSHOT_MAGIC = b"MOMOSNP2"
+_SNAP_HEADER = struct.Struct("<8sIIQQ")
+_SNAP_RECORD = struct.Struct("<I7IIH")
+_SNAP_ABSENT = 0xFFFFFFFF
+_SNAP_RAW_JSON = 0xFFFF
+_SNAP_PAIRS = {}  # pair count -> Struct of its refs
+_SNAP_KEYS = ["id", *CORE_FIELDS]
+# Windows cannot replace a file that is still mapped, so there the snapshot is read into memory.
+SNAPSHOT_MMAP = os.name != "nt"
+
+class LazyRaw:
+    # A record's _raw, still encoded: a slice of the snapshot buffer. The
+    # decoded dict is kept, so get() and load() parse the slice only once.
+    __slots__ = ("buf", "start", "end", "value")
+
+    def __init__(self, buf, start, end):
+        self.buf, self.start, self.end = buf, start, end
+        self.value = None
+
+    def blob(self):
+        return self.buf[self.start:self.end]
+
+    def load(self):
+        if self.value is None:
+            self.value = json.loads(self.buf[self.start:self.end])
+        return self.value
+
+    def get(self, key, default=None):
+        return self.load().get(key, default)
+
+def _resolve_raw(tx):
+    # Decodes a lazy _raw in place the first time the record is handed out.
+    raw = tx.get("_raw")
+    if type(raw) is LazyRaw:
+        tx["_raw"] = raw.load()
+    return tx
+
+def _little_endian(arr):
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr
+
+def _pair_struct(n):
+    st = _SNAP_PAIRS.get(n)
+    if st is None:
+        st = _SNAP_PAIRS[n] = struct.Struct(f"<{2 * n}I")
+    return st
+
+def _pack_snapshot_record(tx, strings):
+    keys = list(tx)
+    raw = tx["_raw"] if keys and keys[-1] == "_raw" else None
+    if raw is not None:
+        keys.pop()
+    if keys[:7] == _SNAP_KEYS and all(type(tx[k]) is str for k in _SNAP_KEYS):
+        refs = [strings.setdefault(tx[k], len(strings)) for k in _SNAP_KEYS]
+        keys = keys[7:]
+    else:
+        refs = [_SNAP_ABSENT] * 7
+    details = {k: tx[k].load() if type(tx[k]) is LazyRaw else tx[k] for k in keys}
+    dbytes = json.dumps(details, ensure_ascii=False).encode("utf-8") if details else b""
+    pairs = _SNAP_RAW_JSON
+    if raw is None:
+        rbytes = b""
+    elif type(raw) is LazyRaw:
+        rbytes = raw.blob()
+    elif len(raw) < _SNAP_RAW_JSON and all(type(k) is str and type(v) is str for k, v in raw.items()):
+        pairs = len(raw)
+        rbytes = _pair_struct(pairs).pack(*[strings.setdefault(x, len(strings)) for kv in raw.items() for x in kv])
+    else:
+        rbytes = json.dumps(raw, ensure_ascii=False).encode("utf-8")
+    return (_SNAP_RECORD.pack(_SNAP_RECORD.size - 4 + len(dbytes) + len(rbytes), *refs, len(dbytes), pairs)
+            + dbytes + rbytes)
+
+def write_binary_snapshot(path, records):
+    tmp = _temp_beside(path)
+    try:
+        _write_binary(tmp, records)
+        os.replace(tmp, path)
+    except BaseException:
+        _discard_temp(tmp)
+        raise
+
+def _write_binary(tmp, records):
+    strings = {}
+    offsets = array("Q")
+    with open(tmp, "wb") as f:
+        f.write(bytes(_SNAP_HEADER.size))
+        pos = _SNAP_HEADER.size
+        for tx in records:
+            rec = _pack_snapshot_record(tx, strings)
+            offsets.append(pos)
+            f.write(rec)
+            pos += len(rec)
+        table = list(strings)
+        char_offsets = array("Q", [0])
+        for text in table:
+            char_offsets.append(char_offsets[-1] + len(text))
+        blob = "".join(table).encode("utf-8")
+        f.write(struct.pack("<Q", len(blob)))
+        f.write(_little_endian(char_offsets).tobytes())
+        f.write(blob)
+        index_offset = f.tell()
+        f.write(_little_endian(offsets).tobytes())
+        f.seek(0)
+        f.write(_SNAP_HEADER.pack(SNAPSHOT_MAGIC, len(offsets), len(table), pos, index_offset))
+        f.flush()
+        os.fsync(f.fileno())
+
+def iter_binary_snapshot(path, lazy=True):
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if SNAPSHOT_MMAP else f.read()
+    magic, count, n_strings, strings_at, index_at = _SNAP_HEADER.unpack_from(buf, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path}: not a binary snapshot")
+    (blob_len,) = struct.unpack_from("<Q", buf, strings_at)
+    at = strings_at + 8
+    char_offsets = array("Q")
+    char_offsets.frombytes(buf[at:at + 8 * (n_strings + 1)])
+    _little_endian(char_offsets)
+    at += 8 * (n_strings + 1)
+    text = buf[at:at + blob_len].decode("utf-8")
+    strings = [text[char_offsets[i]:char_offsets[i + 1]] for i in range(n_strings)]
+    del text
+    offsets = array("Q")
+    offsets.frombytes(buf[index_at:index_at + 8 * count])
+    _little_endian(offsets)
+    unpack = _SNAP_RECORD.unpack_from
+    head = _SNAP_RECORD.size
+    loads = json.loads
+    item = strings.__getitem__
+    for off in offsets:
+        length, i, t, a, s, r, ts, o, dlen, pairs = unpack(buf, off)
+        if i != _SNAP_ABSENT:
+            tx = {"id": strings[i], "type": strings[t], "amount": strings[a], "sender": strings[s],
+                  "receiver": strings[r], "timestamp": strings[ts], "owner": strings[o]}
+        else:
+            tx = {}
+        p = off + head
+        if dlen:
+            tx.update(loads(buf[p:p + dlen]))
+        p += dlen
+        end = off + 4 + length
+        if pairs != _SNAP_RAW_JSON:
+            it = map(item, _pair_struct(pairs).unpack_from(buf, p))
+            tx["_raw"] = dict(zip(it, it))
+        elif end > p:
+            tx["_raw"] = LazyRaw(buf, p, end) if lazy else loads(buf[p:end])
+        yield tx
+
+@timed_operation("load_binary")
+def load_from_binary(path):
+    global next_id
+    with ingest_lock, store_lock:
+        store.clear()
+        next_id = 1
+        ingest_state.clear()  # like JSON snapshots, no backup metadata
+        for tx in iter_binary_snapshot(path):
+            _store_loaded(tx)
+
+def snapshot_store(path):
+    # snapshot_to_json, or a binary snapshot for a .bin path.
+    with _snapshot_lock:
+        with store_lock.read():
+            view = store.copy()
+        save_snapshot(path, view)
+
+def checkpoint_store(path):
+    # Persists the store after changes the WAL does not record (an ingest):
+    # through a compaction while the log is open, so snapshot and log agree,
+    # otherwise as a plain snapshot.
+    if mutation_log:
+        mutation_log.compact()
+    else:
+        snapshot_store(path)
+
+# --------------------
+# Mutations and append-only write-ahead log
+# --------------------
+# Every mutation is applied to the store and enqueued on the log under
+# store_lock (so log order == apply order), then the caller waits outside the
+# lock until a background flusher has written it. The flusher group-commits
+# everything pending with one write (and one fsync, depending on the policy),
+# so write latency no longer depends on how many transactions are stored.
+# Compaction folds the log into a fresh JSON snapshot in the background.
+WAL_FSYNC_POLICIES = ("always", "interval", "never")
+WAL_FSYNC_INTERVAL_SEC = 1.0
+WAL_COMPACT_BYTES = 8 * 1024 * 1024
+
+mutation_log = None
+
+class WALFailed(RuntimeError):
+    pass
+
+class MutationLog:
+    def __init__(self, path, snapshot_path, fsync="always", compact_bytes=WAL_COMPACT_BYTES):
+        if fsync not in WAL_FSYNC_POLICIES:
+            raise ValueError(f"fsync policy must be one of {WAL_FSYNC_POLICIES}")
+        self.path = path
+        self.old_path = path + ".old"
+        self.snapshot_path = snapshot_path
+        self.fsync = fsync
+        self.compact_bytes = compact_bytes
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._pending = []
+        self._last_seq = 0
+        self._written_seq = 0
+        self._last_fsync = time.monotonic()
+        self._compact_lock = threading.Lock()
+        self._closed = False
+        self._error = None
+        _trim_torn_tail(path)
+        self._f = open(path, "ab")
+        self._size = self._f.tell()
+        self._flusher = threading.Thread(target=self._run, name="wal-flusher", daemon=True)
+        self._flusher.start()
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self._cond:
+            self._last_seq += 1
+            self._pending.append(line)
+            self._cond.notify_all()
+            return self._last_seq
+
+    def wait(self, seq):
+        with self._cond:
+            while self._written_seq < seq and not self._closed and self._error is None:
+                self._cond.wait()
+            if self._written_seq < seq and self._error is not None:
+                raise WALFailed(f"write-ahead log failed: {self._error!r}") from self._error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+            try:
+                self._flush_pending()
+            except Exception as exc:
+                # A failed write, flush or fsync leaves the file's tail unknown:
+                # stop logging and fail every waiter, now and later, instead of
+                # leaving them blocked on a seq that will never be written.
+                with self._cond:
+                    self._error = exc
+                    self._cond.notify_all()
+                return
+            if self._size >= self.compact_bytes:
+                self.compact_async()
+
+    def _flush_pending(self):
+        # Batches are taken under _io_lock so they reach the file in seq order;
+        # appenders only ever wait on _cond, never on the write or fsync.
+        with self._io_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+                seq = self._last_seq
+            if batch:
+                self._write(batch)
+        with self._cond:
+            self._written_seq = max(self._written_seq, seq)
+            self._cond.notify_all()
+
+    def _write(self, batch):
+        data = b"".join(batch)
+        self._f.write(data)
+        self._f.flush()
+        self._size += len(data)
+        now = time.monotonic()
+        if self.fsync == "always" or (self.fsync == "interval" and now - self._last_fsync >= WAL_FSYNC_INTERVAL_SEC):
+            os.fsync(self._f.fileno())
+            self._last_fsync = now
+
+    def _rotate(self):
+        # Called with store_lock held, so nothing new can be appended.
+        self._flush_pending()
+        with self._io_lock:
+            self._f.close()
+            if os.path.exists(self.old_path):
+                with open(self.path, "rb") as src, open(self.old_path, "ab") as dst:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.old_path)
+            self._f = open(self.path, "ab")
+            self._size = 0
+
+    def compact(self):
+        with self._compact_lock, _snapshot_lock:
+            with store_lock:
+                view = store.copy()
+                self._rotate()
+            save_snapshot(self.snapshot_path, view)
+            os.remove(self.old_path)
+
+    def compact_async(self):
+        if self._compact_lock.locked():
+            return
+        threading.Thread(target=self.compact, name="wal-compact", daemon=True).start()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._flusher.join()
+        self._f.close()
+
+def open_mutation_log(path, snapshot_path, fsync="always", compact_bytes=WAL_COMPACT_BYTES):
+    global mutation_log
+    mutation_log = MutationLog(path, snapshot_path, fsync, compact_bytes)
+    return mutation_log
+
+def close_mutation_log():
+    global mutation_log
+    if mutation_log:
+        mutation_log.close()
+        mutation_log = None
+
+def _log(record, created=False):
+    # Called under store_lock by every mutation, so the reload journal (see
+    # reload_store) sees exactly the ops applied while a new generation builds.
+    if _reload_journal is not None:
+        _reload_journal.append((record, created))
+    return mutation_log.append(record) if mutation_log else 0
+
+def _wait_logged(seq):
+    if mutation_log and seq:
+        mutation_log.wait(seq)
+
+def add_transaction(tx):
     with store_lock:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(transactions_list, f, ensure_ascii=False, indent=2)
+        if tx["id"] in store:
+            return False
+        _store_loaded(tx)
+        seq = _log({"op": "put", "tx": tx}, created=True)
+    _wait_logged(seq)
+    return True
+
+def replace_transaction(tx):
+    with store_lock:
+        if tx["id"] not in store:
+            return False
+        store.replace(tx)
+        seq = _log({"op": "put", "tx": tx})
+    _wait_logged(seq)
+    return True
+
+def remove_transaction(tx_id):
+    with store_lock:
+        tx = store.delete(tx_id)
+        if tx is None:
+            return None
+        seq = _log({"op": "del", "id": tx_id})
+    _wait_logged(seq)
+    return tx
+
+def _trim_torn_tail(path):
+    # Every record is written with its newline, so bytes after the last "\n"
+    # are a record cut off by a crash mid-write (never acknowledged). Cut them
+    # off, or the next append would be glued onto the fragment and that line
+    # would no longer parse. Returns the number of bytes removed.
+    try:
+        f = open(path, "r+b")
+    except FileNotFoundError:
+        return 0
+    with f:
+        end = pos = f.seek(0, os.SEEK_END)
+        while pos > 0:
+            step = min(pos, 64 * 1024)
+            f.seek(pos - step)
+            nl = f.read(step).rfind(b"\n")
+            if nl >= 0:
+                pos = pos - step + nl + 1
+                break
+            pos -= step
+        if pos < end:
+            f.truncate(pos)
+            f.flush()
+            os.fsync(f.fileno())
+        return end - pos
+
+def _replay_file(path):
+    applied = 0
+    _trim_torn_tail(path)
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line damaged before the tail was trimmed on open; later ones still apply
+            _apply_record(store, rec)
+            applied += 1
+    return applied
+
+def _apply_record(target, rec):
+    global next_id
+    if rec.get("op") == "put":
+        tx = rec["tx"]
+        if tx["id"] in target:
+            target.replace(tx)
+        else:
+            target.append(tx)
+            next_id = _next_id_after(tx["id"], next_id)
+    elif rec.get("op") == "del":
+        target.delete(rec["id"])
+
+@timed_operation("wal_replay")
+def replay_log(path):
+    # Replays a rotated-but-not-yet-compacted segment first, then the live log.
+    # Records are idempotent upserts/deletes, so replaying ops the snapshot
+    # already contains is harmless.
+    applied = 0
+    with store_lock:
+        for p in (path + ".old", path):
+            if os.path.exists(p):
+                applied += _replay_file(p)
+    return applied
+
+# --------------------
+# Background reload: build a new generation off-lock, swap it in atomically
+# --------------------
+# While a generation builds, every mutation is also journaled (see _log); the
+# journal is applied to the new store under the exclusive lock right before
+# the swap, so writes made during a reload are not lost. Readers keep using
+# the old generation until the swap and never see a partly loaded store.
+RELOAD_POLL_SEC = 2.0
+_reload_journal = None
+_reload_running = threading.Lock()
+reload_status = {"running": False, "last": None, "error": None}
+
+class _IdSequence:
+    # Id allocation for a generation being built (the live store uses next_id).
+    def __init__(self):
+        self.next = 1
+
+    def take(self):
+        rid = str(self.next)
+        self.next += 1
+        return rid
+
+    def note(self, tx_id):
+        self.next = _next_id_after(tx_id, self.next)
+
+def _build_generation(path, backend, dedup=None):
+    # Returns (store, id sequence, ingest state); ingest state is None for a
+    # JSON or binary snapshot, which carry no backup metadata. `dedup` is a
+    # fresh DedupIndex that an XML source is deduplicated against.
+    new = backend()
+    ids = _IdSequence()
+    if path.lower().endswith(".bin"):
+        for tx in iter_binary_snapshot(path):
+            new.append(tx)
+            ids.note(tx["id"])
+        return new, ids, None
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for raw in data:
+            tx = _snapshot_record(raw, ids)
+            new.append(tx)
+            ids.note(tx["id"])
+        return new, ids, None
+    states, state, root_attrs = {}, None, {}
+    for i, raw in enumerate(iter_xml_records(path, root_attrs=root_attrs), 1):
+        if state is None:
+            state = states.setdefault(root_attrs.get("backup_set", ""), {"watermark": None, "seen": {}})
+        if dedup is None or dedup.add(dedup_key(raw)):
+            tx = normalize_transaction(raw, ids)
+            new.append(tx)
+            ids.note(tx["id"])
+        _note_ingested(state, raw)
+        if i % STREAM_CHUNK_SIZE == 0:
+            _prune_seen(state)
+    if state is not None:
+        _prune_seen(state)
+    return new, ids, states
+
+@timed_operation("reload")
+def reload_store(path):
+    global store, next_id, ingest_state, _reload_journal
+    with ingest_lock:
+        t0 = time.perf_counter()
+        with store_lock:
+            _reload_journal = []
+            backend = type(store)
+        snapshot = path.lower().endswith((".bin", ".json"))
+        dedup = dedup_index.fresh() if dedup_index is not None and not snapshot else None
+        try:
+            new, ids, states = _build_generation(path, backend, dedup)
+        except BaseException:
+            with store_lock:
+                _reload_journal = None
+            if dedup is not None:
+                dedup.discard()
+            raise
+        build_sec = time.perf_counter() - t0
+        count = len(new)
+        t1 = time.perf_counter()
+        with store_lock:
+            journal, _reload_journal = _reload_journal, None
+            new.version = store.version + 1
+            old, store = store, new
+            next_id = max(ids.next, next_id)
+            for rec, created in journal:
+                if created and rec["tx"]["id"] in store:
+                    # Added during the build under an id the new generation
+                    # also numbered. The client already holds that id, so the
+                    # file's record (not yet seen by anyone) takes a new one.
+                    moved = store.delete(rec["tx"]["id"])
+                    store.append({**moved, "id": str(next_id)})
+                    next_id += 1
+                _apply_record(store, rec)
+            if states is not None:
+                ingest_state = states
+        swap_ms = (time.perf_counter() - t1) * 1000
+        if dedup is not None:
+            dedup_index.adopt(dedup)
+    # Views already handed to readers keep the old generation alive until they
+    # finish; everything else goes now.
+    del old, new
+    gc.collect()
+    if mutation_log:
+        # The on-disk snapshot still holds the old generation, and the log is
+        # keyed by the new one's ids. Compact before returning: waiting out a
+        # compaction already running rather than skipping, which would leave
+        # the old snapshot for the next restart.
+        mutation_log.compact()
+    return {"source": path, "records": count, "journaled": len(journal),
+            "build_sec": build_sec, "swap_ms": swap_ms}
+
+def reload_async(path, on_done=None):
+    # Starts a reload thread; False if one is already running. on_done(stats)
+    # runs on the reload thread after a successful swap.
+    if not _reload_running.acquire(blocking=False):
+        return False
+    reload_status["running"] = True
+
+    def run():
+        try:
+            stats = reload_store(path)
+            reload_status.update(last=stats, error=None)
+            if on_done:
+                on_done(stats)
+        except Exception as e:
+            reload_status["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            reload_status["running"] = False
+            _reload_running.release()
+
+    threading.Thread(target=run, name="store-reload", daemon=True).start()
+    return True
+
+def watch_source(path, interval=RELOAD_POLL_SEC, on_done=None):
+    # Reloads when the file's mtime changes and its size has settled across
+    # two polls (so a backup still being copied in is not picked up).
+    def run():
+        last = seen = None
+        while True:
+            time.sleep(interval)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            sig = (st.st_mtime_ns, st.st_size)
+            if last is None:
+                last = seen = sig
+            elif sig != last and sig == seen:
+                if reload_async(path, on_done):
+                    last = sig
+            else:
+                seen = sig
+
+    t = threading.Thread(target=run, name="source-watch", daemon=True)
+    t.start()
+    return t
+
+# --------------------
+# Rollups: /stats and the materialized dashboard
+# --------------------
+DASHBOARD_INTERVAL_SEC = 60.0
+
+def transaction_stats(owner=None, dims=ROLLUP_DIMENSIONS):
+    # Read from the rollup counters: cost follows the number of distinct
+    # types/days/owners/counterparties, not the number of records.
+    with store_lock.read():
+        out = {"version": store.version}
+        out.update(store.indexes["rollup"].totals(owner).summary(dims))
+    return out
+
+def write_dashboard(path):
+    stats = transaction_stats()
+    stats["generated_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    _write_snapshot(path, stats)
+    return stats
+
+def materialize_dashboard(path, interval=DASHBOARD_INTERVAL_SEC):
+    # Writes the dashboard now, then every `interval` seconds if the store
+    # changed in between.
+    def run():
+        last = None
+        while True:
+            version = store_version()
+            if version != last:
+                try:
+                    write_dashboard(path)
+                    last = version
+                except OSError:
+                    pass
+            time.sleep(interval)
+
+    t = threading.Thread(target=run, name="dashboard", daemon=True)
+    t.start()
+    return t
 
 # --------------------
 # DSA: linear search vs dict lookup
 # --------------------
 def linear_search_by_id(target_id):
-    with store_lock:
-        for tx in transactions_list:
+    with store_lock.read():
+        for tx in store:
             if tx["id"] == target_id:
                 return tx
     return None
 
 def dict_lookup_by_id(target_id):
-    with store_lock:
-        return transactions_by_id.get(target_id)
-
-def benchmark_search(sample_ids, repeats=1000):
-    t0 = time.time()
-    for _ in range(repeats):
-        for i in sample_ids:
-            _ = linear_search_by_id(i)
-    t1 = time.time()
-    for _ in range(repeats):
-        for i in sample_ids:
-            _ = dict_lookup_by_id(i)
-    t2 = time.time()
-    return {"linear_sec": t1 - t0, "dict_sec": t2 - t1}
\ No newline at end of file
+    with store_lock.read():
+        return store.get(target_id)
+
+def all_transactions():
+    with store_lock.read():
+        view = store.copy()
+    return list(view)
+
+def _search_hits(q, buckets, after=-1):
+    # (seq, id) of records matching ?q= that are in every bucket, in insertion
+    # order; the buckets (e.g. the caller's own records) are applied to the
+    # posting lists before any record is fetched. Caller holds store_lock.
+    terms, phrases = parse_search(q)
+    text = store.indexes["text"]
+    for doc in text.docs(terms, after):
+        tx_id = text.doc_ids[doc]
+        if all(tx_id in b for b in buckets) and (not phrases or phrase_match(store.get(tx_id), phrases)):
+            yield doc, tx_id
+
+def _query_ids(owner, type_, start, end, q=None):
+    # Intersects the owner/type buckets, smallest first, so the cost follows
+    # the number of matching rows rather than the size of the store. With a
+    # time range the time index drives and results come back in time order.
+    # Caller holds store_lock; None means "every record".
+    buckets = []
+    if owner is not None:
+        buckets.append(store.indexes["owner"].ordered_ids(owner, store.seq_of))
+    if type_ is not None:
+        buckets.append(store.indexes["type"].ordered_ids(type_, store.seq_of))
+    if q is not None:
+        found = [i for _, i in _search_hits(q, buckets)]
+        if start is None and end is None:
+            return found
+        buckets = [set(found)]
+    if start is not None or end is not None:
+        return [i for i in store.indexes["time"].ids(start, end) if all(i in b for b in buckets)]
+    if not buckets:
+        return None
+    buckets.sort(key=len)
+    first, rest = buckets[0], buckets[1:]
+    return [i for i in first if all(i in b for b in rest)]
+
+def query_transactions(owner=None, type_=None, start=None, end=None, q=None):
+    with store_lock.read():
+        ids = _query_ids(owner, type_, start, end, q)
+        if ids is not None:
+            return [store.get(i) for i in ids]
+        view = store.copy()
+    return list(view)
+
+def transaction_fragments(owner=None, type_=None, start=None, end=None, q=None):
+    # Encoded JSON per matching record, from the per-slot cache; only records
+    # changed since they were last read get encoded.
+    with store_lock.read():
+        return store.fragments(_query_ids(owner, type_, start, end, q))
+
+# --------------------
+# Keyset pagination and streaming views
+# --------------------
+# A cursor is the key of the last record a page returned: ["s", seq] in
+# insertion order, or ["t", epoch_ms, id] when a time range drives the query.
+# Resuming bisects past that key, so pages stay stable while other records
+# are added, replaced, deleted or compacted away.
+def encode_cursor(key):
+    raw = json.dumps(key, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("malformed cursor")
+    if (isinstance(key, list) and key and
+            ((key[0] == "s" and len(key) == 2 and isinstance(key[1], int)) or
+             (key[0] == "t" and len(key) == 3 and isinstance(key[1], int) and isinstance(key[2], str)))):
+        return key
+    raise ValueError("malformed cursor")
+
+def page_transactions(owner=None, type_=None, start=None, end=None, limit=100, cursor=None, q=None):
+    # Returns (records, next_cursor); next_cursor is None on the last page.
+    # Only the page itself is gathered under the lock.
+    kind = "t" if start is not None or end is not None else "s"
+    after = decode_cursor(cursor) if cursor else None
+    if after is not None and after[0] != kind:
+        raise ValueError("cursor does not belong to this query")
+    buckets = []
+    with store_lock.read():
+        if owner is not None:
+            buckets.append(store.indexes["owner"].ids(owner))
+        if type_ is not None:
+            buckets.append(store.indexes["type"].ids(type_))
+        buckets.sort(key=len)
+        if q is not None and kind == "t":
+            buckets = [{i for _, i in _search_hits(q, buckets)}]
+        if kind == "t":
+            rows = []
+            for entry in store.indexes["time"].entries(start, end, tuple(after[1:]) if after else None):
+                if all(entry[1] in b for b in buckets):
+                    rows.append((list(entry), store.get(entry[1])))
+                    if len(rows) > limit:
+                        break
+        elif q is not None:
+            rows = []
+            for seq, i in _search_hits(q, buckets, after[1] if after else -1):
+                rows.append(([seq], store.get(i)))
+                if len(rows) > limit:
+                    break
+        elif not buckets:
+            rows = [([seq], tx) for seq, tx in store.page(after[1] if after else -1, limit + 1)]
+        else:
+            first, rest = buckets[0], buckets[1:]
+            floor = after[1] if after else -1
+            keyed = ((store.seq_of(i), i) for i in first if all(i in b for b in rest))
+            rows = [([seq], store.get(i)) for seq, i in heapq.nsmallest(limit + 1, (k for k in keyed if k[0] > floor))]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor([kind] + rows[-1][0]) if more else None
+    return [tx for _, tx in rows], next_cursor
+
+def iter_transactions(owner=None, type_=None, start=None, end=None, q=None):
+    # Generator for streamed responses: the lock is held only while the view
+    # is captured; records are produced (and encoded by the caller) off-lock.
+    if owner is None and type_ is None and start is None and end is None and q is None:
+        with store_lock.read():
+            view = store.copy()
+        yield from view
+    else:
+        yield from query_transactions(owner=owner, type_=type_, start=start, end=end, q=q)
+
+def scan_transactions(owner=None, type_=None):
+    with store_lock.read():
+        return [tx for tx in store
+                if (owner is None or tx.get("owner") == owner) and (type_ is None or tx.get("type") == type_)]
+
+def sample_transaction_ids(n):
+    with store_lock.read():
+        return [tx["id"] for tx in itertools.islice(store, n)]
+
+def transaction_count():
+    return len(store)
+
+def store_version():
+    # Bumped by every mutation, load and reload; read without the lock.
+    return store.version
+
+if __name__ == "__main__":
+    import argparse
+    # Benchmarks live in scripts/ (scripts/benchmark.py runs them).
+    ap = argparse.ArgumentParser(description="Store utilities")
+    ap.add_argument("--collapse", metavar="PSTATS", required=True,
+                    help="print a .pstats file as collapsed stacks (flamegraph input)")
+    args = ap.parse_args()
+    sys.stdout.writelines(collapsed_lines(pstats.Stats(args.collapse)))
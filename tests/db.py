@@ -0,0 +1,458 @@
+import functools
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# The SQLite schema and bulk loader live in etl/load_db.py.
+_ETL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "etl")
+if os.path.isdir(_ETL_DIR) and _ETL_DIR not in sys.path:
+    sys.path.append(_ETL_DIR)
+
+import load_db
+from data_dsa import (
+    ROLLUP_DIMENSIONS,
+    _IdSequence,
+    _snapshot_record,
+    decode_cursor,
+    encode_cursor,
+    iter_binary_snapshot,
+    iter_xml_records,
+    normalize_transaction as _normalize,
+)
+
+# --------------------
+# Connection pool
+# --------------------
+# Up to `size` connections per process, opened once and reused: a request
+# checks one out for the length of a query and hands it back, so no request
+# pays for connect + pragmas. Idle connections are handed out LIFO, so the
+# warmest page and statement caches go first; with size == worker threads
+# every worker can hold one at once. A connection idle for longer than
+# HEALTH_IDLE_SEC is pinged before use and replaced if the ping fails.
+POOL_SIZE = 16  # matches api_server.WORKER_THREADS
+STATEMENT_CACHE = 256  # prepared statements kept per connection
+HEALTH_IDLE_SEC = 30.0
+WAIT_SAMPLES = 1024  # recent checkout waits kept for percentiles
+
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.pid = os.getpid()
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []  # (connection, monotonic time it was returned)
+        self._open = 0
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.counters = {"checkouts": 0, "waited": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0,
+                         "opened": 0, "replaced": 0, "health_failures": 0}
+
+    def _connect(self):
+        conn = load_db.connect(self.path, check_same_thread=False, cached_statements=STATEMENT_CACHE)
+        with self._cond:
+            self.counters["opened"] += 1
+        return conn
+
+    def acquire(self):
+        t0 = time.perf_counter()
+        with self._cond:
+            waited = False
+            while not self._idle and self._open >= self.size:
+                waited = True
+                self._cond.wait()
+            if self._idle:
+                conn, returned = self._idle.pop()
+            else:
+                conn, returned = None, None
+                self._open += 1
+            wait_ms = (time.perf_counter() - t0) * 1000
+            c = self.counters
+            c["checkouts"] += 1
+            c["waited"] += waited
+            c["wait_ms_total"] += wait_ms
+            c["wait_ms_max"] = max(c["wait_ms_max"], wait_ms)
+            self._waits.append(wait_ms)
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif time.monotonic() - returned > HEALTH_IDLE_SEC and not _ping(conn):
+                with self._cond:
+                    self.counters["health_failures"] += 1
+                    self.counters["replaced"] += 1
+                _close_quietly(conn)
+                conn = self._connect()
+        except BaseException:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def warm(self, n=None):
+        # Opens connections up front so the first requests don't.
+        conns = [self.acquire() for _ in range(min(n or self.size, self.size))]
+        for conn in conns:
+            self.release(conn)
+
+    def check(self):
+        try:
+            with self.connection() as conn:
+                ok = _ping(conn)
+        except sqlite3.Error:
+            ok = False
+        if not ok:
+            with self._cond:
+                self.counters["health_failures"] += 1
+        return ok
+
+    def metrics(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            out = {"size": self.size, "open": self._open, "idle": len(self._idle),
+                   "in_use": self._open - len(self._idle), **self.counters}
+        out["wait_ms_p50"] = waits[len(waits) // 2] if waits else 0.0
+        out["wait_ms_p99"] = waits[int(len(waits) * 0.99)] if waits else 0.0
+        return out
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn, _ in idle:
+            _close_quietly(conn)
+
+def _ping(conn):
+    try:
+        return conn.execute("SELECT 1").fetchone() == (1,)
+    except sqlite3.Error:
+        return False
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+# --------------------
+# SQLite-backed store for the API
+# --------------------
+# Same function names and return shapes as the data_dsa store API, so the
+# server can serve from a database file instead of the in-memory store
+# (api_server --store sqlite). Reads run concurrently on pooled connections
+# (WAL lets them proceed alongside a write); writes from this process are
+# serialized by _write_lock, which also guards the version counter. A forked
+# child gets a fresh pool on first use.
+STORE_API = (
+    "all_transactions", "query_transactions", "transaction_fragments", "page_transactions",
+    "iter_transactions", "transaction_count", "store_version", "transaction_stats",
+    "add_transaction", "replace_transaction", "remove_transaction", "normalize_transaction",
+    "dict_lookup_by_id",
+)
+ITER_PAGE_ROWS = 1000  # rows fetched per checkout when streaming
+
+_pool = None
+_pool_lock = threading.Lock()
+_write_lock = threading.Lock()
+_categories = {}
+_ids = _IdSequence()
+_version = 0
+
+def _current_pool():
+    global _pool
+    if _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool.pid != os.getpid():
+                _pool = ConnectionPool(_pool.path, _pool.size)
+    return _pool
+
+def _connection():
+    return _current_pool().connection()
+
+def open_database(path, pool_size=POOL_SIZE, warm=True):
+    # warm=False leaves no connection open, e.g. before forking workers.
+    global _pool, _categories, _version
+    if _pool is not None:
+        _pool.close()
+    _pool = ConnectionPool(path, pool_size)
+    with _pool.connection() as conn:
+        load_db.create_schema(conn)
+        _categories = load_db.category_ids(conn)
+        top = conn.execute('SELECT MAX(CAST(RecordID AS INTEGER)) FROM "Transaction"').fetchone()[0]
+        _ids.next = max(_ids.next, (top or 0) + 1)
+        _version = load_db.next_row_id(conn)
+    if warm:
+        _pool.warm()
+    else:
+        _pool.close()
+
+def health():
+    if _pool is None:
+        return {"ok": False, "pool": None}
+    pool = _current_pool()
+    return {"ok": pool.check(), "pool": pool.metrics()}
+
+def pool_metrics():
+    return _current_pool().metrics()
+
+def import_source(db_path, source):
+    # Initial load of an XML backup or JSON snapshot, normalized exactly as
+    # the in-memory store would hold it. Binary snapshot records are already normalized.
+    ids = _IdSequence()
+    if source.lower().endswith(".bin"):
+        conn = load_db.connect(db_path)
+        try:
+            return load_db.bulk_load(conn, iter_binary_snapshot(source, lazy=False))
+        finally:
+            conn.close()
+    if source.lower().endswith(".json"):
+        with open(source, "r", encoding="utf-8") as f:
+            records = (_snapshot_record(raw, ids) for raw in json.load(f))
+    else:
+        records = (_normalize(raw, ids) for raw in iter_xml_records(source))
+    conn = load_db.connect(db_path)
+    try:
+        return load_db.bulk_load(conn, records)
+    finally:
+        conn.close()
+
+# --------------------
+# Prepared queries
+# --------------------
+# sqlite3 caches a prepared statement per distinct SQL text on each
+# connection, so every hot query is a fixed text with ? parameters: one per
+# combination of filters, built once here and reused from then on.
+BY_ID = 'SELECT Record FROM "Transaction" WHERE RecordID = ?'
+ROW_BY_ID = 'SELECT TransactionID, Record FROM "Transaction" WHERE RecordID = ?'
+
+@functools.lru_cache(maxsize=None)
+def _select_sql(owner, type_, start, end, paged=False, after=False):
+    # Flags say which filters are present; the matching parameters come from _params.
+    clauses = [c for flag, c in ((owner, "Owner = ?"), (type_, "Kind = ?"), (start, "Epoch_ms >= ?"),
+                                 (end, "Epoch_ms <= ?")) if flag]
+    timed = start or end
+    if after:
+        clauses.append("(Epoch_ms, RecordID) > (?, ?)" if timed else "TransactionID > ?")
+    cols = ("Epoch_ms, RecordID, Record" if timed else "TransactionID, Record") if paged else "Record"
+    return (f'SELECT {cols} FROM "Transaction"' + (" WHERE " + " AND ".join(clauses) if clauses else "")
+            + (" ORDER BY Epoch_ms, RecordID" if timed else " ORDER BY TransactionID")
+            + (" LIMIT ?" if paged else ""))
+
+def _params(owner, type_, start, end):
+    return [v for v in (owner, type_, start, end) if v is not None]
+
+def _records(owner, type_, start, end, q=None):
+    if q is not None:
+        # ?q= needs data_dsa's text index; the handler answers 501 before calling here.
+        raise ValueError("q is not supported by the sqlite store")
+    sql = _select_sql(owner is not None, type_ is not None, start is not None, end is not None)
+    with _connection() as conn:
+        return [r[0] for r in conn.execute(sql, _params(owner, type_, start, end))]
+
+_STATS_KEYS = {
+    "type": "Kind",
+    "day": "strftime('%Y-%m-%d', Epoch_ms / 1000, 'unixepoch')",
+    "owner": "Owner",
+    "counterparty": "NULLIF(Counterparty, '')",
+}
+
+@functools.lru_cache(maxsize=None)
+def _stats_sql(dim, scoped):
+    where = " WHERE Owner = ?" if scoped else ""
+    if dim is None:
+        return f'SELECT COUNT(*), COALESCE(SUM(Amount), 0) FROM "Transaction"{where}'
+    return (f'SELECT {_STATS_KEYS[dim]} AS k, COUNT(*), SUM(Amount) FROM "Transaction"{where} '
+            f"GROUP BY k HAVING k IS NOT NULL ORDER BY k")
+
+# --------------------
+# Reads
+# --------------------
+def dict_lookup_by_id(target_id):
+    with _connection() as conn:
+        row = conn.execute(BY_ID, (target_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def query_transactions(owner=None, type_=None, start=None, end=None, q=None):
+    return [json.loads(r) for r in _records(owner, type_, start, end, q)]
+
+def all_transactions():
+    return query_transactions()
+
+def transaction_fragments(owner=None, type_=None, start=None, end=None, q=None):
+    # Record holds the same bytes data_dsa.encode_record produces.
+    return [r.encode("utf-8") for r in _records(owner, type_, start, end, q)]
+
+def page_transactions(owner=None, type_=None, start=None, end=None, limit=100, cursor=None, q=None):
+    # Keyset pages with the same cursors as data_dsa: ["s", TransactionID] in
+    # insertion order, ["t", epoch_ms, id] when a time range drives the query.
+    if q is not None:
+        raise ValueError("q is not supported by the sqlite store")
+    kind = "t" if start is not None or end is not None else "s"
+    after = decode_cursor(cursor) if cursor else None
+    if after is not None and after[0] != kind:
+        raise ValueError("cursor does not belong to this query")
+    sql = _select_sql(owner is not None, type_ is not None, start is not None, end is not None,
+                      paged=True, after=after is not None)
+    params = _params(owner, type_, start, end) + (after[1:] if after else []) + [limit + 1]
+    with _connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor([kind] + list(rows[-1][:-1])) if more else None
+    return [json.loads(r[-1]) for r in rows], next_cursor
+
+def iter_transactions(owner=None, type_=None, start=None, end=None, q=None):
+    # Streams page by page so no connection is held while the caller writes.
+    cursor = None
+    while True:
+        records, cursor = page_transactions(owner, type_, start, end, ITER_PAGE_ROWS, cursor, q)
+        yield from records
+        if cursor is None:
+            return
+
+def transaction_count():
+    with _connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM "Transaction"').fetchone()[0]
+
+def store_version():
+    # Bumped by every write made through this process.
+    return _version
+
+def transaction_stats(owner=None, dims=ROLLUP_DIMENSIONS):
+    # Same shape as data_dsa.transaction_stats, computed with GROUP BY.
+    scoped = owner is not None
+    params = (owner,) if scoped else ()
+    with _connection() as conn:
+        version = _version
+        count, amount = conn.execute(_stats_sql(None, scoped), params).fetchone()
+        out = {"version": version, "count": count, "amount": amount}
+        for dim in dims:
+            rows = conn.execute(_stats_sql(dim, scoped), params)
+            out["by_" + dim] = {k: {"count": c, "amount": a} for k, c, a in rows}
+    return out
+
+# --------------------
+# Writes
+# --------------------
+def _write(conn, statements):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for sql, params in statements:
+            conn.execute(sql, params)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def normalize_transaction(raw):
+    return _normalize(raw, _ids)
+
+def add_transaction(tx):
+    global _version
+    with _write_lock, _connection() as conn:
+        if conn.execute(BY_ID, (tx["id"],)).fetchone():
+            return False
+        tx_row, msg_row = load_db.transaction_row(tx, load_db.next_row_id(conn), _categories)
+        _write(conn, [(load_db.INSERT_MESSAGE, msg_row), (load_db.INSERT_TRANSACTION, tx_row)])
+        _version += 1
+    _ids.note(tx["id"])
+    return True
+
+_UPDATE_TRANSACTION = ('UPDATE "Transaction" SET ' + ", ".join(f"{c} = ?" for c in load_db.TX_COLUMNS[2:])
+                       + " WHERE TransactionID = ?")
+_UPDATE_MESSAGE = "UPDATE Message SET Raw_text = ?, Time = ? WHERE MessageID = ?"
+
+def replace_transaction(tx):
+    global _version
+    with _write_lock, _connection() as conn:
+        row = conn.execute(ROW_BY_ID, (tx["id"],)).fetchone()
+        if row is None:
+            return False
+        tx_row, msg_row = load_db.transaction_row(tx, row[0], _categories)
+        _write(conn, [(_UPDATE_TRANSACTION, tx_row[2:] + (row[0],)), (_UPDATE_MESSAGE, msg_row[1:] + (row[0],))])
+        _version += 1
+    return True
+
+def remove_transaction(tx_id):
+    global _version
+    with _write_lock, _connection() as conn:
+        row = conn.execute(ROW_BY_ID, (tx_id,)).fetchone()
+        if row is None:
+            return None
+        _write(conn, [('DELETE FROM "Transaction" WHERE TransactionID = ?', (row[0],)),
+                      ("DELETE FROM Message WHERE MessageID = ?", (row[0],))])
+        _version += 1
+    return json.loads(row[1])
+
+# --------------------
+# Pool benchmark
+# --------------------
+def _pool_run(path, pool_size, threads, seconds, ids, owners):
+    pool = ConnectionPool(path, pool_size)
+    pool.warm()
+    page_sql = _select_sql(True, False, False, False, paged=True)
+    done = [0] * threads
+    stop = time.perf_counter() + seconds
+
+    def worker(k):
+        rng = random.Random(k)
+        while time.perf_counter() < stop:
+            with pool.connection() as conn:
+                conn.execute(BY_ID, (rng.choice(ids),)).fetchone()
+            with pool.connection() as conn:
+                conn.execute(page_sql, (rng.choice(owners), 100)).fetchall()
+            done[k] += 2
+
+    workers = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    m = pool.metrics()
+    pool.close()
+    return {"queries_per_sec": sum(done) / seconds, "waited": m["waited"],
+            "wait_ms_p50": m["wait_ms_p50"], "wait_ms_p99": m["wait_ms_p99"], "wait_ms_max": m["wait_ms_max"]}
+
+def benchmark_pool(path, threads=(1, 2, 4, 8), seconds=2.0):
+    # Lookups + 100-row owner pages from N threads through one shared
+    # connection (a pool of 1: the old single connection behind a lock) and
+    # through a pool of N; connect_ms is what a per-request connection costs.
+    conn = load_db.connect(path)
+    ids = [r[0] for r in conn.execute('SELECT RecordID FROM "Transaction"')]
+    owners = [r[0] for r in conn.execute('SELECT DISTINCT Owner FROM "Transaction"')]
+    conn.close()
+    t0 = time.perf_counter()
+    for _ in range(200):
+        load_db.connect(path).close()
+    result = {"connect_ms": (time.perf_counter() - t0) / 200 * 1000}
+    for n in threads:
+        result[str(n)] = {"shared_connection": _pool_run(path, 1, n, seconds, ids, owners),
+                          "pool": _pool_run(path, n, n, seconds, ids, owners)}
+    return result
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="SQLite store: pool benchmark")
+    ap.add_argument("db", help="database built by etl/load_db.py or api_server --store sqlite")
+    ap.add_argument("--seconds", type=float, default=2.0)
+    args = ap.parse_args()
+    print(json.dumps(benchmark_pool(args.db, seconds=args.seconds), indent=2))
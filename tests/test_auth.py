@@ -0,0 +1,169 @@
+import base64
+import http.client
+import json
+import threading
+from http.server import HTTPServer
+
+import pytest
+
+import api_server
+from api_server import AuthCache, LoginThrottle, LoginThrottled, TokenStore
+
+class _Request:
+    def __init__(self, header):
+        self.headers = {"Authorization": header} if header else {}
+        self.client_address = ("127.0.0.1", 0)
+
+def _basic(username, password):
+    return "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode("ascii")
+
+def _cheap_users(monkeypatch, tmp_path):
+    monkeypatch.setattr(api_server, "PBKDF2_ITERATIONS", 1000)
+    monkeypatch.setattr(api_server, "USERS", {})
+    monkeypatch.setattr(api_server, "USERS_FILE", str(tmp_path / "users.json"))
+    monkeypatch.setattr(api_server, "auth_cache", AuthCache(max_entries=2))
+    monkeypatch.setattr(api_server, "login_throttle", LoginThrottle())
+    monkeypatch.setattr(api_server, "token_store", TokenStore())
+    api_server.set_user("root", "s3cret", "admin")
+    api_server.set_user("carol", "pw1")
+
+def test_cached_auth_follows_credential_changes(monkeypatch, tmp_path):
+    _cheap_users(monkeypatch, tmp_path)
+    assert api_server.USERS["carol"]["password_hash"].startswith("pbkdf2_sha256$1000$")
+    auth = api_server.authenticate
+    old = _Request(_basic("carol", "pw1"))
+    assert auth(old) == auth(old) == ("carol", "user")
+    assert api_server.auth_cache.stats()["hits"] == 1
+    assert auth(_Request(_basic("carol", "nope"))) == auth(_Request(_basic("mallory", ""))) == (None, None)
+    assert auth(_Request(None)) == (None, None)
+
+    token = api_server.token_store.issue("carol", "user")
+    assert auth(_Request("Bearer " + token)) == ("carol", "user")
+    api_server.set_user("carol", "pw2", "admin")
+    assert auth(old) == (None, None)
+    assert auth(_Request("Bearer " + token)) == (None, None)
+    assert auth(_Request(_basic("carol", "pw2"))) == ("carol", "admin")
+
+    for name in ("root", "carol"):  # a third cached header evicts the least recently used one
+        auth(_Request(_basic(name, "s3cret" if name == "root" else "pw2")))
+    assert api_server.auth_cache.stats()["entries"] == 2
+    api_server.auth_cache.ttl = 0
+    api_server.auth_cache.invalidate()
+    misses = api_server.auth_cache.stats()["misses"]
+    assert auth(old) == (None, None) and auth(_Request(_basic("carol", "pw2"))) == ("carol", "admin")
+    assert auth(_Request(_basic("carol", "pw2"))) == ("carol", "admin")
+    assert api_server.auth_cache.stats()["misses"] == misses + 3  # expired at once with ttl 0
+
+    expired = TokenStore(ttl=-1)
+    assert expired.lookup(expired.issue("carol", "admin")) == (None, None)
+
+def test_token_and_user_endpoints(monkeypatch, tmp_path):
+    _cheap_users(monkeypatch, tmp_path)
+    server = HTTPServer(("127.0.0.1", 0), api_server.Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def call(method, path, header, body=None):
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+        conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                     headers={"Authorization": header} if header else {})
+        resp = conn.getresponse()
+        data = resp.read()
+        conn.close()
+        return resp.status, json.loads(data) if data else None
+
+    try:
+        status, body = call("POST", "/auth/token", _basic("carol", "pw1"))
+        assert status == 200 and body["token_type"] == "Bearer" and body["expires_in"] == api_server.TOKEN_TTL_SEC
+        bearer = "Bearer " + body["token"]
+        assert call("GET", "/transactions", bearer)[0] == 200
+        assert call("POST", "/auth/token", bearer)[0] == 400  # no refreshing a token with itself
+
+        admin = _basic("root", "s3cret")
+        assert call("PUT", "/admin/users/dave", admin, {"role": "user"})[0] == 400  # new users need a password
+        assert call("PUT", "/admin/users/dave", admin, {"password": "pw", "role": "owner"})[0] == 400
+        assert call("PUT", "/admin/users/dave", admin, {"password": "pw"}) == (201, {"username": "dave", "role": "user"})
+        assert call("PUT", "/admin/users/dave", bearer, {"role": "admin"})[0] == 403
+        assert call("GET", "/transactions", _basic("dave", "pw"))[0] == 200
+        assert call("PUT", "/admin/users/carol", admin, {"password": "pw9"})[0] == 200
+        assert call("GET", "/transactions", bearer)[0] == 401  # carol's token went with her old password
+        with open(api_server.USERS_FILE, encoding="utf-8") as f:
+            assert set(json.load(f)) == {"root", "carol", "dave"}
+
+        token = "Bearer " + call("POST", "/auth/token", _basic("dave", "pw"))[1]["token"]
+        assert call("DELETE", "/auth/token", token)[0] == 204
+        assert call("GET", "/transactions", token)[0] == 401
+        assert call("DELETE", "/admin/users/dave", admin)[0] == 204
+        assert call("DELETE", "/admin/users/dave", admin)[0] == 404
+        assert call("GET", "/transactions", _basic("dave", "pw"))[0] == 401
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_prefork_refuses_tokens_explicitly(monkeypatch, tmp_path):
+    # Prefork children do not share tokens: the token routes say so (501)
+    # instead of the read-only 503 the other writes get.
+    _cheap_users(monkeypatch, tmp_path)
+    monkeypatch.setattr(api_server, "READ_ONLY", True)
+    server = HTTPServer(("127.0.0.1", 0), api_server.Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def call(method, path, header):
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+        conn.request(method, path, headers={"Authorization": header})
+        resp = conn.getresponse()
+        data = resp.read()
+        conn.close()
+        return resp.status, json.loads(data)
+
+    try:
+        status, body = call("POST", "/auth/token", _basic("carol", "pw1"))
+        assert status == 501 and "prefork" in body["error"]
+        assert call("DELETE", "/auth/token", _basic("carol", "pw1"))[0] == 501
+        assert call("POST", "/auth/token", _basic("carol", "nope"))[0] == 401
+        assert call("DELETE", "/admin/users/carol", _basic("root", "s3cret"))[0] == 503
+        assert call("POST", "/transactions", _basic("root", "s3cret"))[0] == 503
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_failed_logins_are_throttled_per_client(monkeypatch, tmp_path):
+    _cheap_users(monkeypatch, tmp_path)
+    throttle = LoginThrottle(max_failures=3, window=60)
+    monkeypatch.setattr(api_server, "login_throttle", throttle)
+    auth = api_server.authenticate
+    good, bad = _Request(_basic("carol", "pw1")), _Request(_basic("carol", "nope"))
+    token = api_server.token_store.issue("root", "admin")
+    assert auth(good) == ("carol", "user")
+    for _ in range(3):
+        assert auth(bad) == (None, None)
+    with pytest.raises(LoginThrottled) as e:
+        auth(bad)
+    assert 0 < e.value.retry_after <= 60
+    with pytest.raises(LoginThrottled):
+        auth(_Request(_basic("root", "s3cret")))  # any uncached login from that client waits
+    assert auth(good) == ("carol", "user")  # cached headers and tokens are not throttled
+    assert auth(_Request("Bearer " + token)) == ("root", "admin")
+    other = _Request(_basic("root", "s3cret"))
+    other.client_address = ("10.0.0.2", 0)
+    assert auth(other) == ("root", "admin")
+    throttle.window = 0  # the failures age out
+    assert auth(bad) == (None, None)
+    assert throttle.stats()["throttled"] == 2
+
+    throttle.window = 60
+    server = HTTPServer(("127.0.0.1", 0), api_server.Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        statuses = []
+        for _ in range(3):
+            conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+            conn.request("GET", "/transactions", headers={"Authorization": _basic("root", "wrong")})
+            resp = conn.getresponse()
+            resp.read()
+            conn.close()
+            statuses.append(resp.status)
+        assert statuses == [401, 401, 429]  # one failure was left over from above
+        assert 0 < int(resp.getheader("Retry-After")) <= 60
+    finally:
+        server.shutdown()
+        server.server_close()
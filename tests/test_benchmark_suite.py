@@ -0,0 +1,31 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import benchmark
+import data_dsa
+from synth_sms import write_smses
+
+def test_synthetic_backup_parses_like_the_sample(tmp_path):
+    path = str(tmp_path / "smses.xml")
+    write_smses(path, 500, seed=3)
+    root_attrs = {}
+    raws = list(data_dsa.iter_xml_records(path, root_attrs=root_attrs))
+    assert len(raws) == 500 and root_attrs["count"] == "500"
+    assert [r["date"] for r in raws] == sorted(r["date"] for r in raws)
+    txs = [data_dsa.normalize_transaction(raw, data_dsa._IdSequence()) for raw in raws]
+    kinds = {tx["type"] for tx in txs}
+    assert {"payment", "transfer", "deposit"} <= kinds
+    assert sum(1 for tx in txs if tx.get("txid")) > 200
+    write_smses(str(tmp_path / "again.xml"), 500, seed=3)
+    assert open(path, "rb").read() == open(tmp_path / "again.xml", "rb").read()
+
+def test_compare_flags_slower_cases():
+    def results(**p50):
+        return {"results": {"10000": {k: {"p50_ms": v} for k, v in p50.items()}}}
+    report = benchmark.compare(results(lookup_hit=0.005, ingest=500, insert=0.01),
+                               results(lookup_hit=0.004, ingest=520, insert=0.02), threshold=0.2)
+    assert [r["case"] for r in report["regressions"]] == ["lookup_hit"]
+    assert [r["case"] for r in report["improvements"]] == ["insert"]
+    assert benchmark.summarize([0.003, 0.001, 0.002], items=10)["p50_ms"] == 2.0
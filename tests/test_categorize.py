@@ -0,0 +1,100 @@
+import json
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "etl"))
+
+from clean_normalize import categorize
+from parse_xml import extract
+import run
+from run import JsonLoader, run_pipeline, transform_batch
+
+import data_dsa
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modified_sms_v2 (1).xml")
+
+def test_kind_to_category():
+    assert categorize({"kind": "received"}) == "Received"
+    assert categorize({"kind": "deposit"}) == "Deposit"
+    assert categorize({"kind": "bank_transfer"}) == "Transfer"
+    assert categorize({"kind": "bundle"}) == "Airtime"
+    assert categorize({"kind": "otp"}) is None
+    assert categorize(None) is None
+
+def test_token_payments_split_by_counterparty():
+    assert categorize({"kind": "token_payment", "counterparty": "Airtime"}) == "Airtime"
+    assert categorize({"kind": "token_payment", "counterparty": "MTN Cash Power"}) == "Utility"
+    assert categorize({"kind": "token_payment", "counterparty": "WASAC"}) == "Utility"
+    assert categorize({"kind": "token_payment", "counterparty": "ONAFRIQ MAURITIUS"}) == "Payment"
+
+def test_categorize_extracted_body():
+    fields = extract(
+        "*162*TxId:13913173274*S*Your payment of 2000 RWF to Airtime with token  has been completed at "
+        "2024-05-12 11:41:28. Fee was 0 RWF. Your new balance: 25280 RWF . Message: - -. *EN#"
+    )
+    assert categorize(fields) == "Airtime"
+
+def test_transform_batch_returns_compact_rows():
+    rows, cpu = transform_batch(["not a momo message"])
+    assert rows == [None]
+    assert cpu >= 0
+
+def test_pipeline_matches_in_order(tmp_path):
+    out = tmp_path / "out.json"
+    report = run_pipeline(SAMPLE_XML, JsonLoader(str(out)), workers=2, batch_size=250)
+    records = json.loads(out.read_text(encoding="utf-8"))
+    assert report["messages"] == len(records)
+    assert [r["id"] for r in records] == [str(i) for i in range(1, len(records) + 1)]
+    assert records[0]["type"] == "received" and records[0]["category"] == "Received"
+
+def test_pipeline_records_load_without_renormalizing(tmp_path, monkeypatch):
+    out = str(tmp_path / "out.json")
+    run_pipeline(SAMPLE_XML, JsonLoader(out), workers=1, batch_size=500)
+    with open(out, encoding="utf-8") as f:
+        records = json.load(f)
+    data_dsa.load_from_xml(SAMPLE_XML)
+    expected = [json.dumps(tx) for tx in data_dsa.store]  # every attribute under _raw, keys in the same order too
+    assert [json.dumps(r) for r in records] == expected and len(expected) > 1000
+    assert any(r["type"] == r["_raw"]["type"] for r in records)  # bodies that do not parse keep the SMS type
+
+    calls = []
+    normalize = data_dsa.normalize_transaction
+    monkeypatch.setattr(data_dsa, "normalize_transaction", lambda *a: calls.append(a) or normalize(*a))
+    data_dsa.load_from_json(out)
+    try:
+        assert not calls and [json.dumps(tx) for tx in data_dsa.store] == [json.dumps(r) for r in records]
+        assert data_dsa.next_id == len(records) + 1
+    finally:
+        data_dsa.store.clear()
+
+def test_failed_run_aborts_the_loader(tmp_path, monkeypatch):
+    calls = []
+
+    def failing(bodies):
+        calls.append(len(bodies))
+        if len(calls) == 4:
+            raise RuntimeError("worker crashed")
+        return transform_batch(bodies)
+
+    monkeypatch.setattr(run, "transform_batch", failing)
+    out = tmp_path / "out.json"
+    out.write_text("[]", encoding="utf-8")
+    with pytest.raises(RuntimeError):
+        run_pipeline(SAMPLE_XML, JsonLoader(str(out)), batch_size=200)
+    assert out.read_text(encoding="utf-8") == "[]" and os.listdir(tmp_path) == ["out.json"]
+
+    calls.clear()
+    loader = run.SqliteLoader(str(tmp_path / "t.db"))
+    loader.writer.commit_rows = 300  # batches 1-2 are committed together, batch 3 is not
+    with pytest.raises(RuntimeError):
+        run_pipeline(SAMPLE_XML, loader, batch_size=200)
+    with pytest.raises(sqlite3.ProgrammingError):
+        loader.conn.execute("SELECT 1")  # closed
+    conn = sqlite3.connect(str(tmp_path / "t.db"), timeout=0)
+    conn.execute("BEGIN IMMEDIATE")  # no transaction left open on the file
+    assert conn.execute('SELECT COUNT(*) FROM "Transaction"').fetchone()[0] == 400
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'").fetchone()[0]
+    conn.close()
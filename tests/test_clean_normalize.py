@@ -0,0 +1,27 @@
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "etl"))
+
+from clean_normalize import clean_fields, clean_text, parse_amount, parse_datetime
+
+def test_parse_amount():
+    assert parse_amount("1,000") == 1000
+    assert parse_amount("40000") == 40000
+    assert parse_amount("") is None
+    assert parse_amount(None) is None
+    assert parse_amount("12.5") is None
+
+def test_parse_datetime():
+    assert parse_datetime("2024-05-10 16:31:39") == datetime(2024, 5, 10, 16, 31, 39)
+    assert parse_datetime("not a date") is None
+    assert parse_datetime(None) is None
+
+def test_clean_text_collapses_whitespace():
+    assert clean_text("  DIRECT PAYMENT LTD  ") == "DIRECT PAYMENT LTD"
+    assert clean_text("   ") is None
+
+def test_clean_fields_drops_empty_values():
+    fields = clean_fields({"amount": "2,500", "balance": None, "fee": "", "counterparty": "Jane  Smith"})
+    assert fields == {"amount": 2500, "counterparty": "Jane Smith"}
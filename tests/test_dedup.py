@@ -0,0 +1,62 @@
+import os
+import xml.etree.ElementTree as ET
+from itertools import islice
+
+import data_dsa
+from data_dsa import DedupIndex, dedup_key
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modified_sms_v2 (1).xml")
+
+def _write_backup(path, raws, backup_set):
+    root = ET.Element("smses", {"count": str(len(raws)), "backup_set": backup_set})
+    for raw in raws:
+        ET.SubElement(root, "sms", raw)
+    ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+
+def test_index_persists_grows_and_keeps_bloom(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_dsa, "DEDUP_MIN_SLOTS", 8)
+    monkeypatch.setattr(data_dsa, "DEDUP_BATCH", 3)
+    path = str(tmp_path / "seen.idx")
+    index = DedupIndex(path, bloom_capacity=100)
+    keys = [dedup_key({"address": "M-Money", "date": str(i), "body": f"sms {i}"}) for i in range(40)]
+    assert all(index.add(k) for k in keys)
+    assert not any(index.add(k) for k in keys[::3])
+    assert index.slots >= 80 and len(index) == 40
+    index.close()
+
+    index = DedupIndex(path, bloom_capacity=100)
+    assert all(k in index for k in keys) and index.bloom.count == 40
+    assert not index.add(keys[7]) and index.add(dedup_key({"body": "TxId: 1. new"}))
+    stats = index.stats()
+    assert stats["keys"] == 41 and stats["duplicates"] == 1 and stats["bloom"]["skips"] == 1
+    index.clear()
+    assert len(index) == 0 and keys[0] not in index
+    index.close()
+
+def test_overlapping_backups_are_ingested_once(tmp_path):
+    raws = list(islice(data_dsa.iter_xml_records(SAMPLE_XML), 300))
+    # The same messages in another backup set; a TxId message matches on its id even with another date.
+    moved = [{**raw, "date": str(int(raw["date"]) + 1000)} if "TxId" in raw.get("body", "") else raw
+             for raw in raws[200:]]
+    assert moved != raws[200:]
+    a, b = str(tmp_path / "a.xml"), str(tmp_path / "b.xml")
+    _write_backup(a, raws[:250], "phone-1")
+    _write_backup(b, moved, "phone-2")
+
+    data_dsa.open_dedup_index(str(tmp_path / "seen.idx"), bloom_capacity=1000)
+    try:
+        data_dsa.load_from_xml_streaming(a)
+        assert data_dsa.transaction_count() == 250
+        stats = data_dsa.ingest_xml_incremental(b)
+        assert (stats["appended"], stats["duplicates"]) == (50, 50)
+        assert data_dsa.transaction_count() == 300
+
+        data_dsa.reload_store(b)  # full reload: the index starts over with this backup only
+        assert data_dsa.transaction_count() == 100
+        assert len(data_dsa.dedup_index) == 100
+        data_dsa.close_dedup_index()
+        data_dsa.open_dedup_index(str(tmp_path / "seen.idx"), bloom_capacity=1000)
+        assert data_dsa.ingest_xml_incremental(a)["appended"] == 200
+    finally:
+        data_dsa.close_dedup_index()
+        data_dsa.store.clear()
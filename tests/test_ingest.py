@@ -0,0 +1,67 @@
+import json
+import os
+import xml.etree.ElementTree as ET
+
+import data_dsa
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modified_sms_v2 (1).xml")
+
+def _write_backup(path, raws, backup_set):
+    root = ET.Element("smses", {"count": str(len(raws)), "backup_set": backup_set})
+    for raw in raws:
+        ET.SubElement(root, "sms", raw)
+    ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+
+def _loaded():
+    return [json.dumps(tx) for tx in data_dsa.store], data_dsa.next_id, json.dumps(data_dsa.ingest_state)
+
+def test_streaming_load_matches_the_tree_loader(tmp_path, monkeypatch):
+    small = str(tmp_path / "small.xml")  # fewer records than STREAM_PROBE_ELEMENTS
+    raws = [dict(elem.attrib) for elem in ET.parse(SAMPLE_XML).getroot()][:10]
+    _write_backup(small, raws, "small")
+    commits = []
+    commit = data_dsa._commit_chunk
+    monkeypatch.setattr(data_dsa, "_commit_chunk", lambda txs: (commits.append(len(txs)), commit(txs)))
+    try:
+        for path in (SAMPLE_XML, small):
+            data_dsa.load_from_xml(path)
+            expected = _loaded()
+            assert len(expected[0]) == len(raws) if path == small else len(expected[0]) > 1000
+            for chunk_size in (1, 7, data_dsa.STREAM_CHUNK_SIZE):
+                commits.clear()
+                data_dsa.load_from_xml_streaming(path, chunk_size=chunk_size)
+                assert _loaded() == expected, (path, chunk_size)
+                n = len(expected[0])
+                assert commits == [chunk_size] * (n // chunk_size) + ([n % chunk_size] if n % chunk_size else [])
+    finally:
+        data_dsa.store.clear()
+
+def test_incremental_ingest_skips_what_it_has_and_takes_late_messages(tmp_path):
+    raws = sorted((dict(elem.attrib) for elem in ET.parse(SAMPLE_XML).getroot()), key=lambda r: int(r["date"]))
+    day1, day2 = str(tmp_path / "day1.xml"), str(tmp_path / "day2.xml")
+    _write_backup(day1, raws[:100], "phone")
+    watermark = int(raws[99]["date"])
+    late = {**raws[99], "date": str(watermark - 3_600_000), "body": "You have received 10 RWF from a late sender."}
+    stale = {**late, "date": str(watermark - data_dsa.INGEST_SLACK_MS - 1), "body": "Older than the slack window."}
+    resent = raws[98]  # inside the window and already ingested
+    _write_backup(day2, raws[:150] + [late, stale, resent], "phone")
+    try:
+        data_dsa.load_from_xml_streaming(day1)
+        assert data_dsa.ingest_state["phone"]["watermark"] == watermark
+        stats = data_dsa.ingest_xml_incremental(day1)
+        assert (stats["scanned"], stats["appended"], stats["skipped"]) == (100, 0, 100)
+        assert data_dsa.transaction_count() == 100
+
+        stats = data_dsa.ingest_xml_incremental(day2)
+        assert (stats["scanned"], stats["appended"], stats["skipped"]) == (153, 51, 102)
+        assert stats["watermark"] == int(raws[149]["date"])
+        bodies = [tx["_raw"]["body"] for tx in data_dsa.store]
+        assert late["body"] in bodies and stale["body"] not in bodies and len(bodies) == 151
+
+        state = str(tmp_path / "state.json")  # the watermark survives a restart
+        data_dsa.save_ingest_state(state)
+        data_dsa.ingest_state.clear()
+        data_dsa.load_ingest_state(state)
+        assert data_dsa.ingest_xml_incremental(day2)["appended"] == 0
+    finally:
+        data_dsa.store.clear()
@@ -0,0 +1,130 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "etl"))
+
+import load_db
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modified_sms_v2 (1).xml")
+
+def _records(n, start=1):
+    return [{"id": str(i), "type": "payment", "amount": "1,500", "sender": "M-Money", "receiver": "",
+             "timestamp": str(1715351458724 + i * 1000), "owner": "alice" if i % 2 else "bob",
+             "category": "Payment", "fee": 0, "counterparty": "Shop", "_raw": {"body": f"sms {i}"}}
+            for i in range(start, start + n)]
+
+def _index_names(conn):
+    return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")}
+
+def test_bulk_load_defers_indexes_and_round_trips(tmp_path):
+    conn = load_db.connect(str(tmp_path / "t.db"))
+    stats = load_db.bulk_load(conn, _records(12), batch_size=5)
+    assert stats["rows"] == 12 and stats["deferred_indexes"]
+    assert _index_names(conn) == set(load_db.INDEXES)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    row = conn.execute('SELECT Amount, Type, Charge, Owner, Kind, Epoch_ms, Record, Raw_text FROM "Transaction" '
+                       "JOIN Message USING (MessageID) WHERE RecordID = '3'").fetchone()
+    assert row[:6] == (1500, "Payment", 0, "alice", "payment", 1715351461724)
+    assert '"id": "3"' in row[6] and row[7] == "sms 3"
+    plan = conn.execute('EXPLAIN QUERY PLAN SELECT Record FROM "Transaction" WHERE RecordID = ?', ("3",)).fetchall()
+    assert "idx_transaction_record" in plan[0][3]
+
+def test_load_into_existing_table_keeps_indexes(tmp_path):
+    conn = load_db.connect(str(tmp_path / "t.db"))
+    load_db.bulk_load(conn, _records(5))
+    stats = load_db.bulk_load(conn, _records(5, start=6))
+    assert not stats["deferred_indexes"]
+    assert conn.execute('SELECT COUNT(*), MAX(TransactionID) FROM "Transaction"').fetchone() == (10, 10)
+
+def test_api_store_matches_in_memory_store(tmp_path):
+    import data_dsa
+    import db
+
+    path = str(tmp_path / "api.db")
+    stats = db.import_source(path, SAMPLE_XML)
+    db.open_database(path)
+    data_dsa.load_from_xml_streaming(SAMPLE_XML)
+    assert stats["rows"] == db.transaction_count() == data_dsa.transaction_count()
+    assert db.dict_lookup_by_id("5") == data_dsa.dict_lookup_by_id("5")
+    assert db.transaction_fragments(type_="deposit") == data_dsa.transaction_fragments(type_="deposit")
+
+    for args in ({}, {"type_": "payment"}, {"start": 1715351458724, "end": 1716000000000}):
+        seen, cursor = [], None
+        while True:
+            page, cursor = db.page_transactions(limit=100, cursor=cursor, **args)
+            seen += [tx["id"] for tx in page]
+            if cursor is None:
+                break
+        assert seen == [tx["id"] for tx in data_dsa.query_transactions(**args)]
+
+    for call in (db.query_transactions, db.transaction_fragments, db.page_transactions):
+        with pytest.raises(ValueError):
+            call(q="airtime")
+    with pytest.raises(ValueError):
+        next(db.iter_transactions(q="airtime"))
+
+    expected = data_dsa.transaction_stats(owner="M-Money")
+    got = db.transaction_stats(owner="M-Money")
+    expected.pop("version"), got.pop("version")
+    assert got == expected
+
+    version = db.store_version()
+    tx = db.normalize_transaction({"type": "payment", "amount": "5", "owner": "alice"})
+    assert db.add_transaction(tx) and not db.add_transaction(tx)
+    assert db.replace_transaction({**tx, "amount": "7"})
+    assert db.dict_lookup_by_id(tx["id"])["amount"] == "7"
+    assert db.remove_transaction(tx["id"])["amount"] == "7"
+    assert db.dict_lookup_by_id(tx["id"]) is None
+    assert db.store_version() == version + 3
+
+def test_pool_is_bounded_and_replaces_dead_connections(tmp_path, monkeypatch):
+    import db
+
+    path = str(tmp_path / "pool.db")
+    load_db.bulk_load(load_db.connect(path), _records(3))
+    pool = db.ConnectionPool(path, size=2)
+    a, b = pool.acquire(), pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()  # both connections are checked out
+    pool.release(a)
+    waiter.join(2)
+    assert got == [a]  # handed over, not a third connection
+    m = pool.metrics()
+    assert (m["open"], m["in_use"], m["opened"], m["waited"]) == (2, 2, 2, 1)
+
+    pool.release(b)
+    pool.release(got[0])
+    monkeypatch.setattr(db, "HEALTH_IDLE_SEC", 0.0)
+    a.close()
+    b.close()
+    with pool.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM "Transaction"').fetchone() == (3,)
+    assert pool.metrics()["replaced"] == 1
+    assert pool.check()
+
+def test_failed_load_rolls_back_and_restores_the_connection(tmp_path):
+    conn = load_db.connect(str(tmp_path / "t.db"))
+
+    def failing(n):
+        yield from _records(n)
+        raise ValueError("bad record")
+
+    with pytest.raises(ValueError):
+        with load_db.BulkWriter(conn, batch_size=3, commit_rows=5) as writer:
+            writer.add(failing(9))  # rows 1-6 are committed, 7-9 still pending
+    assert not conn.in_transaction
+    assert conn.execute('SELECT COUNT(*) FROM "Transaction"').fetchone()[0] == 6
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL again
+    assert writer.deferred and _index_names(conn) == set(load_db.INDEXES)
+
+    with pytest.raises(ValueError):
+        load_db.bulk_load(conn, failing(2))
+    assert not conn.in_transaction and conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    assert load_db.bulk_load(conn, _records(3, start=7))["rows"] == 3
+    assert conn.execute('SELECT COUNT(*) FROM "Transaction"').fetchone()[0] == 9
@@ -0,0 +1,82 @@
+import base64
+import http.client
+import threading
+from http.server import HTTPServer
+
+import api_server
+import data_dsa
+from api_server import AuthCache, HttpMetrics, LoginThrottle, route_label
+from data_dsa import Histogram, RWLock
+
+def _basic(username, password):
+    return "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode("ascii")
+
+def test_histograms_lock_and_operation_timings():
+    hist = Histogram((1.0, 2.0, 4.0))
+    for value in (0.5, 1.0, 1.5, 3.0, 9.0):
+        hist.observe(value)
+    assert hist.snapshot() == ([2, 3, 4, 5], 15.0, 5)  # cumulative; le is inclusive
+    assert hist.quantile(0.4) == 1.0 and hist.quantile(0.5) == 1.5
+    assert hist.quantile(1.0) == 4.0  # past the last finite bound
+    assert Histogram().quantile(0.99) == 0.0
+
+    lock = RWLock()
+    with lock.read():
+        pass
+    with lock:
+        pass
+    assert [lock.wait[side].count for side in ("read", "write")] == [1, 1]
+    assert [lock.hold[side].count for side in ("read", "write")] == [1, 1]
+
+    @data_dsa.timed_operation("test_op")
+    def boom():
+        raise ValueError
+    for _ in range(2):
+        try:
+            boom()
+        except ValueError:
+            pass
+    assert data_dsa.operation_seconds.pop("test_op").count == 2
+    assert data_dsa.operation_last.pop("test_op")[0] >= 0
+
+    assert route_label("/transactions/tx-42?x=1") == "/transactions/{id}"
+    assert route_label("/admin/users/carol") == "/admin/users/{name}"
+    assert route_label("/stats?owner=1") == "/stats"
+    assert route_label("/wp-login.php") == route_label("/transactions/1/2") == "other"
+
+def test_metrics_endpoint_is_admin_only(monkeypatch, tmp_path):
+    monkeypatch.setattr(api_server, "PBKDF2_ITERATIONS", 1000)
+    monkeypatch.setattr(api_server, "USERS", {})
+    monkeypatch.setattr(api_server, "USERS_FILE", str(tmp_path / "users.json"))
+    monkeypatch.setattr(api_server, "auth_cache", AuthCache())
+    monkeypatch.setattr(api_server, "login_throttle", LoginThrottle())
+    monkeypatch.setattr(api_server, "http_metrics", HttpMetrics())
+    api_server.set_user("root", "s3cret", "admin")
+    api_server.set_user("carol", "pw1")
+    server = HTTPServer(("127.0.0.1", 0), api_server.Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def get(path, header):
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+        conn.request("GET", path, headers={"Authorization": header})
+        resp = conn.getresponse()
+        data = resp.read()
+        conn.close()
+        return resp.status, resp.getheader("Content-Type"), data.decode("utf-8")
+
+    try:
+        assert get("/health", _basic("carol", "pw1"))[0] == 200
+        assert get("/nope/x", _basic("carol", "pw1"))[0] == 404
+        assert get("/metrics", _basic("carol", "pw1"))[0] == 403
+        status, content_type, text = get("/metrics", _basic("root", "s3cret"))
+        assert status == 200 and content_type == api_server.METRICS_CONTENT_TYPE
+        lines = set(text.splitlines())
+        assert 'momo_http_requests_total{method="GET",route="/health",status="200"} 1' in lines
+        assert 'momo_http_requests_total{method="GET",route="other",status="404"} 1' in lines
+        assert 'momo_http_requests_total{method="GET",route="/metrics",status="403"} 1' in lines
+        assert 'momo_http_request_duration_seconds_count{route="/health"} 1' in lines
+        assert "# TYPE momo_store_lock_wait_seconds histogram" in lines
+        assert any(line.startswith('momo_store_lock_hold_seconds_bucket{mode="read",le="+Inf"}') for line in lines)
+    finally:
+        server.shutdown()
+        server.server_close()
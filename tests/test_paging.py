@@ -0,0 +1,111 @@
+import base64
+import http.client
+import json
+import os
+import socket
+import threading
+from http.server import HTTPServer
+
+import pytest
+
+import api_server
+import data_dsa
+from api_server import AuthCache, LoginThrottle, ResponseCache
+from data_dsa import DictStore
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modified_sms_v2 (1).xml")
+ROOT = "Basic " + base64.b64encode(b"root:s3cret").decode("ascii")
+
+@pytest.fixture
+def port(monkeypatch, tmp_path):
+    monkeypatch.setattr(api_server, "PBKDF2_ITERATIONS", 1000)
+    monkeypatch.setattr(api_server, "USERS", {})
+    monkeypatch.setattr(api_server, "USERS_FILE", str(tmp_path / "users.json"))
+    monkeypatch.setattr(api_server, "auth_cache", AuthCache())
+    monkeypatch.setattr(api_server, "login_throttle", LoginThrottle())
+    monkeypatch.setattr(api_server, "response_cache", ResponseCache())
+    monkeypatch.setattr(api_server, "STREAM_CHUNK_BYTES", 1024)  # many chunks per response
+    monkeypatch.setattr(data_dsa, "store", DictStore())
+    api_server.set_user("root", "s3cret", "admin")
+    data_dsa.load_from_xml_streaming(SAMPLE_XML)
+    server = HTTPServer(("127.0.0.1", 0), api_server.Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+def _get(port, path):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request("GET", path, headers={"Authorization": ROOT})
+    resp = conn.getresponse()
+    body = resp.read()
+    conn.close()
+    return resp.status, resp.getheader("Transfer-Encoding"), json.loads(body)
+
+def _pages(port, path, on_page=None):
+    seen, cursor = [], None
+    while True:
+        status, _, body = _get(port, path + (f"&cursor={cursor}" if cursor else ""))
+        assert status == 200 and len(body["items"]) <= 50
+        seen += body["items"]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return seen
+        if on_page:
+            on_page(seen)
+
+def _new(tx_id, type_):
+    return {"id": tx_id, "type": type_, "amount": "1", "sender": "", "receiver": "",
+            "timestamp": "1715351458724", "owner": "M-Money"}
+
+def test_cursor_pages_are_stable_across_writes(port):
+    for path, type_ in (("/transactions?limit=50", None), ("/transactions?type=payment&limit=50", "payment")):
+        base = [tx["id"] for tx in data_dsa.scan_transactions(type_=type_)]
+        dropped, inserted = [], []
+
+        def mutate(seen):
+            # Delete the last record returned and the next one still ahead, then insert one.
+            data_dsa.remove_transaction(seen[-1]["id"])
+            ahead = base[base.index(seen[-1]["id"]) + 1:]
+            ahead = next(i for i in ahead if i not in dropped)
+            data_dsa.remove_transaction(ahead)
+            dropped.append(ahead)
+            inserted.append(f"new-{type_}-{len(seen)}")
+            data_dsa.add_transaction(_new(inserted[-1], type_ or "deposit"))
+
+        seen = [tx["id"] for tx in _pages(port, path, mutate)]
+        assert len(inserted) > 3 and len(seen) == len(set(seen))
+        assert seen == [i for i in base if i not in dropped] + inserted
+
+def test_fields_projection_and_bad_queries(port):
+    records = data_dsa.all_transactions()
+    expected = [{"id": tx["id"], "amount": tx["amount"]} for tx in records]
+    assert _get(port, "/transactions?fields=id,amount,nope")[2] == expected
+    assert _get(port, "/transactions?fields=id,amount&stream=1")[2] == expected
+    assert _pages(port, "/transactions?fields=id,amount&limit=50") == expected
+    assert _get(port, "/transactions?fields=id,amount&limit=50&stream=1")[2]["items"] == expected[:50]
+
+    time_cursor = data_dsa.encode_cursor(["t", 1715351458724, records[0]["id"]])
+    for query in ("cursor=!!!", "cursor=" + base64.urlsafe_b64encode(b'["s","1"]').decode(),
+                  "cursor=" + data_dsa.encode_cursor(["x", 1]), "cursor=" + time_cursor,
+                  "limit=0", "limit=many", f"limit={api_server.PAGE_LIMIT_MAX + 1}"):
+        status, _, body = _get(port, "/transactions?" + query)
+        assert status == 400 and ("cursor" in body["error"] or "limit" in body["error"]), query
+
+def test_chunked_body_matches_the_unpaged_response(port):
+    status, encoding, full = _get(port, "/transactions")
+    assert status == 200 and encoding is None and len(full) == data_dsa.transaction_count()
+    for query in ("stream=1", "stream=true&owner=M-Money", "stream=1&fields=id,type,amount,timestamp,owner,sender,"
+                  "receiver,_raw," + ",".join(data_dsa.DETAIL_FIELDS)):
+        status, encoding, body = _get(port, "/transactions?" + query)
+        assert status == 200 and encoding == "chunked" and body == full, query
+    status, encoding, paged = _get(port, "/transactions?limit=500&stream=1")
+    assert encoding == "chunked" and paged["items"] == full[:500]
+    assert paged == _get(port, "/transactions?limit=500")[2]
+
+    # HTTP/1.0 has no chunked encoding: the stream is delimited by closing the connection.
+    with socket.create_connection(("127.0.0.1", port), timeout=10) as s:
+        s.sendall(f"GET /transactions?stream=1 HTTP/1.0\r\nAuthorization: {ROOT}\r\n\r\n".encode())
+        raw = b"".join(iter(lambda: s.recv(65536), b""))
+    head, _, body = raw.partition(b"\r\n\r\n")
+    assert b"Transfer-Encoding" not in head and b"Connection: close" in head and json.loads(body) == full
@@ -0,0 +1,80 @@
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "etl"))
+
+from parse_xml import extract, extract_batch, iter_sms
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modified_sms_v2 (1).xml")
+
+def test_received():
+    fields = extract(
+        "You have received 2000 RWF from Jane Smith (*********013) on your mobile money account at "
+        "2024-05-10 16:30:51. Message from sender: . Your new balance:2000 RWF. "
+        "Financial Transaction Id: 76662021700."
+    )
+    assert fields == {
+        "kind": "received",
+        "amount": 2000,
+        "counterparty": "Jane Smith",
+        "counterparty_phone": "*********013",
+        "occurred_at": datetime(2024, 5, 10, 16, 30, 51),
+        "balance": 2000,
+        "txid": "76662021700",
+    }
+
+def test_payment_with_thousands_separators():
+    fields = extract(
+        "TxId: 73214484437. Your payment of 1,000 RWF to Jane Smith 12845 has been completed at "
+        "2024-05-10 16:31:39. Your new balance: 1,000 RWF. Fee was 0 RWF.Kanda*182*16# wiyandikishe"
+    )
+    assert fields["kind"] == "payment"
+    assert fields["amount"] == 1000
+    assert fields["balance"] == 1000
+    assert fields["fee"] == 0
+    assert fields["txid"] == "73214484437"
+    assert fields["counterparty"] == "Jane Smith"
+
+def test_bank_deposit():
+    fields = extract(
+        "*113*R*A bank deposit of 40000 RWF has been added to your mobile money account at "
+        "2024-05-11 18:43:49. Your NEW BALANCE :40400 RWF. Cash Deposit::CASH::::0::250795963036."
+    )
+    assert fields["kind"] == "deposit"
+    assert fields["amount"] == 40000
+    assert fields["balance"] == 40400
+    assert "fee" not in fields
+
+def test_transfer_fee_before_balance():
+    fields = extract(
+        "*165*S*1500 RWF transferred to Robert Brown (250788999999) from 36521838 at 2024-05-15 18:04:03 . "
+        "Fee was: 100 RWF. New balance: 1340 RWF. Kugura ama inite cg interineti kuri MoMo"
+    )
+    assert fields["kind"] == "transfer"
+    assert (fields["amount"], fields["fee"], fields["balance"]) == (1500, 100, 1340)
+    assert fields["counterparty_phone"] == "250788999999"
+
+def test_withdrawal_shares_prefix_bucket():
+    fields = extract(
+        "You Abebe Chala CHEBUDIE (*********036) have via agent: Agent Sophia (250790777777), withdrawn "
+        "20000 RWF from your mobile money account: 36521838 at 2024-05-26 02:10:27 and you can now collect "
+        "your money in cash. Your new balance: 6400 RWF. Fee paid: 350 RWF. Message from agent: 1. "
+        "Financial Transaction Id: 14098463509."
+    )
+    assert fields["kind"] == "withdrawal"
+    assert fields["counterparty"] == "Agent Sophia"
+    assert (fields["amount"], fields["fee"], fields["balance"]) == (20000, 350, 6400)
+
+def test_unknown_and_empty_bodies():
+    assert extract("") is None
+    assert extract(None) is None
+    assert extract("1) 2024-08-23 DEPOSIT RWF 25000 Receiver: 250795963036") is None
+
+def test_batch_over_sample_backup():
+    bodies = [sms["body"] for sms in iter_sms(SAMPLE_XML)]
+    results = extract_batch(bodies)
+    assert len(results) == len(bodies)
+    matched = [r for r in results if r]
+    assert len(matched) > 0.99 * len(bodies)
+    assert all(isinstance(r["amount"], int) for r in matched if r["kind"] != "otp")
@@ -0,0 +1,83 @@
+import cProfile
+import os
+import pstats
+import sys
+import tracemalloc
+
+import api_server
+import data_dsa
+from api_server import RequestProfiler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "etl"))
+
+from run import JsonLoader, run_pipeline
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modified_sms_v2 (1).xml")
+
+def _leaf(n):
+    return sum(i * i for i in range(n))
+
+def _branch(n):
+    return _leaf(n) + _leaf(n // 2)
+
+def test_sampled_profiles_and_collapsed_stacks(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_dsa, "PROFILE_KEEP", 2)
+    monkeypatch.setattr(data_dsa, "profile_captures", [])
+    monkeypatch.setattr(api_server, "profile_captures", data_dsa.profile_captures)
+    monkeypatch.setattr(data_dsa, "PROFILE_DIR", str(tmp_path))
+
+    profile = cProfile.Profile()
+    profile.enable()
+    _branch(200_000)
+    profile.disable()
+    stats = pstats.Stats(profile)
+    stacks = data_dsa.collapsed_stacks(stats, min_sec=0)
+    assert abs(sum(stacks.values()) - stats.total_tt) < 1e-6
+    names = {tuple(frame.split(" (")[0] for frame in path.split(";")) for path in stacks}
+    assert ("_branch", "_leaf", "<built-in method builtins.sum>", "<genexpr>") in names
+
+    sampler = RequestProfiler(every=2)
+    for i in range(6):
+        p = sampler.start()
+        assert (p is not None) == (i % 2 == 1)
+        if p:
+            assert sampler.start() is None and sampler.start() is None  # due, but one is already running
+            sampler.finish(p, "GET", "/transactions/tx-9", 200, 0.01)
+    assert sampler.stats() == {"every": 2, "seen": 12, "sampled": 3, "skipped": 3}
+    captures = api_server.profiling_status()["captures"]
+    assert [c["label"] for c in captures] == ["GET /transactions/{id}"] * 2  # only PROFILE_KEEP are kept
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(f) for c in captures for f in c["files"])
+    with open(captures[-1]["files"][1], encoding="utf-8") as f:
+        assert all(line.rsplit(" ", 1)[1].strip().isdigit() for line in f)
+
+def test_allocation_traces_and_etl_stage_usage(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_dsa, "profile_captures", [])
+    monkeypatch.setattr(data_dsa, "PROFILE_DIR", str(tmp_path))
+    assert data_dsa.configure_profiling(trace_allocations=True)["trace_allocations"]
+
+    @data_dsa.timed_operation("test_inner")
+    def inner():
+        return [str(i) * 10 for i in range(20_000)]
+
+    @data_dsa.timed_operation("test_outer")
+    def outer():
+        return inner()
+
+    try:
+        kept = outer()
+    finally:
+        data_dsa.configure_profiling(trace_allocations=False)
+        data_dsa.operation_seconds.pop("test_inner"), data_dsa.operation_seconds.pop("test_outer")
+        data_dsa.operation_last.pop("test_inner"), data_dsa.operation_last.pop("test_outer")
+    assert not tracemalloc.is_tracing()
+    [capture] = data_dsa.profile_captures  # the nested call is part of the outer capture
+    assert capture["kind"] == "tracemalloc" and capture["label"] == "test_outer"
+    assert capture["peak_mb"] > 1 and capture["retained_mb"] > 1 and len(kept) == 20_000
+    assert os.path.basename(capture["top"][0]["at"]).startswith("test_profiling.py:")
+    assert len(tracemalloc.Snapshot.load(capture["files"][0]).traces) > 0
+
+    report = run_pipeline(SAMPLE_XML, JsonLoader(str(tmp_path / "out.json")), workers=1, trace_memory=True)
+    assert set(report["usage"]) == {"parse", "transform", "load"}
+    assert all(u["wall_sec"] > 0 and u["cpu_sec"] >= 0 and u["peak_mb"] > 0 for u in report["usage"].values())
+    assert not tracemalloc.is_tracing()
+    assert run_pipeline(SAMPLE_XML, JsonLoader(str(tmp_path / "out.json")))["usage"]["load"]["peak_mb"] is None
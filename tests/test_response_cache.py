@@ -0,0 +1,132 @@
+import base64
+import gzip
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import HTTPServer
+
+import pytest
+
+import api_server
+import data_dsa
+from api_server import AuthCache, LoginThrottle, ResponseCache
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modified_sms_v2 (1).xml")
+
+def _basic(username, password):
+    return "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode("ascii")
+
+ROOT, CAROL = _basic("root", "s3cret"), _basic("carol", "pw1")
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    monkeypatch.setattr(api_server, "PBKDF2_ITERATIONS", 1000)
+    monkeypatch.setattr(api_server, "USERS", {})
+    monkeypatch.setattr(api_server, "USERS_FILE", str(tmp_path / "users.json"))
+    monkeypatch.setattr(api_server, "auth_cache", AuthCache())
+    monkeypatch.setattr(api_server, "login_throttle", LoginThrottle())
+    monkeypatch.setattr(api_server, "response_cache", ResponseCache())
+    api_server.set_user("root", "s3cret", "admin")
+    api_server.set_user("carol", "pw1")
+    data_dsa.load_from_xml_streaming(SAMPLE_XML)
+    httpd = HTTPServer(("127.0.0.1", 0), api_server.Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+    data_dsa.store.clear()
+
+def _request(port, method, path, auth, headers=None, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request(method, path, body=body, headers={"Authorization": auth, **(headers or {})})
+    resp = conn.getresponse()
+    data = resp.read()
+    conn.close()
+    return resp.status, {k.lower(): v for k, v in resp.getheaders()}, data
+
+def test_etag_revalidation_and_gzip(server):
+    status, headers, body = _request(server, "GET", "/transactions", ROOT)
+    etag = headers["etag"]
+    assert status == 200 and etag.startswith('W/"') and headers["vary"] == "Accept-Encoding"
+    assert "content-encoding" not in headers and len(json.loads(body)) == data_dsa.transaction_count()
+
+    status, headers, data = _request(server, "GET", "/transactions", ROOT, {"If-None-Match": f'"x", {etag}'})
+    assert status == 304 and headers["etag"] == etag and data == b""
+    assert _request(server, "GET", "/transactions", ROOT, {"If-None-Match": "*"})[0] == 304
+
+    hits = api_server.response_cache.hits
+    for _ in range(2):  # the gzip copy is made once and then served from the cache entry
+        status, headers, gz = _request(server, "GET", "/transactions", ROOT, {"Accept-Encoding": "gzip, br"})
+        assert status == 200 and headers["content-encoding"] == "gzip" and headers["etag"] == etag
+        assert headers["vary"] == "Accept-Encoding" and gzip.decompress(gz) == body
+    assert api_server.response_cache.hits == hits + 2
+    [entry] = api_server.response_cache.entries.values()
+    assert entry[3] == gz and api_server.response_cache.size == len(body) + len(gz)
+
+    status, headers, small = _request(server, "GET", "/transactions?owner=nobody", ROOT, {"Accept-Encoding": "gzip"})
+    assert status == 200 and json.loads(small) == [] and "content-encoding" not in headers  # under GZIP_MIN_BYTES
+
+def test_write_changes_etag_and_principals_are_isolated(server):
+    admin_etag = _request(server, "GET", "/transactions", ROOT)[1]["etag"]
+    status, headers, body = _request(server, "GET", "/transactions", CAROL, {"If-None-Match": admin_etag})
+    assert status == 200 and json.loads(body) == []  # not the admin's validator, nor the admin's body
+    carol_etag = headers["etag"]
+    assert carol_etag != admin_etag
+    assert _request(server, "GET", "/transactions", CAROL, {"If-None-Match": carol_etag})[0] == 304
+
+    status, _, created = _request(server, "POST", "/transactions", CAROL,
+                                  {"Content-Type": "application/json"}, json.dumps({"type": "payment", "amount": "5"}))
+    assert status == 201
+    created = json.loads(created)
+    status, headers, body = _request(server, "GET", "/transactions", CAROL, {"If-None-Match": carol_etag})
+    assert status == 200 and headers["etag"] != carol_etag and json.loads(body) == [created]
+    status, headers, body = _request(server, "GET", "/transactions", ROOT, {"If-None-Match": admin_etag})
+    assert status == 200 and headers["etag"] != admin_etag and created in json.loads(body)
+    assert _request(server, "GET", f"/transactions/{created['id']}", ROOT)[0] == 200
+    keys = {entry[0][0] for entry in api_server.response_cache.entries.values()}
+    assert keys == {"*", "carol"}
+
+def test_cache_stays_under_its_byte_bound(server, monkeypatch):
+    cache = ResponseCache(max_bytes=100)
+    a, b = cache.put("a", 1, b"x" * 40), cache.put("b", 1, b"y" * 40)
+    assert cache.get("a", 1) is a and cache.get("a", 2) is None  # a is now most recently used
+    cache.put("c", 1, b"z" * 40)
+    assert list(cache.entries) == ["a", "c"] and cache.size == 80
+    cache.add_gzip(a, b"g" * 30)
+    assert list(cache.entries) == ["c"] and cache.size == 40  # a grew past the bound and was least recent
+    cache.add_gzip(b, b"g")  # evicted entries do not count their gzip copy
+    assert cache.size == 40
+    cache.put("a", 2, b"w" * 500)
+    assert list(cache.entries) == ["a"] and cache.size == 500  # one oversized entry is still kept
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    body = _request(server, "GET", "/transactions", ROOT)[2]
+    monkeypatch.setattr(api_server, "response_cache", ResponseCache(max_bytes=len(body) + 100))
+    _request(server, "GET", "/transactions", ROOT)
+    _request(server, "GET", "/transactions?type=payment", ROOT)
+    assert list(k[2] for k in api_server.response_cache.entries) == ["type=payment"]
+    assert api_server.response_cache.size <= len(body) + 100
+
+def test_etags_from_an_earlier_run_do_not_match(server, monkeypatch):
+    status, headers, body = _request(server, "GET", "/transactions", ROOT)
+    etag = headers["etag"]
+    assert _request(server, "GET", "/transactions", ROOT, {"If-None-Match": etag})[0] == 304
+
+    # Each process draws its own boot id, so equal versions still give different validators.
+    script = "import api_server; print(api_server.make_etag(7, 'k'))"
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = {subprocess.run([sys.executable, "-c", script], cwd=here, capture_output=True, text=True,
+                           check=True).stdout for _ in range(2)}
+    assert len(runs) == 2
+
+    # A restart that lands on the same store version with other data.
+    version = data_dsa.store_version()
+    monkeypatch.setattr(api_server, "BOOT_ID", os.urandom(4).hex())
+    monkeypatch.setattr(api_server, "response_cache", ResponseCache())
+    data_dsa.remove_transaction(data_dsa.all_transactions()[0]["id"])
+    data_dsa.store.version = version
+    status, headers, fresh = _request(server, "GET", "/transactions", ROOT, {"If-None-Match": etag})
+    assert status == 200 and headers["etag"] != etag and len(json.loads(fresh)) == len(json.loads(body)) - 1
@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import data_dsa
+from bench_store import _full_pass_stats
+from data_dsa import CompactStore, DictStore, Rollups
+
+def _tx(i, **kw):
+    tx = {"id": str(i), "type": "payment" if i % 3 else "received", "amount": str(100 * i),
+          "sender": "M-Money", "receiver": "", "timestamp": str(1715351458724 + i * 3600_000),
+          "owner": "alice" if i % 2 else "bob", "counterparty": f"Shop {i % 4}", "_raw": {}}
+    tx.update(kw)
+    return tx
+
+def test_rollups_follow_every_mutation():
+    for backend in (DictStore, CompactStore):
+        st = backend()
+        for i in range(1, 61):
+            st.append(_tx(i))
+        st.replace(_tx(7, type="deposit", amount="1,250", owner="carol"))
+        st.replace(_tx(8, counterparty=""))
+        for i in range(10, 30):
+            st.delete(str(i))
+        rollups = st.indexes["rollup"]
+        assert rollups.totals().summary() == _full_pass_stats(st)
+        for owner in ("alice", "bob", "carol"):
+            assert rollups.totals(owner).summary() == _full_pass_stats(tx for tx in st if tx["owner"] == owner)
+        assert rollups.totals().summary(("type",))["by_type"]["deposit"] == {"count": 1, "amount": 1250}
+
+def test_emptied_keys_are_dropped():
+    rollups = Rollups()
+    tx = _tx(1, amount="12.50")
+    rollups.add(tx)
+    rollups.remove(tx)
+    assert rollups.owners == {}
+    assert rollups.totals().summary() == {"count": 0, "amount": 0, "by_type": {}, "by_day": {},
+                                          "by_owner": {}, "by_counterparty": {}}
+
+def test_dashboard_is_written_from_the_live_store(monkeypatch, tmp_path):
+    st = DictStore()
+    for i in range(1, 11):
+        st.append(_tx(i))
+    monkeypatch.setattr(data_dsa, "store", st)
+    path = str(tmp_path / "dashboard.json")
+    data_dsa.write_dashboard(path)
+    with open(path, encoding="utf-8") as f:
+        dashboard = json.load(f)
+    assert dashboard["version"] == st.version
+    assert dashboard["count"] == 10
+    assert dashboard["by_owner"]["alice"] == {"count": 5, "amount": 2500}
@@ -0,0 +1,63 @@
+import data_dsa
+from data_dsa import CompactStore, DictStore
+
+def _tx(i, body, owner="alice"):
+    return {"id": str(i), "type": "payment", "amount": "100", "sender": "M-Money", "receiver": "",
+            "timestamp": str(1715351458724 + i * 1000), "owner": owner, "_raw": {"body": body}}
+
+def _ids(**kw):
+    return [tx["id"] for tx in data_dsa.query_transactions(**kw)]
+
+def test_search_follows_writes_and_owner(monkeypatch):
+    for backend in (DictStore, CompactStore):
+        monkeypatch.setattr(data_dsa, "store", backend())
+        data_dsa.add_transaction(_tx(1, "TxId: 73214484437. Your payment of 1,000 RWF to Samuel Carter"))
+        data_dsa.add_transaction(_tx(2, "You have received 2000 RWF from Jane Smith", owner="bob"))
+        data_dsa.add_transaction(_tx(3, "25000 RWF transferred to Samuel Carter (250791666666)"))
+        data_dsa.add_transaction(_tx(4, "Carter Samuel paid 500 RWF", owner="bob"))
+
+        assert _ids(q="samuel carter") == ["1", "3", "4"]
+        assert _ids(q='"samuel carter"') == ["1", "3"]
+        assert _ids(q="carte") == ["1", "3", "4"]  # partial: trigram match on the token vocabulary
+        assert _ids(q="84437") == ["1"]  # tail of the TxId
+        assert _ids(q="1,000") == _ids(q="1000") == ["1"]
+        assert _ids(q="samuel", owner="bob") == ["4"]
+        assert _ids(q="samuel", start=1715351458724 + 2500) == ["3", "4"]
+
+        data_dsa.replace_transaction(_tx(3, "25000 RWF transferred to Linda Green"))
+        data_dsa.remove_transaction("1")
+        data_dsa.add_transaction(_tx(5, "Your payment of 700 RWF to Samuel Carter"))
+        assert _ids(q="samuel carter") == ["4", "5"]
+        assert _ids(q="linda") == ["3"]
+        assert _ids(q="73214484437") == []
+
+        text = data_dsa.store.indexes["text"]
+        assert all(data_dsa.store.seq_of(i) == doc for doc, i in enumerate(text.doc_ids) if i is not None)
+        assert text.report()["documents"] == 4
+
+def test_search_pages_resume_from_the_cursor(monkeypatch):
+    monkeypatch.setattr(data_dsa, "store", DictStore())
+    for i in range(1, 26):
+        data_dsa.add_transaction(_tx(i, f"Your payment of {i}00 RWF to {'Alex Doe' if i % 3 else 'Jane Smith'}"))
+    seen, cursor = [], None
+    while True:
+        page, cursor = data_dsa.page_transactions(q="doe", limit=4, cursor=cursor)
+        seen += [tx["id"] for tx in page]
+        if cursor is None:
+            break
+        data_dsa.remove_transaction(seen[-1])  # deletes behind the cursor do not shift later pages
+    assert seen == [str(i) for i in range(1, 26) if i % 3]
+    page, _ = data_dsa.page_transactions(q="doe", start=1715351458724, limit=100)
+    assert [tx["id"] for tx in page] == [i for i in _ids(q="doe")]
+
+def test_bodies_stay_searchable_after_a_json_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_dsa, "store", DictStore())
+    data_dsa.add_transaction(_tx(1, "Your payment of 1,000 RWF to Samuel Carter"))
+    before = [data_dsa.encode_record(tx) for tx in data_dsa.store]
+    path = str(tmp_path / "s.json")
+    data_dsa.snapshot_to_json(path)
+    data_dsa.load_from_json(path)
+    assert [data_dsa.encode_record(tx) for tx in data_dsa.store] == before  # not re-nested under _raw
+    assert _ids(q="samuel carter") == ["1"]
+    nested = {**_tx(2, ""), "_raw": {**_tx(2, ""), "_raw": {"body": "from Jane Smith"}}}
+    assert data_dsa.search_text(nested) == "from Jane Smith"  # as older snapshots stored it
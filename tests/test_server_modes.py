@@ -0,0 +1,148 @@
+import asyncio
+import base64
+import http.client
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from http.server import HTTPServer
+
+import pytest
+
+import api_server
+import data_dsa
+from api_server import AuthCache, LoginThrottle, TokenStore
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modified_sms_v2 (1).xml")
+
+def _basic(username, password):
+    return "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode("ascii")
+
+ROOT = _basic("root", "s3cret")
+
+@pytest.fixture
+def users(monkeypatch, tmp_path):
+    monkeypatch.setattr(api_server, "PBKDF2_ITERATIONS", 1000)
+    monkeypatch.setattr(api_server, "USERS", {})
+    monkeypatch.setattr(api_server, "USERS_FILE", str(tmp_path / "users.json"))
+    monkeypatch.setattr(api_server, "auth_cache", AuthCache())
+    monkeypatch.setattr(api_server, "login_throttle", LoginThrottle())
+    monkeypatch.setattr(api_server, "token_store", TokenStore())
+    api_server.set_user("root", "s3cret", "admin")
+    data_dsa.load_from_xml_streaming(SAMPLE_XML)
+    yield
+    data_dsa.store.clear()
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+def _start(mode):
+    # Returns (port, stop) with the server in `mode` accepting connections.
+    if mode == "asyncio":
+        port, loop = _free_port(), asyncio.new_event_loop()
+        task = loop.create_task(api_server._serve_asyncio("127.0.0.1", port, 4))
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        assert _wait_for_port(port)
+        return port, lambda: loop.call_soon_threadsafe(task.cancel)
+    if mode == "serial":
+        server = HTTPServer(("127.0.0.1", 0), api_server.OneShotHandler)
+    else:
+        server = api_server.PooledHTTPServer(("127.0.0.1", 0), api_server.Handler, 4)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+    return server.server_address[1], stop
+
+def _get(conn, path):
+    conn.request("GET", path, headers={"Authorization": ROOT})
+    resp = conn.getresponse()
+    return resp, resp.read()
+
+@pytest.mark.parametrize("mode", ["serial", "threaded", "asyncio"])
+def test_modes_serve_keep_alive_and_streams(users, monkeypatch, mode):
+    monkeypatch.setattr(api_server, "STREAM_CHUNK_BYTES", 512)  # many chunks through each mode's wfile
+    port, stop = _start(mode)
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        resp, body = _get(conn, "/transactions")
+        full = json.loads(body)
+        assert resp.status == 200 and len(full) == data_dsa.transaction_count() > 1000
+        sock = conn.sock
+        resp, body = _get(conn, "/transactions?stream=1")
+        assert resp.getheader("Transfer-Encoding") == "chunked" and json.loads(body) == full
+        if mode == "serial":  # the only thread is not held by an idle client
+            assert resp.getheader("Connection") == "close" and sock is None and conn.sock is None
+        else:
+            assert resp.getheader("Connection") is None and sock is conn.sock
+            assert _get(conn, "/health")[0].status == 200 and sock is conn.sock
+        conn.close()
+    finally:
+        stop()
+
+def test_asyncio_writer_waits_for_each_chunk_to_drain():
+    loop, drained, written = asyncio.new_event_loop(), threading.Event(), []
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    class SlowReader:
+        def write(self, data):
+            written.append(data)
+
+        async def drain(self):
+            await loop.run_in_executor(None, drained.wait, 10)
+
+    out = api_server._LoopWriter(loop, SlowReader())
+    handler = threading.Thread(target=out.writelines, args=([b"x" * api_server.STREAM_CHUNK_BYTES] * 3,))
+    try:
+        handler.start()
+        while not written:
+            time.sleep(0.001)
+        time.sleep(0.05)
+        assert len(written) == 1 and handler.is_alive()  # held until the client reads the first chunk
+        drained.set()
+        handler.join(10)
+        assert len(written) == 3 and not handler.is_alive()
+    finally:
+        drained.set()
+        loop.call_soon_threadsafe(loop.stop)
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="prefork needs fork()")
+def test_prefork_serves_reads_and_refuses_writes(users, monkeypatch):
+    monkeypatch.setattr(api_server, "READ_ONLY", True)
+    httpd = api_server.PooledHTTPServer(("127.0.0.1", 0), api_server.Handler, 2)
+    port = httpd.server_address[1]
+    pid = os.fork()
+    if pid == 0:
+        try:
+            api_server._serve_prefork(httpd, 2)
+        finally:
+            os._exit(0)
+    httpd.server_close()
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        resp, body = _get(conn, "/transactions")
+        assert resp.status == 200 and len(json.loads(body)) == data_dsa.transaction_count()
+        conn.request("POST", "/transactions", body=json.dumps({"type": "payment", "amount": "5"}),
+                     headers={"Authorization": ROOT, "Content-Type": "application/json"})
+        resp = conn.getresponse()
+        assert resp.status == 503 and "Read-only" in json.loads(resp.read())["error"]
+        assert _get(conn, "/health")[0].status == 200  # the refused write did not break the connection
+        conn.close()
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
@@ -0,0 +1,48 @@
+import json
+import os
+
+import data_dsa
+from data_dsa import CompactStore, DictStore, LazyRaw, iter_binary_snapshot, write_binary_snapshot
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modified_sms_v2 (1).xml")
+
+def test_binary_snapshot_round_trips_the_store(tmp_path):
+    data_dsa.load_from_xml_streaming(SAMPLE_XML)
+    data_dsa.add_transaction(data_dsa.normalize_transaction(
+        {"type": "payment", "amount": "12.50", "owner": "alice", "note": "héllo ✓"}))
+    expected = list(data_dsa.store)
+    json_path, bin_path = str(tmp_path / "s.json"), str(tmp_path / "s.bin")
+    data_dsa.snapshot_store(json_path)
+    data_dsa.snapshot_store(bin_path)
+    assert os.path.getsize(bin_path) < os.path.getsize(json_path)
+
+    data_dsa.load_from_binary(bin_path)
+    assert data_dsa.transaction_count() == len(expected)
+    assert all(type(tx["_raw"]) is dict for tx in data_dsa.store.iter_stored())  # plain strings: rebuilt from refs
+    assert [json.dumps(tx) for tx in iter_binary_snapshot(bin_path, lazy=False)] == [json.dumps(tx) for tx in expected]
+    assert data_dsa.dict_lookup_by_id(expected[3]["id"]) == expected[3]
+    assert data_dsa.transaction_fragments() == [data_dsa.encode_record(tx) for tx in expected]
+    assert data_dsa.query_transactions(type_="deposit") == [tx for tx in expected if tx["type"] == "deposit"]
+    data_dsa.store.clear()
+
+def test_lazy_raw_is_decoded_on_first_read(tmp_path):
+    path = str(tmp_path / "s.bin")
+    records = [{"id": str(i), "type": "payment", "amount": "5", "sender": "M-Money", "receiver": "",
+                "timestamp": str(1715351458724 + i), "owner": "bob", "fee": i, "_raw": {"body": f"sms {i}", "parts": i}}
+               for i in range(1, 4)]
+    odd = {"id": "9", "amount": 7, "owner": "bob"}  # not in the usual shape: kept as-is
+    write_binary_snapshot(path, records + [odd])
+    for backend in (DictStore, CompactStore):
+        st = backend()
+        for tx in iter_binary_snapshot(path):
+            st.append(tx)
+        held = [tx.get("_raw") for tx in st.iter_stored()]
+        assert [type(r) for r in held[:3]] == [LazyRaw] * 3
+        assert held[0].get("body") == "sms 1" and held[0].load() is held[0].load()  # decoded once
+        assert st.get("2") == records[1]
+        assert type(next(t for t in st.iter_stored() if t["id"] == "2")["_raw"]) is dict
+        assert list(st)[:3] == records
+        copy = str(tmp_path / f"{backend.__name__}.bin")
+        write_binary_snapshot(copy, st.iter_stored())
+        assert list(iter_binary_snapshot(copy, lazy=False))[:3] == records
+    assert list(iter_binary_snapshot(path, lazy=False))[3] == odd
@@ -0,0 +1,163 @@
+import json
+import os
+
+import data_dsa
+from api_server import join_fragments
+from data_dsa import CompactStore, DictStore
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modified_sms_v2 (1).xml")
+BASE_MS = 1715351458724
+
+def _tx(i, **fields):
+    return {"id": f"tx-{i}", "type": ("payment", "deposit", "withdrawal")[i % 3], "amount": str(100 * i),
+            "sender": "M-Money", "receiver": "", "timestamp": str(BASE_MS + i * 3_600_000),
+            "owner": ("alice", "bob")[i % 2], "_raw": {"body": f"Your payment of {i}00 RWF"}, **fields}
+
+def _slots(s):
+    # (slots held, tombstones) for either backend.
+    return (len(s.slots), s.dead) if isinstance(s, DictStore) else (len(s._ids), s._dead)
+
+def _check_consistent(s):
+    # Every index and the id -> slot map agree with a plain walk of the store.
+    records = list(s)
+    assert [s.get(tx["id"]) for tx in records] == records
+    seqs = [s.seq_of(tx["id"]) for tx in records]
+    assert seqs == sorted(seqs)
+    assert s.fragments() == [data_dsa.encode_record(tx) for tx in records]
+    for field in ("owner", "type"):
+        values = {tx[field] for tx in records}
+        assert set(s.indexes[field].buckets) == values
+        for v in values:
+            assert list(s.indexes[field].ids(v)) == [tx["id"] for tx in records if tx[field] == v]
+    by_time = sorted((int(tx["timestamp"]), tx["id"]) for tx in records)
+    assert list(s.indexes["time"].entries()) == by_time
+    return records
+
+def test_tombstones_compact_once_they_outnumber_live_rows(monkeypatch):
+    monkeypatch.setattr(data_dsa, "TOMBSTONE_COMPACT_MIN", 8)
+    for backend in (DictStore, CompactStore):
+        s = backend()
+        for i in range(4):
+            s.append(_tx(i))
+        for i in range(3):
+            s.delete(f"tx-{i}")
+        assert _slots(s) == (4, 3)  # outnumbered, but under TOMBSTONE_COMPACT_MIN
+
+        s = backend()
+        for i in range(40):
+            s.append(_tx(i))
+        s.fragments()  # cached fragments must move with their rows
+        s.replace(_tx(39, amount="7"))
+        order = [tx["id"] for tx in s]
+        seqs = {i: s.seq_of(i) for i in order}
+        doomed = [f"tx-{i}" for i in range(0, 40, 2)]
+        for tx_id in doomed:
+            assert s.delete(tx_id)["id"] == tx_id
+        assert _slots(s) == (40, 20)  # tombstones == live rows: not yet
+        assert s.delete("tx-1")["id"] == "tx-1"
+        assert _slots(s) == (19, 0)
+
+        kept = [i for i in order if i not in doomed and i != "tx-1"]
+        records = _check_consistent(s)
+        assert [tx["id"] for tx in records] == kept and s.get("tx-39")["amount"] == "7"
+        assert {i: s.seq_of(i) for i in kept} == {i: seqs[i] for i in kept}
+        assert [tx["id"] for _, tx in s.page(seqs["tx-17"], 3)] == ["tx-19", "tx-21", "tx-23"]
+        assert s.delete("tx-0") is None and s.delete("tx-1") is None
+
+        # Positions after compaction are live: writes land on the right rows.
+        s.replace(_tx(21, owner="carol", timestamp=str(BASE_MS)))
+        s.delete("tx-3")
+        s.append(_tx(40))
+        records = _check_consistent(s)
+        assert [tx["id"] for tx in records] == [i for i in kept if i != "tx-3"] + ["tx-40"]
+        assert s.get("tx-21")["owner"] == "carol" and s.seq_of("tx-40") == 40
+        assert _slots(s) == (20, 1)
+
+def test_compact_store_returns_what_dict_store_returns(monkeypatch):
+    data_dsa.load_from_xml_streaming(SAMPLE_XML)
+    sample = list(data_dsa.store)[:200]
+    # Stored records always have the normalized shape: core fields, details, then _raw.
+    odd = [
+        _tx(900, amount="12.50", timestamp="2024-05-10T16:30:51"),  # not integer text: kept in the side dict
+        _tx(901, amount="007", timestamp="-5"),
+        {**_tx(902, amount=""), "note": "héllo ✓", "fee": 25, "_raw": {"body": "x" * 40, "parts": 2}},
+        {**_tx(903), "_raw": {}},
+    ]
+    for tx in odd[2:]:
+        tx["_raw"] = tx.pop("_raw")
+    try:
+        stores = [DictStore(), CompactStore()]
+        for s in stores:
+            for tx in sample + odd:
+                s.append(tx)
+            s.replace({**sample[5], "amount": "1,500", "owner": "carol"})
+            s.delete(sample[7]["id"])
+            s.delete("tx-901")
+        plain, compact = ([json.dumps(tx) for tx in s] for s in stores)
+        assert compact == plain and len(plain) == len(sample) + len(odd) - 2
+        for tx in sample[:20] + odd:
+            assert stores[1].get(tx["id"]) == stores[0].get(tx["id"])
+        assert stores[1].fragments() == stores[0].fragments()
+        assert stores[1].page(10, 5) == stores[0].page(10, 5)
+        assert [json.dumps(tx) for tx in stores[1].copy()] == compact
+        assert list(stores[1].indexes["owner"].ids("carol")) == [sample[5]["id"]]
+
+        expected = [json.dumps(tx) for tx in data_dsa.store]
+        data_dsa.use_store_backend("compact")
+        assert [json.dumps(tx) for tx in data_dsa.store] == expected
+        assert data_dsa.query_transactions(type_="payment") == [json.loads(t) for t in expected
+                                                                 if json.loads(t)["type"] == "payment"]
+    finally:
+        data_dsa.use_store_backend("dict")
+        data_dsa.store.clear()
+
+def test_owner_and_type_filters_match_a_linear_scan(monkeypatch):
+    for backend in ("dict", "compact"):
+        data_dsa.load_from_xml_streaming(SAMPLE_XML)
+        data_dsa.use_store_backend(backend)
+        try:
+            records = list(data_dsa.store)
+            for i, tx in enumerate(records[:60]):
+                if i % 3 == 0:
+                    data_dsa.remove_transaction(tx["id"])
+                else:
+                    data_dsa.replace_transaction({**tx, "owner": ("alice", "bob")[i % 2],
+                                                  "type": "deposit" if i % 2 else tx["type"]})
+            data_dsa.add_transaction(_tx(1000, owner="alice"))
+            owners = {tx["owner"] for tx in data_dsa.store} | {"nobody"}
+            types = {tx["type"] for tx in data_dsa.store} | {"nothing"}
+            for owner in owners | {None}:
+                for type_ in types | {None}:
+                    expected = data_dsa.scan_transactions(owner, type_)
+                    assert data_dsa.query_transactions(owner, type_) == expected, (owner, type_)
+                    assert data_dsa.transaction_fragments(owner, type_) == \
+                        [data_dsa.encode_record(tx) for tx in expected]
+                    page, _ = data_dsa.page_transactions(owner, type_, limit=10_000)
+                    assert page == expected
+            assert len(data_dsa.scan_transactions("bob", "deposit")) > 10  # moved into the bucket by replace
+        finally:
+            data_dsa.use_store_backend("dict")
+            data_dsa.store.clear()
+
+def test_cached_fragments_encode_like_json_dumps():
+    def dumped(records):
+        return json.dumps(records, ensure_ascii=False).encode("utf-8")
+
+    for backend in (DictStore, CompactStore):
+        s = backend()
+        assert join_fragments(s.fragments()) == dumped([]) == b"[]"
+        for i in range(6):
+            s.append(_tx(i))
+        s.append({**_tx(6), "_raw": {"body": "Murakoze — paid 1,000 RWF ✓ \"quoted\"\n"}})
+        assert join_fragments(s.fragments()) == dumped(list(s))
+        assert join_fragments(s.fragments()) == dumped(list(s))  # from the cache, brackets not kept
+        assert not s.fragments()[0].startswith(b"[") and not s.fragments()[-1].endswith(b"]")
+
+        s.replace({**_tx(2), "amount": "5", "owner": "Émile"})
+        s.delete("tx-4")
+        records = list(s)
+        assert join_fragments(s.fragments()) == dumped(records)
+        assert s.fragments()[2] == data_dsa.encode_record(s.get("tx-2")) and b"\\u" not in s.fragments()[2]
+        ids = ["tx-6", "tx-0"]
+        assert join_fragments(s.fragments(ids)) == dumped([s.get(i) for i in ids])
+        assert join_fragments(s.fragments(["tx-1"])) == dumped([s.get("tx-1")])
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+import data_dsa
+from data_dsa import RWLock
+
+XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modified_sms_v2 (1).xml")
+
+def test_readers_share_the_lock():
+    lock = RWLock()
+    inside = threading.Barrier(3, timeout=2)
+
+    def reader():
+        with lock.read():
+            inside.wait()  # only passes if all three readers hold the lock at once
+
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not inside.broken
+
+def test_writer_excludes_readers_and_is_preferred():
+    lock = RWLock()
+    order = []
+    lock.acquire_read()
+    writer = threading.Thread(target=lambda: (lock.acquire(), order.append("write"), lock.release()))
+    writer.start()
+    time.sleep(0.05)  # writer is now waiting on the first reader
+    late_reader = threading.Thread(target=lambda: (lock.acquire_read(), order.append("read"), lock.release_read()))
+    late_reader.start()
+    time.sleep(0.05)
+    assert order == []
+    lock.release_read()
+    writer.join(2)
+    late_reader.join(2)
+    assert order == ["write", "read"]
+
+def test_reads_see_whole_records_while_writing():
+    data_dsa.store.clear()
+    for i in range(200):
+        data_dsa.store.append({"id": str(i), "type": "t", "amount": "0", "owner": "o", "timestamp": "", "_raw": {}})
+    stop = threading.Event()
+    bad = []
+
+    def writer():
+        n = 0
+        while not stop.is_set():
+            n += 1
+            tx_id = str(n % 200)
+            data_dsa.replace_transaction({"id": tx_id, "type": "t", "amount": str(n), "owner": "o",
+                                          "timestamp": "", "_raw": {"amount": str(n)}})
+
+    def reader():
+        while not stop.is_set():
+            for tx in data_dsa.all_transactions():
+                if tx["amount"] != tx["_raw"].get("amount", "0"):
+                    bad.append(tx)
+            if len(data_dsa.page_transactions(limit=50)[0]) != 50:
+                bad.append("short page")
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    time.sleep(0.5)
+    stop.set()
+    for t in threads:
+        t.join()
+    assert not bad
+    assert data_dsa.transaction_count() == 200
+    data_dsa.store.clear()
+
+def test_reload_swaps_in_new_generation_and_keeps_writes_made_during_it(monkeypatch):
+    data_dsa.store.clear()
+    data_dsa.store.append({"id": "stale", "type": "t", "amount": "0", "owner": "o", "timestamp": "", "_raw": {}})
+    build = data_dsa._build_generation
+
+    def build_with_concurrent_writes(path, backend, dedup=None):
+        data_dsa.add_transaction({"id": "during", "type": "t", "amount": "1", "owner": "o", "timestamp": "", "_raw": {}})
+        data_dsa.remove_transaction("stale")
+        assert data_dsa.transaction_count() == 1  # the live generation is untouched while building
+        return build(path, backend, dedup)
+
+    monkeypatch.setattr(data_dsa, "_build_generation", build_with_concurrent_writes)
+    stats = data_dsa.reload_store(XML)
+    assert stats["journaled"] == 2
+    assert data_dsa.transaction_count() == stats["records"] + 1
+    assert data_dsa.dict_lookup_by_id("during")["amount"] == "1"
+    assert data_dsa.dict_lookup_by_id("stale") is None
+    assert data_dsa.dict_lookup_by_id("1")["type"] == "received"
+    data_dsa.store.clear()
+
+def test_records_added_during_a_reload_keep_their_ids(tmp_path, monkeypatch):
+    raws = [dict(elem.attrib) for elem in ET.parse(XML).getroot()][:20]
+    small, grown = str(tmp_path / "small.xml"), str(tmp_path / "grown.xml")
+    for path, rows in ((small, raws[:10]), (grown, raws)):
+        root = ET.Element("smses", {"count": str(len(rows))})
+        for raw in rows:
+            ET.SubElement(root, "sms", raw)
+        ET.ElementTree(root).write(path, encoding="utf-8")
+    data_dsa.load_from_xml(small)
+    build = data_dsa._build_generation
+    posted = []
+
+    def build_with_a_post(path, backend, dedup=None):
+        posted.append(data_dsa.normalize_transaction({"type": "payment", "amount": "5", "owner": "carol"}))
+        assert data_dsa.add_transaction(posted[0])
+        return build(path, backend, dedup)  # the new generation numbers its 11th row "11" too
+
+    monkeypatch.setattr(data_dsa, "_build_generation", build_with_a_post)
+    try:
+        stats = data_dsa.reload_store(grown)
+        assert posted[0]["id"] == "11" and stats["records"] == 20
+        assert data_dsa.dict_lookup_by_id("11") == posted[0]
+        bodies = [tx["_raw"].get("body") for tx in data_dsa.store]
+        assert data_dsa.transaction_count() == 21 and all(raw["body"] in bodies for raw in raws)
+        assert data_dsa.dict_lookup_by_id("21")["_raw"]["body"] == raws[10]["body"]
+        assert data_dsa.next_id == 22
+    finally:
+        data_dsa.store.clear()
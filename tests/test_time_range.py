@@ -0,0 +1,102 @@
+import base64
+import http.client
+import json
+import threading
+from datetime import datetime, timezone
+from http.server import HTTPServer
+
+import pytest
+
+import api_server
+import data_dsa
+from api_server import AuthCache, LoginThrottle
+from data_dsa import DAY_MS, DictStore, TimeIndex, parse_epoch_ms
+
+MIDNIGHT = int(datetime(2024, 5, 10, tzinfo=timezone.utc).timestamp() * 1000)
+
+def _tx(i, ms, owner="alice"):
+    return {"id": f"tx-{i}", "type": "payment", "amount": "100", "sender": "M-Money", "receiver": "",
+            "timestamp": str(ms), "owner": owner}
+
+def test_parse_epoch_ms_and_inclusive_bounds():
+    assert parse_epoch_ms("1715299200000") == parse_epoch_ms("2024-05-10") == MIDNIGHT
+    assert parse_epoch_ms("2024-05-10", end_of_day=True) == MIDNIGHT + DAY_MS - 1
+    assert parse_epoch_ms("2024-05-10T01:00:00Z", end_of_day=True) == MIDNIGHT + 3_600_000  # not a bare date
+    assert parse_epoch_ms("2024-05-10T03:00:00+02:00") == MIDNIGHT + 3_600_000
+    assert parse_epoch_ms("") is None and parse_epoch_ms("yesterday") is None and parse_epoch_ms("2024-13-01") is None
+
+    idx = TimeIndex()
+    stamps = [MIDNIGHT - 1, MIDNIGHT, MIDNIGHT + 5, MIDNIGHT + DAY_MS - 1, MIDNIGHT + DAY_MS]
+    for i, ms in reversed(list(enumerate(stamps))):
+        idx.add(_tx(i, ms))
+    idx.add(_tx(9, MIDNIGHT))  # same instant: ordered by id
+    assert list(idx.ids()) == ["tx-0", "tx-1", "tx-9", "tx-2", "tx-3", "tx-4"]
+    assert list(idx.ids(MIDNIGHT, MIDNIGHT + DAY_MS - 1)) == ["tx-1", "tx-9", "tx-2", "tx-3"]
+    assert list(idx.ids(MIDNIGHT + 5, MIDNIGHT + 5)) == ["tx-2"]
+    assert list(idx.ids(end=MIDNIGHT - 1)) == ["tx-0"] and list(idx.ids(MIDNIGHT + DAY_MS)) == ["tx-4"]
+    assert list(idx.ids(MIDNIGHT + 6, MIDNIGHT + 7)) == []
+    idx.remove(_tx(0, MIDNIGHT - 1))
+    idx.remove(_tx(4, MIDNIGHT + DAY_MS))
+    assert idx.day_keys == [MIDNIGHT // DAY_MS]  # emptied days are dropped
+
+def test_time_pages_resume_across_day_boundaries(monkeypatch):
+    monkeypatch.setattr(data_dsa, "store", DictStore())
+    # Three records per day around midnight, added out of time order.
+    stamps = [MIDNIGHT + d * DAY_MS + off for d in (2, 0, 1) for off in (-1, 0, 1)]
+    for i, ms in enumerate(stamps):
+        data_dsa.add_transaction(_tx(i, ms, owner=("alice", "bob")[i % 2]))
+    start, end = parse_epoch_ms("2024-05-10"), parse_epoch_ms("2024-05-11", end_of_day=True)
+    expected = [tx["id"] for tx in sorted(data_dsa.store, key=lambda tx: int(tx["timestamp"]))
+                if start <= int(tx["timestamp"]) <= end]
+    assert len(expected) == 6
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = data_dsa.page_transactions(start=start, end=end, limit=2, cursor=cursor)
+        seen += [tx["id"] for tx in page]
+        if cursor is None:
+            break
+        assert data_dsa.decode_cursor(cursor)[0] == "t"
+        # Inserted at MIDNIGHT + 2: ahead of the cursor after the first page, behind it after that.
+        data_dsa.add_transaction(_tx(100 + len(seen), MIDNIGHT + 2))
+    assert seen[:2] == expected[:2] and [i for i in seen if i not in expected] == ["tx-102"]
+
+    page, _ = data_dsa.page_transactions(owner="bob", start=start, end=end, limit=100)
+    assert [tx["id"] for tx in page] == [i for i in data_dsa.store.indexes["time"].ids(start, end)
+                                         if data_dsa.store.get(i)["owner"] == "bob"]
+    with pytest.raises(ValueError):  # a time cursor cannot resume an insertion-order query
+        data_dsa.page_transactions(limit=2, cursor=data_dsa.encode_cursor(["t", MIDNIGHT, "tx-1"]))
+
+def test_malformed_range_is_a_400(monkeypatch, tmp_path):
+    monkeypatch.setattr(api_server, "PBKDF2_ITERATIONS", 1000)
+    monkeypatch.setattr(api_server, "USERS", {})
+    monkeypatch.setattr(api_server, "USERS_FILE", str(tmp_path / "users.json"))
+    monkeypatch.setattr(api_server, "auth_cache", AuthCache())
+    monkeypatch.setattr(api_server, "login_throttle", LoginThrottle())
+    monkeypatch.setattr(data_dsa, "store", DictStore())
+    api_server.set_user("root", "s3cret", "admin")
+    for i in range(3):
+        data_dsa.add_transaction(_tx(i, MIDNIGHT + i * DAY_MS))
+    server = HTTPServer(("127.0.0.1", 0), api_server.Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    auth = "Basic " + base64.b64encode(b"root:s3cret").decode("ascii")
+
+    def get(path):
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+        conn.request("GET", path, headers={"Authorization": auth})
+        resp = conn.getresponse()
+        body = json.loads(resp.read())
+        conn.close()
+        return resp.status, body
+
+    try:
+        for query in ("from=yesterday", "to=2024-05-32", "from=2024-05-10&to=soon", "from=10-05-2024&to=2024-05-11"):
+            status, body = get("/transactions?" + query)
+            assert status == 400 and "from/to" in body["error"], query
+        status, body = get("/transactions?from=2024-05-11&to=2024-05-11")
+        assert status == 200 and [tx["id"] for tx in body] == ["tx-1"]
+        status, body = get(f"/transactions?from={MIDNIGHT}&to=2024-05-11")
+        assert status == 200 and [tx["id"] for tx in body] == ["tx-0", "tx-1"]
+    finally:
+        server.shutdown()
+        server.server_close()